@@ -1,7 +1,11 @@
 """Main module."""
 
+import asyncio
+import concurrent.futures
+import itertools
 import os
 import time
+from collections.abc import Iterable, Iterator, Mapping
 from urllib.parse import urljoin
 
 import httpx
@@ -10,9 +14,119 @@ from httpx import HTTPStatusError, RequestError
 from lynxius.datasets.types import Dataset, DatasetDetails, DatasetEntry
 from lynxius.evals.evaluator import Evaluator
 
+LYNXIUS_API_VERSION = "v1"
+DEFAULT_BASE_URL = "https://platform.lynxius.ai"
+EVAL_RUN_TIMEOUT = 30
+DEFAULT_WINDOW_SIZE = 1000
+DEFAULT_MAX_UPLOAD_WORKERS = 4
+UPLOAD_RETRIES = 5
+UPLOAD_BACKOFF_FACTOR = 0.5
+
+
+def _resolve_api_key(api_key: str | None) -> str:
+    if api_key is None:
+        api_key = os.environ.get("LYNXIUS_API_KEY")
+    if api_key is None:
+        raise ValueError(
+            "The api_key client option must be set either by passing api_key to \
+                the client or by setting the LYNXIUS_API_KEY environment variable"
+        )
+    return api_key
+
+
+def _resolve_base_url(base_url: str | httpx.URL | None) -> str:
+    if base_url is None:
+        base_url = os.environ.get("LYNXIUS_BASE_URL")
+    if base_url is None:
+        base_url = DEFAULT_BASE_URL
+
+    base_url = urljoin(str(base_url), "api/")
+    base_url = urljoin(base_url, LYNXIUS_API_VERSION)
+    # Now, base_url looks similar to this: https://platform.lynxius.ai/api/v1"
+    return base_url
+
+
+# Chunked uploads depend on the following eval run upload endpoints:
+# - `POST {eval url}uploads/` with the eval run details (the request body without
+#   `data`) opens an upload and responds 201 with `{"upload_id": ...}`.
+# - `PUT /evals/uploads/{upload_id}/pages/{index}/` with `{"data": [...]}` stores a
+#   page. Storing the same page twice must be idempotent.
+# - `POST /evals/uploads/{upload_id}/finalize/` with `{"num_pages": ...}` creates the
+#   eval run from all pages and responds 201 with `{"uuid": ...}`.
+# - `DELETE /evals/uploads/{upload_id}/` discards an upload that failed.
+UPLOADS_URL = "/evals/uploads/"
+
+
+def _iter_pages(
+    bodies: Iterable[dict], page_size: int
+) -> tuple[dict | None, Iterator[list]]:
+    """Splits request bodies into the header of the first body (everything except
+    `data`) and an iterator over pages of `data` from all bodies."""
+    bodies = iter(bodies)
+    first = next(bodies, None)
+    if first is None:
+        return None, iter([])
+    header = {k: v for k, v in first.items() if k != "data"}
+
+    def pages():
+        for body in itertools.chain([first], bodies):
+            data = body["data"]
+            for start in range(0, len(data), page_size):
+                yield data[start : start + page_size]
+
+    return header, pages()
+
+
+async def _aiter(iterable: Iterable):
+    for item in iterable:
+        yield item
+
+
+async def _cancel_all(tasks: list[asyncio.Task]):
+    """Cancels the tasks and waits until they stopped, so that no page arrives
+    after the upload was aborted."""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, HTTPStatusError):
+        status_code = exc.response.status_code
+        return status_code >= 500 or status_code == httpx.codes.TOO_MANY_REQUESTS
+    return isinstance(exc, RequestError)
+
+
+def _parse_dataset_details(body: dict) -> DatasetDetails:
+    dataset_details = DatasetDetails()
+    dataset_details.dataset = Dataset(
+        body["dataset"]["uuid"],
+        body["dataset"]["date_created"],
+        body["dataset"]["organization_uuid"],
+        body["dataset"]["organization_name"],
+    )
+
+    dataset_details.entries = []
+    for entry in body["entries"]:
+        dataset_entry = DatasetEntry(
+            entry["uuid"],
+            entry["dataset_uuid"],
+            entry["query"],
+            entry["output"],
+            entry["reference"],
+            entry["score"],
+            entry["comments"],
+            entry["date_created"],
+            entry["date_modified"],
+        )
+
+        dataset_details.entries.append(dataset_entry)
+
+    return dataset_details
+
 
 class LynxiusClient:
-    LYNXIUS_API_VERSION = "v1"
+    LYNXIUS_API_VERSION = LYNXIUS_API_VERSION
 
     _client: httpx.Client
 
@@ -24,40 +138,36 @@ class LynxiusClient:
         api_key: str | None = None,
         base_url: str | httpx.URL | None = None,
         run_local: bool | None = False,
+        page_size: int | None = None,
+        max_upload_workers: int = DEFAULT_MAX_UPLOAD_WORKERS,
+        transport: httpx.BaseTransport | None = None,
     ) -> None:
         """Construct a new synchronous lynxius client instance.
 
         This automatically infers the following arguments from their corresponding
         environment variables if they are not provided:
         - `api_key` from `LYNXIUS_API_KEY`
-        """
-        if api_key is None:
-            api_key = os.environ.get("LYNXIUS_API_KEY")
-        if api_key is None:
-            raise ValueError(
-                "The api_key client option must be set either by passing api_key to \
-                    the client or by setting the LYNXIUS_API_KEY environment variable"
-            )
-        self.api_key = api_key
-
-        if base_url is None:
-            base_url = os.environ.get("LYNXIUS_BASE_URL")
-        if base_url is None:
-            base_url = "https://platform.lynxius.ai"
 
-        base_url = urljoin(base_url, "api/")
-        base_url = urljoin(base_url, self.LYNXIUS_API_VERSION)
-        # Now, base_url looks similar to this: https://platform.lynxius.ai/api/v1"
+        If `page_size` is set, eval runs with more than `page_size` results are
+        uploaded in pages of `page_size` results, `max_upload_workers` pages at a
+        time. This requires a platform that supports chunked uploads. Otherwise
+        every eval run is sent in a single request.
+        """
+        self.api_key = _resolve_api_key(api_key)
+        base_url = _resolve_base_url(base_url)
 
         headers = {"Authorization": f"Bearer {self.api_key}"}
 
         # Determines if evals are run locally or remotely
         self.run_local = run_local
+        self.page_size = page_size
+        self.max_upload_workers = max_upload_workers
 
         self._client = httpx.Client(
             base_url=base_url,
             headers=headers,
             follow_redirects=True,
+            transport=transport,
         )
 
     def evaluate(self, eval: Evaluator) -> str | None:
@@ -69,23 +179,134 @@ class LynxiusClient:
         if self.run_local:
             eval.evaluate_local()
 
-        response = self._client.post(
+        url = eval.get_url(run_local=self.run_local)
+        body = eval.get_request_body(run_local=self.run_local)
+        if self.page_size is not None and len(body["data"]) > self.page_size:
+            return self._upload_chunked(url, [body], self.page_size)
+
+        return self._create_eval_run(url, body)
+
+    def evaluate_stream(
+        self,
+        eval: Evaluator,
+        traces: Iterable[Mapping],
+        window_size: int = DEFAULT_WINDOW_SIZE,
+    ) -> str | None:
+        """
+        Evaluates traces from any iterable in windows of `window_size` traces and
+        uploads the results of every window as soon as it is done. All windows end
+        up in a single eval run. Traces already added to `eval` are not uploaded and
+        are kept in `eval`. Memory use is bounded by the window size, not by the
+        number of traces. Returns an eval run ID.
+
+        Windows are sent as a chunked upload in pages of `page_size` results, or
+        one page per window if `page_size` is `None`, so the platform has to
+        support chunked uploads.
+        """
+        return self._upload_chunked(
             eval.get_url(run_local=self.run_local),
-            json=eval.get_request_body(run_local=self.run_local),
+            eval.iter_request_bodies(traces, window_size, self.run_local),
+            self.page_size or window_size,
         )
 
+    def _create_eval_run(self, url: str, body: dict) -> str | None:
+        response = self._client.post(url, json=body)
+
         if response.status_code == httpx.codes.CREATED:
             return response.json()["uuid"]
         else:
             print("Error:", response.status_code, response.text)
             return None
 
+    def _upload_chunked(
+        self, url: str, bodies: Iterable[dict], page_size: int
+    ) -> str | None:
+        """
+        Uploads an eval run in pages: opens an upload with the eval run details,
+        appends pages of results concurrently and finalizes the upload once every
+        page was acknowledged. Pages are idempotent, so a failed page is retried on
+        its own. If a page still fails, or the upload can't be finalized, the
+        upload is aborted. See `UPLOADS_URL` for the endpoints this depends on.
+        """
+        header, pages = _iter_pages(bodies, page_size)
+        if header is None:
+            return None
+
+        response = self._client.post(f"{url}uploads/", json=header)
+        if response.status_code != httpx.codes.CREATED:
+            print("Error:", response.status_code, response.text)
+            return None
+        upload_id = response.json()["upload_id"]
+
+        num_pages = 0
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_upload_workers
+        ) as executor:
+            in_flight = set()
+            try:
+                for index, page in enumerate(pages):
+                    # Don't let pages pile up in memory when uploads are slow
+                    if len(in_flight) >= 2 * self.max_upload_workers:
+                        done, in_flight = concurrent.futures.wait(
+                            in_flight, return_when=concurrent.futures.FIRST_COMPLETED
+                        )
+                        for future in done:
+                            future.result()
+
+                    in_flight.add(
+                        executor.submit(self._upload_page, upload_id, index, page)
+                    )
+                    num_pages += 1
+
+                for future in concurrent.futures.as_completed(in_flight):
+                    future.result()
+            except (HTTPStatusError, RequestError) as exc:
+                print(f"Upload {upload_id} failed: {exc}")
+                # No page may arrive after the upload was aborted
+                executor.shutdown(cancel_futures=True)
+                self._abort_upload(upload_id)
+                return None
+            except BaseException:
+                # E.g. the local evaluation of a window failed
+                executor.shutdown(cancel_futures=True)
+                self._abort_upload(upload_id)
+                raise
+
+        response = self._client.post(
+            f"{UPLOADS_URL}{upload_id}/finalize/", json={"num_pages": num_pages}
+        )
+        if response.status_code == httpx.codes.CREATED:
+            return response.json()["uuid"]
+        else:
+            print("Error:", response.status_code, response.text)
+            self._abort_upload(upload_id)
+            return None
+
+    def _abort_upload(self, upload_id: str):
+        try:
+            self._client.delete(f"{UPLOADS_URL}{upload_id}/").raise_for_status()
+        except (HTTPStatusError, RequestError) as exc:
+            print(f"Aborting upload {upload_id} failed: {exc}")
+
+    def _upload_page(self, upload_id: str, index: int, page: list):
+        for attempt in range(UPLOAD_RETRIES):
+            try:
+                self._client.put(
+                    f"{UPLOADS_URL}{upload_id}/pages/{index}/", json={"data": page}
+                ).raise_for_status()
+                return
+            except (HTTPStatusError, RequestError) as exc:
+                if attempt == UPLOAD_RETRIES - 1 or not _is_retryable(exc):
+                    raise
+                print(f"Page {index} attempt {attempt + 1} failed: {exc}. Retrying...")
+                time.sleep(UPLOAD_BACKOFF_FACTOR * (2**attempt))
+
     def get_eval_run(self, eval_run_uuid: str) -> Evaluator | None:
         """
         Returns the details of an Eval Run.
         Retries for up to 30 seconds before failing.
         """
-        timeout = 30
+        timeout = EVAL_RUN_TIMEOUT
         backoff_factor = 1
         start_time = time.time()
 
@@ -117,30 +338,263 @@ class LynxiusClient:
         response = self._client.get(
             f"/datasets/{dataset_id}/entries/"
         ).raise_for_status()
-        body = response.json()
-
-        dataset_details = DatasetDetails()
-        dataset_details.dataset = Dataset(
-            body["dataset"]["uuid"],
-            body["dataset"]["date_created"],
-            body["dataset"]["organization_uuid"],
-            body["dataset"]["organization_name"],
+        return _parse_dataset_details(response.json())
+
+
+class AsyncLynxiusClient:
+    LYNXIUS_API_VERSION = LYNXIUS_API_VERSION
+
+    _client: httpx.AsyncClient
+
+    # client options
+    api_key: str
+
+    def __init__(
+        self,
+        api_key: str | None = None,
+        base_url: str | httpx.URL | None = None,
+        run_local: bool | None = False,
+        limits: httpx.Limits | None = None,
+        http2: bool = False,
+        transport: httpx.AsyncBaseTransport | None = None,
+        page_size: int | None = None,
+        max_upload_workers: int = DEFAULT_MAX_UPLOAD_WORKERS,
+    ) -> None:
+        """Construct a new asynchronous lynxius client instance.
+
+        It exposes the same methods as `LynxiusClient` as coroutines. All requests
+        share one pool of keep-alive connections, so a single instance should be
+        reused across calls, ideally as an async context manager:
+
+            async with AsyncLynxiusClient() as client:
+                eval_run_uuid = await client.evaluate(eval)
+
+        Args:
+            api_key (str | None): Inferred from `LYNXIUS_API_KEY` if not provided.
+            base_url (str | httpx.URL | None): Inferred from `LYNXIUS_BASE_URL` if
+                not provided.
+            run_local (bool | None): Determines if evals are run locally or remotely.
+            limits (httpx.Limits | None): Connection pool limits and keep-alive
+                expiry. Defaults to the httpx defaults.
+            http2 (bool): Enables HTTP/2. Requires the `h2` package, installable with
+                `pip install lynxius[http2]`.
+            transport (httpx.AsyncBaseTransport | None): A custom transport, e.g.
+                `httpx.MockTransport` in tests.
+            page_size (int | None): Eval runs with more results are uploaded in
+                pages of `page_size` results. Requires a platform that supports
+                chunked uploads. Every eval run is sent in a single request if
+                `None`.
+            max_upload_workers (int): How many pages are uploaded at a time.
+        """
+        self.api_key = _resolve_api_key(api_key)
+        base_url = _resolve_base_url(base_url)
+
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+
+        # Determines if evals are run locally or remotely
+        self.run_local = run_local
+        self.page_size = page_size
+        self.max_upload_workers = max_upload_workers
+
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            follow_redirects=True,
+            limits=limits if limits is not None else httpx.Limits(),
+            http2=http2,
+            transport=transport,
         )
 
-        dataset_details.entries = []
-        for entry in body["entries"]:
-            dataset_entry = DatasetEntry(
-                entry["uuid"],
-                entry["dataset_uuid"],
-                entry["query"],
-                entry["output"],
-                entry["reference"],
-                entry["score"],
-                entry["comments"],
-                entry["date_created"],
-                entry["date_modified"],
-            )
-
-            dataset_details.entries.append(dataset_entry)
-
-        return dataset_details
+    async def __aenter__(self) -> "AsyncLynxiusClient":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Closes all pooled connections."""
+        await self._client.aclose()
+
+    async def evaluate(self, eval: Evaluator) -> str | None:
+        """
+        Initiates a batched evaluation job. Returns an eval run ID.
+        """
+
+        # Local evaluation is blocking, keep it off the event loop
+        if self.run_local:
+            await asyncio.to_thread(eval.evaluate_local)
+
+        url = eval.get_url(run_local=self.run_local)
+        body = eval.get_request_body(run_local=self.run_local)
+        if self.page_size is not None and len(body["data"]) > self.page_size:
+            return await self._upload_chunked(url, [body], self.page_size)
+
+        return await self._create_eval_run(url, body)
+
+    async def evaluate_stream(
+        self,
+        eval: Evaluator,
+        traces: Iterable[Mapping],
+        window_size: int = DEFAULT_WINDOW_SIZE,
+    ) -> str | None:
+        """
+        Evaluates traces from any iterable in windows of `window_size` traces and
+        uploads the results of every window as soon as it is done. All windows end
+        up in a single eval run. Traces already added to `eval` are not uploaded and
+        are kept in `eval`. Memory use is bounded by the window size, not by the
+        number of traces. Returns an eval run ID.
+
+        Windows are sent as a chunked upload in pages of `page_size` results, or
+        one page per window if `page_size` is `None`, so the platform has to
+        support chunked uploads.
+        """
+        bodies = eval.iter_request_bodies(traces, window_size, self.run_local)
+
+        async def iter_bodies():
+            # Local evaluation is blocking, keep it off the event loop
+            while (body := await asyncio.to_thread(next, bodies, None)) is not None:
+                yield body
+
+        return await self._upload_chunked(
+            eval.get_url(run_local=self.run_local),
+            iter_bodies(),
+            self.page_size or window_size,
+        )
+
+    async def _create_eval_run(self, url: str, body: dict) -> str | None:
+        response = await self._client.post(url, json=body)
+
+        if response.status_code == httpx.codes.CREATED:
+            return response.json()["uuid"]
+        else:
+            print("Error:", response.status_code, response.text)
+            return None
+
+    async def _upload_chunked(self, url: str, bodies, page_size: int) -> str | None:
+        """
+        Uploads an eval run in pages: opens an upload with the eval run details,
+        appends pages of results concurrently and finalizes the upload once every
+        page was acknowledged. Pages are idempotent, so a failed page is retried on
+        its own. If a page still fails, or the upload can't be finalized, the
+        upload is aborted. See `UPLOADS_URL` for the endpoints this depends on.
+
+        `bodies` is either an iterable or an async iterable of request bodies.
+        """
+        if not hasattr(bodies, "__aiter__"):
+            bodies = _aiter(bodies)
+
+        first = await anext(bodies, None)
+        if first is None:
+            return None
+        header = {k: v for k, v in first.items() if k != "data"}
+
+        response = await self._client.post(f"{url}uploads/", json=header)
+        if response.status_code != httpx.codes.CREATED:
+            print("Error:", response.status_code, response.text)
+            return None
+        upload_id = response.json()["upload_id"]
+
+        # Don't let pages pile up in memory when uploads are slow
+        semaphore = asyncio.Semaphore(2 * self.max_upload_workers)
+        workers = asyncio.Semaphore(self.max_upload_workers)
+
+        async def upload_page(index: int, page: list):
+            try:
+                async with workers:
+                    await self._upload_page(upload_id, index, page)
+            finally:
+                semaphore.release()
+
+        num_pages = 0
+        tasks = []
+        try:
+            body = first
+            while body is not None:
+                _, pages = _iter_pages([body], page_size)
+                for page in pages:
+                    await semaphore.acquire()
+                    tasks.append(asyncio.create_task(upload_page(num_pages, page)))
+                    num_pages += 1
+                body = await anext(bodies, None)
+
+            await asyncio.gather(*tasks)
+        except (HTTPStatusError, RequestError) as exc:
+            print(f"Upload {upload_id} failed: {exc}")
+            await _cancel_all(tasks)
+            await self._abort_upload(upload_id)
+            return None
+        except BaseException:
+            # E.g. the local evaluation of a window failed
+            await _cancel_all(tasks)
+            await self._abort_upload(upload_id)
+            raise
+
+        response = await self._client.post(
+            f"{UPLOADS_URL}{upload_id}/finalize/", json={"num_pages": num_pages}
+        )
+        if response.status_code == httpx.codes.CREATED:
+            return response.json()["uuid"]
+        else:
+            print("Error:", response.status_code, response.text)
+            await self._abort_upload(upload_id)
+            return None
+
+    async def _abort_upload(self, upload_id: str):
+        try:
+            response = await self._client.delete(f"{UPLOADS_URL}{upload_id}/")
+            response.raise_for_status()
+        except (HTTPStatusError, RequestError) as exc:
+            print(f"Aborting upload {upload_id} failed: {exc}")
+
+    async def _upload_page(self, upload_id: str, index: int, page: list):
+        for attempt in range(UPLOAD_RETRIES):
+            try:
+                response = await self._client.put(
+                    f"{UPLOADS_URL}{upload_id}/pages/{index}/", json={"data": page}
+                )
+                response.raise_for_status()
+                return
+            except (HTTPStatusError, RequestError) as exc:
+                if attempt == UPLOAD_RETRIES - 1 or not _is_retryable(exc):
+                    raise
+                print(f"Page {index} attempt {attempt + 1} failed: {exc}. Retrying...")
+                await asyncio.sleep(UPLOAD_BACKOFF_FACTOR * (2**attempt))
+
+    async def get_eval_run(self, eval_run_uuid: str) -> Evaluator | None:
+        """
+        Returns the details of an Eval Run.
+        Retries for up to 30 seconds before failing.
+        """
+        timeout = EVAL_RUN_TIMEOUT
+        backoff_factor = 1
+        start_time = time.time()
+
+        attempt = 0
+
+        while time.time() - start_time < timeout:
+            attempt += 1
+            try:
+                response = (
+                    await self._client.get(f"/projects/evals/{eval_run_uuid}/")
+                ).raise_for_status()
+                body = response.json()
+                if body.get("status") == "SUCCESS":
+                    return body
+                else:
+                    print(
+                        f"Attempt {attempt} received status {body.get('status')}. Retrying..."
+                    )
+            except (HTTPStatusError, RequestError) as exc:
+                print(f"Attempt {attempt} failed: {exc}. Retrying...")
+
+            sleep_time = backoff_factor * (2 ** (attempt - 1))
+            await asyncio.sleep(sleep_time)
+
+        print(f"All attempts within {timeout} seconds failed.")
+        return None
+
+    async def get_dataset_details(self, dataset_id: str) -> DatasetDetails:
+        response = (
+            await self._client.get(f"/datasets/{dataset_id}/entries/")
+        ).raise_for_status()
+        return _parse_dataset_details(response.json())
@@ -3,6 +3,7 @@ import json
 from lynxius.evals.evaluator import Evaluator
 from lynxius.rag.types import ContextChunk
 from lynxius_evals.evaluators.answer_correctness_eval import AnswerCorrectnessEval
+from lynxius_evals.models.cache import ResponseCache
 from lynxius_evals.models.openai import OpenAIModel
 from lynxius_evals.prompts.answer_correctness_prompt import ANSWER_CORRECTNESS_TEMPLATE
 
@@ -15,6 +16,7 @@ class AnswerCorrectness(Evaluator):
         tags: list[str] = [],
         baseline_project_uuid: str = None,
         baseline_eval_run_label: str = None,
+        response_cache: ResponseCache = None,
     ):
         [Evaluator.validate_tag(value) for value in tags]
 
@@ -23,8 +25,11 @@ class AnswerCorrectness(Evaluator):
         self.tags = tags
         self.baseline_project_uuid = baseline_project_uuid
         self.baseline_eval_run_label = baseline_eval_run_label
+        self.response_cache = response_cache
         self.samples = []
         self.evaluated_results = None
+        self.num_succeeded = 0
+        self.num_failed = 0
 
     def add_trace(
         self, query: str, reference: str, output: str, context: list[ContextChunk] = []
@@ -66,6 +71,8 @@ class AnswerCorrectness(Evaluator):
                         "score": result["score"],
                     }
                     for result in self.evaluated_results
+                    # Traces that failed even after retries are not stored
+                    if "error" not in result
                 ],
             }
         else:
@@ -93,6 +100,7 @@ class AnswerCorrectness(Evaluator):
         eval = AnswerCorrectnessEval(
             model,
             ANSWER_CORRECTNESS_TEMPLATE,
+            response_cache=self.response_cache,
         )
 
         variables = []
@@ -107,3 +115,5 @@ class AnswerCorrectness(Evaluator):
             )
 
         self.evaluated_results = eval.evaluate(variables)
+        self.num_succeeded = eval.num_succeeded
+        self.num_failed = eval.num_failed
@@ -1,6 +1,7 @@
 from lynxius.evals.evaluator import Evaluator
 from lynxius.rag.types import ContextChunk
 from lynxius_evals.evaluators.bert_score_eval import BertScoreEval
+from lynxius_evals.models.cache import CachedEvalModel, EmbeddingCache
 from lynxius_evals.models.openai import OpenAIModel
 
 
@@ -14,6 +15,8 @@ class BertScore(Evaluator):
         tags: list[str] = [],
         baseline_project_uuid: str = None,
         baseline_eval_run_label: str = None,
+        embedding_cache: EmbeddingCache = None,
+        num_processes: int = None,
     ):
         levels = ["word", "sentence"]
         if level not in levels:
@@ -28,6 +31,8 @@ class BertScore(Evaluator):
         self.baseline_eval_run_label = baseline_eval_run_label
         self.level = level
         self.presence_threshold = presence_threshold
+        self.embedding_cache = embedding_cache
+        self.num_processes = num_processes
         self.samples = []
         self.evaluated_results = None
 
@@ -92,7 +97,11 @@ class BertScore(Evaluator):
 
     def evaluate_local(self):
         model = OpenAIModel(embedding_model="text-embedding-3-small")
-        eval = BertScoreEval(model, self.level, self.presence_threshold)
+        if self.embedding_cache is not None:
+            model = CachedEvalModel(model, self.embedding_cache)
+        eval = BertScoreEval(
+            model, self.level, self.presence_threshold, self.num_processes
+        )
 
         variables = []
         for sample in self.samples:
@@ -2,7 +2,11 @@ import json
 
 from lynxius.evals.evaluator import Evaluator
 from lynxius.rag.types import ContextChunk
-from lynxius_evals.evaluators.context_precision_eval import ContextPrecisionEval
+from lynxius_evals.evaluators.context_precision_eval import (
+    DEFAULT_NEAR_DUPLICATE_THRESHOLD,
+    ContextPrecisionEval,
+)
+from lynxius_evals.models.cache import ResponseCache
 from lynxius_evals.models.openai import OpenAIModel
 from lynxius_evals.prompts.context_precision_prompt import CONTEXT_PRECISION_TEMPLATE
 
@@ -15,6 +19,9 @@ class ContextPrecision(Evaluator):
         tags: list[str] = [],
         baseline_project_uuid: str = None,
         baseline_eval_run_label: str = None,
+        response_cache: ResponseCache = None,
+        near_duplicate_threshold: float = DEFAULT_NEAR_DUPLICATE_THRESHOLD,
+        max_context_tokens: int = None,
     ):
         [Evaluator.validate_tag(value) for value in tags]
 
@@ -23,8 +30,13 @@ class ContextPrecision(Evaluator):
         self.tags = tags
         self.baseline_project_uuid = baseline_project_uuid
         self.baseline_eval_run_label = baseline_eval_run_label
+        self.response_cache = response_cache
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.max_context_tokens = max_context_tokens
         self.samples = []
         self.evaluated_results = None
+        self.num_succeeded = 0
+        self.num_failed = 0
 
     def add_trace(self, query: str, reference: str, context: list[ContextChunk] = []):
         if not query or not reference:
@@ -63,6 +75,8 @@ class ContextPrecision(Evaluator):
                         "contexts": result["contexts"],
                     }
                     for result in self.evaluated_results
+                    # Traces that failed even after retries are not stored
+                    if "error" not in result
                 ],
             }
         else:
@@ -89,6 +103,9 @@ class ContextPrecision(Evaluator):
         eval = ContextPrecisionEval(
             model,
             CONTEXT_PRECISION_TEMPLATE,
+            response_cache=self.response_cache,
+            near_duplicate_threshold=self.near_duplicate_threshold,
+            max_context_tokens=self.max_context_tokens,
         )
 
         variables = []
@@ -102,3 +119,5 @@ class ContextPrecision(Evaluator):
             )
 
         self.evaluated_results = eval.evaluate(variables)
+        self.num_succeeded = eval.num_succeeded
+        self.num_failed = eval.num_failed
@@ -3,6 +3,7 @@ from string import Formatter
 from lynxius.evals.evaluator import Evaluator
 from lynxius.rag.types import ContextChunk
 from lynxius_evals.evaluators.llm_based_eval import LLMBasedEval
+from lynxius_evals.models.cache import ResponseCache
 from lynxius_evals.models.openai import OpenAIModel
 from lynxius_evals.prompts.eval_prompt import EvalPromptTemplate
 
@@ -17,6 +18,7 @@ class CustomEval(Evaluator):
         tags: list[str] = [],
         baseline_project_uuid: str = None,
         baseline_eval_run_label: str = None,
+        response_cache: ResponseCache = None,
     ):
         [Evaluator.validate_tag(value) for value in tags]
 
@@ -27,11 +29,14 @@ class CustomEval(Evaluator):
         self.baseline_eval_run_label = baseline_eval_run_label
         self.prompt_template = prompt_template
         self.name_override = name
+        self.response_cache = response_cache
         self.samples = []
         self.variables = [
             fname for _, fname, _, _ in Formatter().parse(prompt_template) if fname
         ]
         self.evaluated_results = None
+        self.num_succeeded = 0
+        self.num_failed = 0
 
     def add_trace(self, values: dict[str, str], context: list[ContextChunk] = []):
 
@@ -78,6 +83,8 @@ class CustomEval(Evaluator):
                         "contexts": [c.__dict__ for c in result["contexts"]],
                     }
                     for i, result in enumerate(self.evaluated_results)
+                    # Traces that failed even after retries are not stored
+                    if "error" not in result
                 ],
             }
         else:
@@ -107,6 +114,7 @@ class CustomEval(Evaluator):
             # manually.
             output_map={"correct": True, "incorrect": False},
             output_default=False,
+            response_cache=self.response_cache,
         )
 
         variables = []
@@ -115,3 +123,5 @@ class CustomEval(Evaluator):
             variables.append(sample[0] | {"contexts": sample[1]})
 
         self.evaluated_results = eval.evaluate(variables)
+        self.num_succeeded = eval.num_succeeded
+        self.num_failed = eval.num_failed
@@ -1,4 +1,6 @@
+import itertools
 from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator, Mapping
 
 
 class Evaluator(ABC):
@@ -18,6 +20,46 @@ class Evaluator(ABC):
     def evaluate_local(self):
         return NotImplemented
 
+    def add_traces(self, traces: Iterable[Mapping]):
+        """
+        Adds every trace of an iterable. Each trace is a mapping of `add_trace`
+        keyword arguments.
+        """
+        for trace in traces:
+            self.add_trace(**trace)
+
+    def iter_request_bodies(
+        self, traces: Iterable[Mapping], window_size: int, run_local: bool = False
+    ) -> Iterator[dict]:
+        """
+        Consumes `traces` (any iterable, e.g. a generator reading from disk) in
+        windows of `window_size` traces. Every window is added, evaluated locally if
+        `run_local` is set, and yielded as a request body. Only one window is held
+        in memory at a time, so peak memory doesn't depend on the dataset size.
+
+        Traces added to the evaluator before are set aside while the windows are
+        evaluated and restored afterwards, together with their results.
+        """
+        if window_size < 1:
+            raise ValueError("window_size must be a positive integer")
+
+        traces = iter(traces)
+        samples, evaluated_results = self.samples, self.evaluated_results
+        try:
+            while window := list(itertools.islice(traces, window_size)):
+                self.samples = []
+                self.evaluated_results = None
+                self.add_traces(window)
+                del window
+
+                if run_local:
+                    self.evaluate_local()
+
+                yield self.get_request_body(run_local=run_local)
+        finally:
+            self.samples = samples
+            self.evaluated_results = evaluated_results
+
     def validate_tag(value):
         if "," in value or " " in value:
             raise ValueError(f"Tags can't contain spaces or commas: {value}")
@@ -11,6 +11,9 @@ class JsonDiff(Evaluator):
         tags: list[str] = [],
         baseline_project_uuid: str = None,
         baseline_eval_run_label: str = None,
+        num_processes: int = None,
+        list_matching: str = "positional",
+        return_paths: bool = False,
     ):
         [Evaluator.validate_tag(value) for value in tags]
 
@@ -19,6 +22,10 @@ class JsonDiff(Evaluator):
         self.tags = tags
         self.baseline_project_uuid = baseline_project_uuid
         self.baseline_eval_run_label = baseline_eval_run_label
+        self.num_processes = num_processes
+        self.list_matching = list_matching
+        self.return_paths = return_paths
+        self.paths = []
         self.samples = []
         self.evaluated_results = None
 
@@ -84,6 +91,14 @@ class JsonDiff(Evaluator):
                     for result in self.evaluated_results
                 ],
             }
+            if self.return_paths:
+                for item, result in zip(body["data"], self.evaluated_results):
+                    item["path_scores"] = {
+                        self.paths[path_id]: score
+                        for path_id, score in zip(
+                            result["path_ids"].tolist(), result["path_scores"].tolist()
+                        )
+                    }
         else:
             body = {
                 "label": self.label,
@@ -105,7 +120,11 @@ class JsonDiff(Evaluator):
         return body
 
     def evaluate_local(self):
-        eval = JsonDiffEval()
+        eval = JsonDiffEval(
+            num_processes=self.num_processes,
+            return_paths=self.return_paths,
+            list_matching=self.list_matching,
+        )
 
         variables = []
         for sample in self.samples:
@@ -119,3 +138,4 @@ class JsonDiff(Evaluator):
             )
 
         self.evaluated_results = eval.evaluate(variables)
+        self.paths = eval.paths
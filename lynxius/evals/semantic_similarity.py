@@ -1,6 +1,9 @@
+from collections.abc import Mapping, Sequence
+
 from lynxius.evals.evaluator import Evaluator
 from lynxius.rag.types import ContextChunk
 from lynxius_evals.evaluators.semantic_similarity_eval import SemanticSimilarityEval
+from lynxius_evals.models.cache import CachedEvalModel, EmbeddingCache
 from lynxius_evals.models.openai import OpenAIModel
 
 
@@ -12,6 +15,8 @@ class SemanticSimilarity(Evaluator):
         tags: list[str] = [],
         baseline_project_uuid: str = None,
         baseline_eval_run_label: str = None,
+        embedding_cache: EmbeddingCache = None,
+        reference_embeddings: Mapping[str, Sequence[float]] = None,
     ):
         [Evaluator.validate_tag(value) for value in tags]
 
@@ -20,6 +25,8 @@ class SemanticSimilarity(Evaluator):
         self.tags = tags
         self.baseline_project_uuid = baseline_project_uuid
         self.baseline_eval_run_label = baseline_eval_run_label
+        self.embedding_cache = embedding_cache
+        self.reference_embeddings = reference_embeddings
         self.samples = []
         self.evaluated_results = None
 
@@ -81,7 +88,9 @@ class SemanticSimilarity(Evaluator):
 
     def evaluate_local(self):
         model = OpenAIModel()
-        eval = SemanticSimilarityEval(model)
+        if self.embedding_cache is not None:
+            model = CachedEvalModel(model, self.embedding_cache)
+        eval = SemanticSimilarityEval(model, self.reference_embeddings)
 
         variables = []
         for sample in self.samples:
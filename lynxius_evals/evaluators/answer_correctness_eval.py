@@ -1,7 +1,6 @@
 from collections.abc import Mapping
 import json
 import logging
-from json.decoder import JSONDecodeError
 from lynxius_evals.evaluators.llm_based_eval import LLMBasedEval
 
 
@@ -22,29 +21,26 @@ class AnswerCorrectnessEval(LLMBasedEval):
 
     And then computes the score like so:
     f1 = |TP| / (|TP| + 0.5 * (|FP| + |FN|))
+
+    Outputs that aren't valid JSON with the three lists raise, so the trace gets a
+    `parse` failure and the output isn't cached.
     """
 
     def parse_output(
         self, output: str, variable_values: Mapping[str, str | list[str]]
     ) -> float:
-        try:
-            result = json.loads(output)
-            tp = result["TP"]
-            fp = result["FP"]
-            fn = result["FN"]
-        except JSONDecodeError as e:
-            logger.exception(e)
-            logger.error(output)
-            return 0.0
+        result = json.loads(output)
+        tp = result["TP"]
+        fp = result["FP"]
+        fn = result["FN"]
 
         if (
             not isinstance(tp, list)
             or not isinstance(fp, list)
             or not isinstance(fn, list)
         ):
-            logger.error("Evaluator didn't return valid JSON lists")
             logger.error(output)
-            return 0.0
+            raise ValueError("Evaluator didn't return valid JSON lists")
 
         # TODO: If we error out in one of the checks above, it's probably our fault.
         # We might want to consider refunding our customers in such case.
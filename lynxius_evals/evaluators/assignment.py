@@ -0,0 +1,105 @@
+import numpy as np
+
+
+def hungarian(scores: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Finds the one-to-one assignment of rows to columns with the maximum total
+    score, using the Hungarian algorithm with shortest augmenting paths.
+
+    Args:
+        scores (np.ndarray): An `(n, m)` score matrix.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The rows and the columns assigned to them,
+            `min(n, m)` pairs sorted by row.
+    """
+    transposed = scores.shape[0] > scores.shape[1]
+    cost = -np.asarray(scores.T if transposed else scores, dtype=np.float64)
+    n, m = cost.shape
+
+    # Potentials, the row assigned to every column and the previous column on the
+    # augmenting path. Index 0 is a virtual column, rows and columns are 1-based.
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    assigned_rows = np.zeros(m + 1, dtype=np.intp)
+    way = np.zeros(m + 1, dtype=np.intp)
+    for row in range(1, n + 1):
+        assigned_rows[0] = row
+        column = 0
+        min_reduced = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[column] = True
+            current_row = assigned_rows[column]
+            free = ~used
+            reduced = cost[current_row - 1] - u[current_row] - v[1:]
+            better = free[1:] & (reduced < min_reduced[1:])
+            min_reduced[1:][better] = reduced[better]
+            way[1:][better] = column
+
+            candidates = np.where(free, min_reduced, np.inf)
+            next_column = int(np.argmin(candidates))
+            delta = candidates[next_column]
+            u[assigned_rows[used]] += delta
+            v[used] -= delta
+            min_reduced[free] -= delta
+
+            column = next_column
+            if assigned_rows[column] == 0:
+                break
+
+        # Flip the augmenting path
+        while column != 0:
+            previous = way[column]
+            assigned_rows[column] = assigned_rows[previous]
+            column = previous
+
+    columns = np.nonzero(assigned_rows[1:])[0]
+    rows = assigned_rows[1:][columns] - 1
+    if transposed:
+        rows, columns = columns, rows
+
+    order = np.argsort(rows)
+    return rows[order], columns[order]
+
+
+def greedy(scores: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Assigns rows to columns greedily by descending score. Faster than
+    `hungarian` for large matrices, but not guaranteed to be optimal. Scores are
+    expected to be non-negative.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The rows and the columns assigned to them,
+            `min(n, m)` pairs sorted by row.
+    """
+    n, m = scores.shape
+    num_pairs = min(n, m)
+    row_used = [False] * n
+    column_used = [False] * m
+    rows = []
+    columns = []
+    # Sparse score matrices are mostly zeros, so only positive scores are sorted
+    flat = scores.ravel()
+    positive = np.flatnonzero(flat > 0)
+    order = positive[np.argsort(-flat[positive], kind="stable")]
+    for row, column in zip(*(a.tolist() for a in np.divmod(order, m))):
+        if row_used[row] or column_used[column]:
+            continue
+
+        row_used[row] = column_used[column] = True
+        rows.append(row)
+        columns.append(column)
+        if len(rows) == num_pairs:
+            break
+
+    # All pairs left score 0 at most, they are assigned in row-major order like
+    # the ties of a stable sort
+    free_rows = [row for row in range(n) if not row_used[row]]
+    free_columns = [column for column in range(m) if not column_used[column]]
+    for row, column in zip(free_rows, free_columns[: num_pairs - len(rows)]):
+        rows.append(row)
+        columns.append(column)
+
+    rows = np.array(rows, dtype=np.intp)
+    columns = np.array(columns, dtype=np.intp)
+    order = np.argsort(rows)
+    return rows[order], columns[order]
@@ -1,3 +1,7 @@
+import concurrent.futures
+import functools
+import math
+import re
 import ssl
 import numpy as np
 from collections.abc import Mapping
@@ -7,14 +11,81 @@ from nltk.tokenize import (
     NLTKWordTokenizer,
     PunktSentenceTokenizer,
 )
+from nltk.tokenize.util import align_tokens
 
 from lynxius_evals.models.eval_model import EvalModel
 
+# Every worker process gets a few chunks, so that uneven texts balance out
+CHUNKS_PER_PROCESS = 4
+DOUBLE_QUOTES_PATTERN = re.compile(r"``|'{2}|\"")
+
+Tokenizer = NLTKWordTokenizer | PunktSentenceTokenizer
+
+
+def create_tokenizer(level: str) -> Tokenizer:
+    return PunktSentenceTokenizer() if level == "sentence" else NLTKWordTokenizer()
+
+
+def tokenize_with_spans(
+    tokenizer: Tokenizer, text: str
+) -> tuple[list[str], list[tuple[int, int]]]:
+    """Tokenizes `text` once and returns its tokens together with their spans.
+
+    This is equivalent to calling both `tokenize` and `span_tokenize` of the
+    tokenizer, which would run the tokenizer twice.
+    """
+    if isinstance(tokenizer, PunktSentenceTokenizer):
+        spans = list(tokenizer.span_tokenize(text))
+        return [text[start:end] for start, end in spans], spans
+
+    tokens = tokenizer.tokenize(text)
+
+    # Same as `NLTKWordTokenizer.span_tokenize`: converted quotes have to be
+    # replaced back with the original double quotes to align the tokens.
+    aligned_tokens = tokens
+    if ('"' in text) or ("''" in text):
+        matched = [m.group() for m in DOUBLE_QUOTES_PATTERN.finditer(text)]
+        aligned_tokens = [
+            matched.pop(0) if tok in ['"', "``", "''"] else tok for tok in tokens
+        ]
+
+    return tokens, align_tokens(aligned_tokens, text)
+
+
+@functools.lru_cache(maxsize=None)
+def _process_tokenizer(level: str) -> Tokenizer:
+    return create_tokenizer(level)
+
+
+def _tokenize_chunk(
+    level: str, texts: list[str]
+) -> list[tuple[list[str], list[tuple[int, int]]]]:
+    # Runs in a worker process, which builds its tokenizer only once
+    tokenizer = _process_tokenizer(level)
+    return [tokenize_with_spans(tokenizer, text) for text in texts]
+
 
 class BertScoreEval:
     def __init__(
-        self, model: EvalModel, level: str, presence_threshold: float = 0.65
+        self,
+        model: EvalModel,
+        level: str,
+        presence_threshold: float = 0.65,
+        num_processes: int | None = None,
     ) -> None:
+        """
+        Args:
+            model (EvalModel): The model used to embed tokens.
+
+            level (str): Either "sentence" or "word".
+
+            presence_threshold (float): The minimum similarity for a reference token
+                to be considered present in the output.
+
+            num_processes (int | None): If set to more than 1, texts are tokenized
+                in a pool of that many processes. This pays off for large batches
+                only, since starting the pool takes a while.
+        """
         assert level in [
             "sentence",
             "word",
@@ -22,6 +93,8 @@ class BertScoreEval:
         self.level = level
         self.presence_threshold = presence_threshold
         self.model = model
+        self.num_processes = num_processes
+        self.tokenizer = create_tokenizer(level)
 
         # NLTK tokenizer needs some resources to be downloaded.
         try:
@@ -38,15 +111,8 @@ class BertScoreEval:
             nltk.download("punkt", raise_on_error=True)
 
     def evaluate(self, data: list[Mapping[str, str]]) -> object:
-        tokenize_fn = (
-            PunktSentenceTokenizer().tokenize
-            if self.level == "sentence"
-            else NLTKWordTokenizer().tokenize
-        )
-        span_tokenize_fn = (
-            PunktSentenceTokenizer().span_tokenize
-            if self.level == "sentence"
-            else NLTKWordTokenizer().span_tokenize
+        tokenized = self._tokenize(
+            [text for item in data for text in (item["reference"], item["output"])]
         )
 
         # We batch all tokens to a single embed request
@@ -56,67 +122,37 @@ class BertScoreEval:
         batched_token_map = []
         # This list contains tuples (ref_spans, cnd_spans) of lists of spans
         batched_token_spans = []
-        for item in data:
-            reference_tokens = tokenize_fn(item["reference"])
-            candidate_tokens = tokenize_fn(item["output"])
+        for reference, candidate in zip(tokenized[0::2], tokenized[1::2]):
+            reference_tokens, reference_token_spans = reference
+            candidate_tokens, candidate_token_spans = candidate
             batched_tokens += reference_tokens
             batched_tokens += candidate_tokens
             batched_token_map.append((len(reference_tokens), len(candidate_tokens)))
 
             # Add spans
-            reference_token_spans = list(span_tokenize_fn(item["reference"]))
-            candidate_token_spans = list(span_tokenize_fn(item["output"]))
             batched_token_spans.append((reference_token_spans, candidate_token_spans))
 
         # Embed all text in a batch
-        embeddings = self.model.embed(batched_tokens)
+        # Repeated tokens (stopwords, punctuation, ...) are embedded only once
+        vocabulary = {}
+        token_ids = [
+            vocabulary.setdefault(token, len(vocabulary)) for token in batched_tokens
+        ]
+        embeddings = self.model.embed_array(list(vocabulary))
+        recalls, precisions, best_ref_matches = self._score(
+            embeddings, token_ids, batched_token_map
+        )
 
         # This result will be returned
         result = []
-        consumed = 0
         for batch, token_map in enumerate(batched_token_map):
-            ref_len = token_map[0]
-            cnd_len = token_map[1]
-            ref_start, ref_end = consumed, consumed + ref_len
-            cnd_start, cnd_end = consumed + ref_len, consumed + ref_len + cnd_len
-            consumed += ref_len + cnd_len
-
-            ref_vecs = np.array(
-                [vec for vec in embeddings[ref_start:ref_end]]
-            )  # (ref_len, 1536)
-            cnd_vecs = np.array(
-                [vec for vec in embeddings[cnd_start:cnd_end]]
-            )  # (cnd_len, 1536)
-
-            # Normalize to have unit length (no need for this when using OpenAI)
-            ref_vecs = ref_vecs / np.linalg.norm(ref_vecs, axis=1)[:, None]
-            cnd_vecs = cnd_vecs / np.linalg.norm(cnd_vecs, axis=1)[:, None]
-
-            # Pairwise similarity is a batch dot product of normalized vectors
-            similarity = np.matmul(
-                ref_vecs, cnd_vecs.transpose(1, 0)
-            )  # (ref_len, cnd_len)
-
-            # In theory, cosine similarity is in [-1, 1]. In practice, negative values
-            # rarely occur. Just to be safe our metric is in [0, 1], we clamp it:
-            similarity = np.clip(similarity, 0.0, 1.0)
-
-            # Just a reminder:
-            # ==========================================================================
-            # Precision:
-            # What proportion of posit. identifications was actually correct? TP/(TP+FP)
-            #
-            # Recall:
-            # What proportion of actual positives was identified correctly? TP/(TP+FN)
-            # ==========================================================================
-            recall = np.sum(np.max(similarity, axis=1)) / ref_len
-            precision = np.sum(np.max(similarity, axis=0)) / cnd_len
+            recall, precision = recalls[batch], precisions[batch]
             f1 = 2 * precision * recall / (precision + recall)
-            recall, precision, f1
 
             # Now, lets find what exact tokens are missing in the candidate
-            sim_best_ref = np.max(similarity, axis=1)  # (ref_len)
-            missing_indices = np.where(sim_best_ref < self.presence_threshold)[0]
+            missing_indices = np.where(
+                best_ref_matches[batch] < self.presence_threshold
+            )[0]
 
             missing_tokens = []
             for idx in missing_indices:
@@ -135,3 +171,87 @@ class BertScoreEval:
             )
 
         return result
+
+    def _tokenize(
+        self, texts: list[str]
+    ) -> list[tuple[list[str], list[tuple[int, int]]]]:
+        if self.num_processes is None or self.num_processes <= 1 or len(texts) < 2:
+            return [tokenize_with_spans(self.tokenizer, text) for text in texts]
+
+        chunk_size = math.ceil(len(texts) / (self.num_processes * CHUNKS_PER_PROCESS))
+        chunks = [
+            texts[start : start + chunk_size]
+            for start in range(0, len(texts), chunk_size)
+        ]
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.num_processes
+        ) as executor:
+            tokenize_fn = functools.partial(_tokenize_chunk, self.level)
+            return [
+                tokenized
+                for chunk in executor.map(tokenize_fn, chunks)
+                for tokenized in chunk
+            ]
+
+    @staticmethod
+    def _score(
+        embeddings: list[list[float]] | np.ndarray,
+        token_ids: list[int],
+        token_map: list[tuple[int, int]],
+    ) -> tuple[np.ndarray, np.ndarray, list[np.ndarray]]:
+        """
+        Computes recall and precision of every trace from the embeddings of the
+        unique tokens. `token_ids` maps all tokens, laid out as
+        `ref_0, cnd_0, ref_1, cnd_1, ...`, to rows of `embeddings`.
+
+        All embeddings are converted to a single float32 matrix and normalized once,
+        then gathered into a matrix of all tokens. Similarity blocks are computed
+        from views into that matrix, and the best match of every token is reduced
+        per text with a single segment sum.
+
+        Returns:
+            tuple: Recall and precision of every trace, and the best similarity of
+                every reference token to any candidate token (a view per trace).
+        """
+        vecs = np.asarray(embeddings, dtype=np.float32)  # (num_unique_tokens, 1536)
+
+        # Normalize to have unit length (no need for this when using OpenAI)
+        vecs = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+        vecs = vecs[np.asarray(token_ids, dtype=np.intp)]  # (num_tokens, 1536)
+
+        lengths = np.asarray(token_map, dtype=np.intp).reshape(-1)
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+        # The best similarity of every token to any token of the other text
+        best_matches = np.empty(len(vecs), dtype=np.float32)
+        for batch in range(len(token_map)):
+            ref_start, cnd_start, cnd_end = offsets[2 * batch : 2 * batch + 3]
+
+            # Pairwise similarity is a dot product of normalized vectors
+            similarity = np.matmul(
+                vecs[ref_start:cnd_start], vecs[cnd_start:cnd_end].T
+            )  # (ref_len, cnd_len)
+            best_matches[ref_start:cnd_start] = similarity.max(axis=1)
+            best_matches[cnd_start:cnd_end] = similarity.max(axis=0)
+
+        # In theory, cosine similarity is in [-1, 1]. In practice, negative values
+        # rarely occur. Just to be safe our metric is in [0, 1], we clamp it.
+        # Clamping commutes with max, so it is enough to clamp the best matches.
+        np.clip(best_matches, 0.0, 1.0, out=best_matches)
+
+        # Just a reminder:
+        # ==========================================================================
+        # Precision:
+        # What proportion of posit. identifications was actually correct? TP/(TP+FP)
+        #
+        # Recall:
+        # What proportion of actual positives was identified correctly? TP/(TP+FN)
+        # ==========================================================================
+        sums = np.add.reduceat(best_matches, offsets[:-1]) / lengths
+        recalls, precisions = sums[0::2], sums[1::2]
+
+        best_ref_matches = [
+            best_matches[offsets[2 * batch] : offsets[2 * batch + 1]]
+            for batch in range(len(token_map))
+        ]
+        return recalls, precisions, best_ref_matches
@@ -1,13 +1,71 @@
-from collections.abc import Mapping
+import functools
 import json
 import logging
-from json.decoder import JSONDecodeError
+from collections.abc import Mapping
+from dataclasses import dataclass
+
 import numpy as np
-from lynxius_evals.evaluators.llm_based_eval import LLMBasedEval
+from rapidfuzz import fuzz, process
 
+from lynxius_evals.evaluators.llm_based_eval import LLMBasedEval
+from lynxius_evals.models.eval_model import AsyncEvalModel, EvalModel
+from lynxius_evals.models.tokens import TokenCounter, TokenLimitExceededError
+from lynxius_evals.prompts.eval_prompt import EvalPromptTemplate
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_NEAR_DUPLICATE_THRESHOLD = 0.9
+PACKING_CACHE_SIZE = 4096
+CONTEXT_SEPARATOR = "************\n[Context]: "
+
+
+@dataclass
+class PackedContexts:
+    """The context chunks that are sent to the judge.
+
+    Attributes:
+        documents: The distinct chunks that fit into the token budget, in rank order.
+        positions: The index into `documents` of every original chunk, or -1 if the
+            chunk was truncated.
+    """
+
+    documents: list[str]
+    positions: list[int]
+
+
+def average_precisions(
+    verdicts: np.ndarray, lengths: np.ndarray | list[int]
+) -> np.ndarray:
+    """Computes the average precision of many traces in a single pass.
+
+    Args:
+        verdicts (np.ndarray): The relevance verdicts of all traces concatenated, in
+            rank order within every trace.
+        lengths (np.ndarray | list[int]): The number of verdicts of every trace.
+
+    Returns:
+        np.ndarray: The average precision of every trace. Traces without relevant
+            chunks score 0.0.
+    """
+    verdicts = np.asarray(verdicts, dtype=bool)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    if lengths.sum() != len(verdicts):
+        raise ValueError("lengths have to add up to the number of verdicts")
+
+    trace_ids = np.repeat(np.arange(len(lengths)), lengths)
+    starts = np.cumsum(lengths) - lengths
+
+    # Relevant chunks up to and including every rank, restarted for every trace
+    hits = np.cumsum(verdicts, dtype=np.int64)
+    hits_before = np.concatenate([[0], hits])[starts]
+    relevant = hits - hits_before[trace_ids]
+    ranks = np.arange(1, len(verdicts) + 1) - starts[trace_ids]
+
+    precisions = np.where(verdicts, relevant / ranks, 0.0)
+    numerators = np.bincount(trace_ids, weights=precisions, minlength=len(lengths))
+    denominators = np.bincount(trace_ids, weights=verdicts, minlength=len(lengths))
+    return numerators / (denominators + 1e-10)
+
 
 class ContextPrecisionEval(LLMBasedEval):
     """A `ContextPrecisionEval` evaluator class for assessing the quality of the
@@ -16,67 +74,228 @@ class ContextPrecisionEval(LLMBasedEval):
     This evaluator penalizes relevant context chunks stored in low ranks. This means
     that in order for this metric to have a high (good) value, all relevant context
     chunks should be higher than the non-relevant ones.
+
+    Retrievers often return the same passage more than once. Exact and near
+    duplicate chunks are sent to the judge only once and the verdict of the first
+    occurrence is used for all of its duplicates. Chunks that don't fit into the
+    token budget are not sent and count as not relevant. A trace whose first chunk
+    alone doesn't fit gets an `error` record instead of being sent without context.
+    Invalid judge outputs get a `parse` failure, so they aren't cached.
     """
 
+    def __init__(
+        self,
+        model: EvalModel | AsyncEvalModel,
+        template: EvalPromptTemplate,
+        near_duplicate_threshold: float | None = DEFAULT_NEAR_DUPLICATE_THRESHOLD,
+        max_context_tokens: int | None = None,
+        **kwargs,
+    ):
+        """
+        Args:
+            near_duplicate_threshold: Chunks with a normalized Levenshtein
+                similarity of at least this value to a higher ranked chunk are
+                treated as its duplicates. Only exact duplicates are collapsed if
+                `None`.
+
+            max_context_tokens: The token budget of the context block. The lowest
+                ranked chunks are dropped until the block fits. Unlimited if `None`.
+
+        The remaining arguments are passed down to `LLMBasedEval`.
+        """
+        super().__init__(model, template, **kwargs)
+
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.max_context_tokens = max_context_tokens
+        # Every trace is packed once to format its prompt and once more to map its
+        # verdicts back, so the packing is memoized by the chunk texts and the
+        # options it depends on
+        self._pack = functools.lru_cache(maxsize=PACKING_CACHE_SIZE)(
+            self._pack_uncached
+        )
+
     def format_template(self, **variable_values: Mapping[str, str | list[str]]):
         # Replace contexts list to a single context variable
         variable_values_copy = {
             k: v for k, v in variable_values.items() if k != "contexts"
         }
 
-        context = ""
-        for c in variable_values["contexts"]:
-            document = c["document"]
-            context += f"************\n[Context]: {document}\n"
-
-        variable_values_copy["context"] = context
+        variable_values_copy["context"] = self.format_context(
+            variable_values["contexts"]
+        )
 
         return self.template.format(**variable_values_copy)
 
+    def context_error(
+        self, contexts: list[Mapping[str, str]]
+    ) -> TokenLimitExceededError | None:
+        """Returns the error of a trace whose first chunk alone exceeds the token
+        budget, so that no context would be sent at all."""
+        if not contexts or self.pack_contexts(contexts).documents:
+            return None
+
+        return TokenLimitExceededError(
+            "The first context chunk exceeds the context token budget "
+            f"({self.max_context_tokens})."
+        )
+
+    def format_context(self, contexts: list[Mapping[str, str]]) -> str:
+        """Renders the packed context chunks in their rank order as a single block."""
+        packed = self.pack_contexts(contexts)
+        return "".join(self._context_blocks(packed.documents))
+
+    def pack_contexts(self, contexts: list[Mapping[str, str]]) -> PackedContexts:
+        """Collapses duplicate chunks and truncates them to the token budget."""
+        return self._pack(
+            tuple(c["document"] for c in contexts),
+            self.near_duplicate_threshold,
+            self.max_context_tokens,
+            self.token_counter,
+        )
+
+    def _pack_uncached(
+        self,
+        documents: tuple[str, ...],
+        near_duplicate_threshold: float | None,
+        max_context_tokens: int | None,
+        token_counter: TokenCounter | None,
+    ) -> PackedContexts:
+        # Exact duplicates, up to whitespace and case, share a single entry
+        distinct = {}
+        representatives = []
+        for document in documents:
+            key = " ".join(document.split()).lower()
+            representatives.append(distinct.setdefault(key, len(distinct)))
+
+        # Every distinct chunk is merged into the first similar chunk above it
+        keys = list(distinct)
+        merged = np.arange(len(keys))
+        if near_duplicate_threshold is not None and len(keys) > 1:
+            similar = (
+                process.cdist(keys, keys, scorer=fuzz.ratio)
+                >= near_duplicate_threshold * 100
+            )
+            kept = np.ones(len(keys), dtype=bool)
+            for j in range(1, len(keys)):
+                matches = np.flatnonzero(similar[j, :j] & kept[:j])
+                if len(matches):
+                    merged[j] = matches[0]
+                    kept[j] = False
+
+        # Send the original text of the first occurrence of every kept chunk
+        packed_documents = []
+        packed_index = {}
+        for document, representative in zip(documents, representatives):
+            chunk = int(merged[representative])
+            if chunk not in packed_index:
+                packed_index[chunk] = len(packed_documents)
+                packed_documents.append(document)
+
+        num_kept = self._fit_budget(packed_documents, max_context_tokens, token_counter)
+        positions = [packed_index[int(merged[r])] for r in representatives]
+        positions = [position if position < num_kept else -1 for position in positions]
+
+        return PackedContexts(packed_documents[:num_kept], positions)
+
+    def _fit_budget(
+        self,
+        documents: list[str],
+        max_context_tokens: int | None,
+        token_counter: TokenCounter | None,
+    ) -> int:
+        """Returns how many leading chunks fit into `max_context_tokens`."""
+        if max_context_tokens is None:
+            return len(documents)
+
+        blocks = self._context_blocks(documents)
+        if token_counter is not None:
+            token_counts = token_counter.count(blocks)
+        else:
+            # Every token is at least one byte long, so this is an upper bound
+            token_counts = [len(block.encode("utf-8")) for block in blocks]
+
+        used = np.cumsum(token_counts)
+        return int(np.searchsorted(used, max_context_tokens, side="right"))
+
+    def _prepare_results(
+        self, variable_values_list: list[Mapping[str, str | list[str]]]
+    ) -> list[dict]:
+        result = super()._prepare_results(variable_values_list)
+        for entry in result:
+            error = self.context_error(entry["contexts"])
+            if error is not None and "error" not in entry:
+                self._record_failure(entry, "tokens", error)
+
+        return result
+
+    @staticmethod
+    def _context_blocks(documents: list[str]) -> list[str]:
+        return [f"{CONTEXT_SEPARATOR}{document}\n" for document in documents]
+
+    def _record_output(
+        self,
+        entry: dict,
+        llm_output: str,
+        variable_values: Mapping[str, str | list[str]],
+    ):
+        # Verdicts are only ranked here, all traces are scored in `_score_results`
+        entry["llm_output"] = llm_output
+        try:
+            entry["ranked_verdicts"] = self.rank_verdicts(llm_output, variable_values)
+        except Exception as e:
+            self._record_failure(entry, "parse", e)
+
+    def _score_results(self, result: list[dict]):
+        entries = [entry for entry in result if "ranked_verdicts" in entry]
+        ranked = [entry.pop("ranked_verdicts") for entry in entries]
+
+        # All traces are scored with a single call
+        scores = average_precisions(
+            np.concatenate(ranked) if ranked else [], [len(v) for v in ranked]
+        )
+        for entry, score in zip(entries, scores.tolist()):
+            entry["score"] = score
+
     def parse_output(
         self, output: str, variable_values: Mapping[str, str | list[str]]
     ) -> float:
-        try:
-            verdicts = json.loads(output)
-            verdicts = verdicts["result"]
-        except JSONDecodeError as e:
-            logger.exception(e)
-            logger.error(output)
-            return 0.0
+        ranked = self.rank_verdicts(output, variable_values)
+        return float(average_precisions(ranked, [len(ranked)])[0])
+
+    def rank_verdicts(
+        self, output: str, variable_values: Mapping[str, str | list[str]]
+    ) -> np.ndarray:
+        """Returns the relevance verdicts of the judge for the original chunks in
+        their rank order. Raises `ValueError` if the output is invalid."""
+        verdicts = json.loads(output)["result"]
 
         if not isinstance(verdicts, list):
-            logger.error("Evaluator didn't return a valid JSON list")
             logger.error(output)
-            return 0.0
+            raise ValueError("Evaluator didn't return a valid JSON list")
 
-        num_contexts = len(variable_values["contexts"])
+        packed = self.pack_contexts(variable_values["contexts"])
+        num_contexts = len(packed.documents)
         if len(verdicts) != num_contexts:
             v = len(verdicts)
             c = num_contexts
-            logger.error(
+            logger.error(output)
+            raise ValueError(
                 f"Evaluator returned {v} verdicts but there were {c} context chunks"
             )
-            logger.error(output)
-            return 0.0
 
         # TODO: If we error out in one of the checks above, it's probably our fault.
         # We might want to consider refunding our customers in such case.
 
-        # All seems good, let's compute the score.
-        # The following code is heavily inspired by Ragas.
-        score = np.nan
-
-        verdict_list = [1 if ver else 0 for ver in verdicts]
-        denominator = sum(verdict_list) + 1e-10
-        numerator = sum(
-            [
-                (sum(verdict_list[: i + 1]) / (i + 1)) * verdict_list[i]
-                for i in range(len(verdict_list))
-            ]
+        # All seems good, let's rank the verdicts.
+        # The scoring code is heavily inspired by Ragas.
+        verdict_array = np.fromiter(
+            (bool(verdict) for verdict in verdicts), dtype=bool, count=len(verdicts)
         )
 
-        score = numerator / denominator
-        if np.isnan(score):
-            logger.warning("Invalid response format - computation ended up with a NaN")
+        # Duplicates share the verdict of the chunk that was sent in their place
+        positions = np.asarray(packed.positions, dtype=np.int64)
+        ranked = np.zeros(len(positions), dtype=bool)
+        sent = positions >= 0
+        ranked[sent] = verdict_array[positions[sent]]
 
-        return score
+        return ranked
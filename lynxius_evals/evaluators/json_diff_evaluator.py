@@ -1,6 +1,529 @@
+import concurrent.futures
+import functools
+import itertools
+import json
 from collections.abc import Mapping
+from dataclasses import dataclass
 
-from Levenshtein import distance
+import numpy as np
+from rapidfuzz.distance import Indel, Levenshtein
+from rapidfuzz.process import cdist, cpdist
+
+from lynxius_evals.evaluators.assignment import greedy, hungarian
+
+# Frame types of the explicit json_diff stack. Apart from `_VISIT` they are also
+# the operations of a compiled diff.
+_VISIT = 0
+_COMBINE_DICT = 1
+_COMBINE_LIST = 2
+_SCORE = 3
+_STRING = 4
+_COMBINE_LIST_PADDED = 5
+_SAME = 6
+
+DEFAULT_CHUNKSIZE = 1000
+LIST_MATCHING_MODES = ["positional", "optimal"]
+# Lists of strings or numbers are scored in bulk, lists of other elements take
+# about 1.5s at the lower limit
+DEFAULT_MAX_MATCHING_PAIRS = 16_000_000
+DEFAULT_MAX_MATCHING_OBJECT_PAIRS = 4_000_000
+DEFAULT_HUNGARIAN_MAX_SIZE = 1000
+DEFAULT_MAX_MATCHING_CANDIDATES = 8
+# Lists of dicts or lists with up to this many pairs are diffed pair by pair
+FULL_DIFF_PAIRS = 10_000
+# Characters of a serialized list element compared to preselect candidate pairs
+FINGERPRINT_LENGTH = 512
+
+# Distinct weights of all traces, sent to every worker process once on start
+_worker_weights: list = []
+
+
+class _Unweighted:
+    """Weights below a numeric weight: every key has a weight of 1.0."""
+
+    def lookup(self, key) -> tuple[float, "_Unweighted"]:
+        return 1.0, self
+
+
+_UNWEIGHTED = _Unweighted()
+
+
+class _Weights:
+    """A weights dict compiled lazily. The weight and the child weights of every
+    key are resolved once and reused for all objects on the same path, e.g. for all
+    elements of a list."""
+
+    __slots__ = ("weights", "_lookups")
+
+    def __init__(self, weights):
+        self.weights = weights
+        self._lookups = {}
+
+    def lookup(self, key) -> tuple[float, "_Weights | _Unweighted"]:
+        """Returns the weight of `key` and the weights of its value."""
+        try:
+            return self._lookups[key]
+        except KeyError:
+            pass
+
+        next_weights = self.weights.get(key, 1.0)
+        if isinstance(next_weights, (int, float)):
+            result = (next_weights, _UNWEIGHTED)
+        else:
+            loopback_key = "__" + key
+            if isinstance(next_weights, dict) and loopback_key in next_weights:
+                weight = next_weights[loopback_key]
+            else:
+                weight = 1.0
+            result = (weight, _Weights(next_weights))
+
+        self._lookups[key] = result
+        return result
+
+
+@dataclass(frozen=True)
+class ListMatching:
+    """Options of the order-insensitive matching of list elements.
+
+    Attributes:
+        max_pairs (int): Lists of strings or numbers with more element pairs than
+            this are compared by position instead, to bound the cost. The number
+            of such lists is reported as `matching_fallbacks`.
+        max_object_pairs (int): The same limit for lists of other elements.
+        hungarian_max_size (int): Lists longer than this are matched greedily
+            instead of optimally.
+        max_candidates (int): Elements of long lists that aren't all strings or
+            all numbers are only diffed against this many of the most similar
+            elements of the other list, by the similarity of their serialized
+            text. The other pairs score 0.
+    """
+
+    max_pairs: int = DEFAULT_MAX_MATCHING_PAIRS
+    max_object_pairs: int = DEFAULT_MAX_MATCHING_OBJECT_PAIRS
+    hungarian_max_size: int = DEFAULT_HUNGARIAN_MAX_SIZE
+    max_candidates: int = DEFAULT_MAX_MATCHING_CANDIDATES
+
+
+def compile_weights(weights) -> _Weights | _Unweighted:
+    if isinstance(weights, (_Weights, _Unweighted)):
+        return weights
+    elif isinstance(weights, (int, float)):
+        return _UNWEIGHTED
+    return _Weights(weights)
+
+
+def levenshtein_scores(
+    references: list[str], outputs: list[str], workers: int = -1
+) -> list[float]:
+    """Scores all string pairs at once with the normalized Levenshtein distance in
+    [0, 1], using `workers` threads (all cores if -1)."""
+    if not references:
+        return []
+
+    distances = cpdist(
+        references,
+        outputs,
+        scorer=Levenshtein.distance,
+        dtype=np.int64,
+        workers=workers,
+    )
+    max_lens = np.maximum(
+        np.fromiter(map(len, references), dtype=np.int64, count=len(references)),
+        np.fromiter(map(len, outputs), dtype=np.int64, count=len(outputs)),
+    )
+
+    # Pairs of empty strings are never scored here, so max_lens are positive
+    return (1 - distances / max_lens).tolist()
+
+
+def leaf_score(o1, o2) -> float:
+    """Scores two objects of which at least one is neither a dict, a list nor a
+    string."""
+    if (isinstance(o1, int) or isinstance(o1, float)) and (
+        isinstance(o2, int) or isinstance(o2, float)
+    ):
+        if o2 == 0 and o1 == 0:
+            return 1
+        else:
+            # Normalized difference
+            return 1 - abs(o2 - o1) / (abs(o2) + abs(o1))
+    elif o1 is None and o2 is None:
+        return 1
+    elif o1 is None or o2 is None:
+        return 0
+    else:
+        return 0
+
+
+def weighted_mean(scores: list[float], weights: list[float]) -> float:
+    # Adjust the weights such that they sum to len(weights)
+    if sum(weights) == 0:
+        # Weights can't sum up to 0. Assume weights for all keys are 1.
+        weights = [1 for _ in weights]
+        factor = 1.0
+    else:
+        factor = len(weights) / sum(weights)
+
+    return sum(s * w * factor for (s, w) in zip(scores, weights)) / len(scores)
+
+
+def _equal(o1, o2) -> bool:
+    # Comparing very deep objects recurses in C, in which case they are matched
+    try:
+        return o1 == o2
+    except RecursionError:
+        return False
+
+
+def escape_path_token(token) -> str:
+    """Escapes a key or an index as a JSON Pointer (RFC 6901) reference token."""
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def _compile_diff(
+    o1,
+    o2,
+    weights,
+    string_pairs: tuple[list[str], list[str]],
+    paths: dict[str, int] | None = None,
+    list_matching: ListMatching | None = None,
+    workers: int = -1,
+) -> tuple[list[tuple], int]:
+    """
+    Traverses two JSON objects with an explicit stack and returns the operations
+    scoring them in postfix order, along with the number of lists that were
+    compared by position because they had too many pairs to match. Strings that
+    differ aren't scored yet, they are appended to `string_pairs` to be scored in
+    bulk.
+
+    Equal leaves are scored with `_SAME`, and combining operations carry whether
+    both dicts have the same keys or both lists the same length, so that equal
+    dicts and lists are found bottom-up when the operations are run. If `paths` is
+    given, every operation carries the id of the JSON Pointer of its node in
+    `paths`, otherwise the id is `None`. Lists are compared by position, unless
+    `list_matching` is given.
+
+    Without `paths`, equal documents and identical subtrees score 1.0 without being
+    traversed. Equal subtrees are otherwise found bottom-up, since comparing them
+    at every level would be quadratic in the depth.
+    """
+    if paths is None and _equal(o1, o2):
+        return [(_SAME, 1.0, None)], 0
+
+    operations = []
+    fallbacks = 0
+    stack = [(_VISIT, o1, o2, compile_weights(weights), "")]
+    while stack:
+        frame = stack.pop()
+        if frame[0] != _VISIT:
+            # All children of the frame were visited, so it can be combined
+            operations.append(frame)
+            continue
+
+        _, o1, o2, weights, path = frame
+        path_id = None if paths is None else paths.setdefault(path, len(paths))
+        if paths is None and o1 is o2 and isinstance(o1, (dict, list)):
+            operations.append((_SAME, 1.0, path_id))
+        elif isinstance(o1, dict) and isinstance(o2, dict):
+            if len(o1) == 0 and len(o2) == 0:
+                operations.append((_SAME, 1, path_id))
+                continue
+
+            # We only look at the intersection of the keys
+            # Mismatch is not penalized in any way
+            all_keys = list(set(o1.keys()).union(set(o2.keys())))
+            lookups = [weights.lookup(key) for key in all_keys]
+            same_keys = len(all_keys) == len(o1) == len(o2)
+
+            # Children are pushed in reverse, so their scores end up in order
+            stack.append(
+                (
+                    _COMBINE_DICT,
+                    ([weight for weight, _ in lookups], same_keys),
+                    path_id,
+                )
+            )
+            for key, (_, next_weights) in zip(all_keys[::-1], lookups[::-1]):
+                if paths is not None:
+                    next_path = f"{path}/{escape_path_token(key)}"
+                else:
+                    next_path = None
+                stack.append(
+                    (_VISIT, o1.get(key), o2.get(key), next_weights, next_path)
+                )
+        elif isinstance(o1, list) and isinstance(o2, list):
+            if len(o1) == 0 and len(o2) == 0:
+                operations.append((_SAME, 1, path_id))
+                continue
+
+            num_elements = min(len(o1), len(o2))
+            if list_matching is None:
+                stack.append(
+                    (_COMBINE_LIST, (num_elements, len(o1) == len(o2)), path_id)
+                )
+            elif num_elements > 0 and _can_match(o1, o2, list_matching):
+                # Matching is quadratic anyway, so equal lists are compared first
+                if _equal(o1, o2):
+                    operations.append((_SAME, 1.0, path_id))
+                else:
+                    score, nested_fallbacks = _match_lists(
+                        o1, o2, weights, list_matching, workers
+                    )
+                    operations.append((_SCORE, score, path_id))
+                    fallbacks += nested_fallbacks
+                continue
+            else:
+                # Too many pairs to match, unmatched elements still score 0
+                fallbacks += num_elements > 0
+                stack.append(
+                    (
+                        _COMBINE_LIST_PADDED,
+                        (num_elements, max(len(o1), len(o2))),
+                        path_id,
+                    )
+                )
+            for i in range(num_elements - 1, -1, -1):
+                next_path = None if paths is None else f"{path}/{i}"
+                stack.append((_VISIT, o1[i], o2[i], weights, next_path))
+        elif isinstance(o1, str) and isinstance(o2, str):
+            if o1 == o2:
+                # Identical strings have a distance of 0
+                operations.append((_SAME, 1.0 if o1 else 1, path_id))
+            else:
+                operations.append((_STRING, len(string_pairs[0]), path_id))
+                string_pairs[0].append(o1)
+                string_pairs[1].append(o2)
+        else:
+            # Containers compare elements by identity first, and so do leaves here
+            same = o1 is o2 or o1 == o2
+            operations.append((_SAME if same else _SCORE, leaf_score(o1, o2), path_id))
+
+    return operations, fallbacks
+
+
+def _fold_diff(
+    operations: list[tuple], string_scores: list[float], with_paths: bool = False
+) -> tuple[float, np.ndarray | None, np.ndarray | None]:
+    """
+    Runs the operations of a compiled diff. Returns its score, and if `with_paths`
+    is set, the path ids and the scores of all scored nodes in postfix order.
+
+    Dicts and lists are equal if they have the same keys or length and all their
+    children are equal, in which case they score 1.0. Equality is thus found in a
+    single pass, instead of comparing whole subtrees at every level.
+    """
+    path_ids = [] if with_paths else None
+    path_scores = [] if with_paths else None
+
+    # Scores of finished nodes and whether they are equal, consumed by the
+    # operations combining them
+    scores = []
+    equal = []
+    for kind, arg, path_id in operations:
+        if kind == _SCORE:
+            scores.append(arg)
+            equal.append(False)
+        elif kind == _SAME:
+            scores.append(arg)
+            equal.append(True)
+        elif kind == _STRING:
+            scores.append(string_scores[arg])
+            equal.append(False)
+        else:
+            if kind == _COMBINE_DICT:
+                weights, same_shape = arg
+                num_children = len(weights)
+            elif kind == _COMBINE_LIST:
+                num_children, same_shape = arg
+            else:
+                num_children, max_len = arg
+                same_shape = num_children == max_len
+
+            start = len(scores) - num_children
+            child_scores = scores[start:]
+            same = same_shape and all(equal[start:])
+            del scores[start:]
+            del equal[start:]
+
+            if same:
+                scores.append(1.0)
+            elif kind == _COMBINE_DICT:
+                scores.append(weighted_mean(child_scores, weights))
+            elif kind == _COMBINE_LIST:
+                scores.append(sum(child_scores) / len(child_scores))
+            else:
+                scores.append(sum(child_scores) / max_len)
+            equal.append(same)
+
+        if with_paths:
+            path_ids.append(path_id)
+            path_scores.append(scores[-1])
+
+    if not with_paths:
+        return scores[0], None, None
+
+    return (
+        scores[0],
+        np.array(path_ids, dtype=np.int32),
+        np.array(path_scores, dtype=np.float64),
+    )
+
+
+def _element_scores(
+    o1: list, o2: list, weights, list_matching: ListMatching, workers: int
+) -> tuple[np.ndarray, int]:
+    """Scores every element of `o1` against every element of `o2`. Also returns
+    the number of nested lists compared by position."""
+    if all(isinstance(element, str) for element in itertools.chain(o1, o2)):
+        distances = cdist(
+            o1, o2, scorer=Levenshtein.distance, dtype=np.int64, workers=workers
+        )
+        max_lens = np.maximum.outer(
+            np.fromiter(map(len, o1), dtype=np.int64, count=len(o1)),
+            np.fromiter(map(len, o2), dtype=np.int64, count=len(o2)),
+        )
+        # Two empty strings are identical
+        scores = np.where(max_lens > 0, 1 - distances / np.maximum(max_lens, 1), 1.0)
+        return scores, 0
+    elif all(_is_number(element) for element in itertools.chain(o1, o2)):
+        # The normalized difference of `leaf_score`, for all pairs at once
+        a = np.asarray(o1, dtype=np.float64)[:, None]
+        b = np.asarray(o2, dtype=np.float64)[None, :]
+        magnitudes = np.abs(a) + np.abs(b)
+        differences = np.abs(b - a) / np.where(magnitudes > 0, magnitudes, 1.0)
+        return 1 - differences, 0
+
+    # Only pairs of two dicts, two lists or two strings that differ need a full
+    # diff. Equal pairs score 1.0 and all other pairs are scored as leaves.
+    scores = np.zeros((len(o1), len(o2)))
+    pairs = []
+    indices = []
+    for i, j in zip(*_candidate_pairs(o1, o2, list_matching.max_candidates, workers)):
+        e1, e2 = o1[i], o2[j]
+        if type(e1) is not type(e2) or not isinstance(e1, (dict, list, str)):
+            scores[i, j] = leaf_score(e1, e2)
+        elif _equal(e1, e2):
+            scores[i, j] = 1.0
+        else:
+            pairs.append((e1, e2, weights))
+            indices.append((i, j))
+
+    diffs = _diff_scores(pairs, workers, list_matching=list_matching)
+    for (i, j), (score, _, _, _) in zip(indices, diffs):
+        scores[i, j] = score
+    return scores, sum(fallbacks for _, _, _, fallbacks in diffs)
+
+
+def _can_match(o1: list, o2: list, list_matching: ListMatching) -> bool:
+    """Whether two lists are short enough to be matched."""
+    num_pairs = len(o1) * len(o2)
+    if num_pairs <= list_matching.max_object_pairs:
+        return True
+    elif num_pairs > list_matching.max_pairs:
+        return False
+
+    # Only these are scored in bulk
+    elements = list(itertools.chain(o1, o2))
+    return all(isinstance(e, str) for e in elements) or all(map(_is_number, elements))
+
+
+def _is_number(element) -> bool:
+    return isinstance(element, (int, float))
+
+
+def _fingerprint(element) -> str:
+    try:
+        text = json.dumps(element, sort_keys=True, default=str)
+    except (TypeError, ValueError, RecursionError):
+        return ""
+    return text[:FINGERPRINT_LENGTH]
+
+
+def _candidate_pairs(
+    o1: list, o2: list, max_candidates: int, workers: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the row and column indices of the element pairs worth scoring. For
+    long lists, these are the `max_candidates` elements of the other list most
+    similar to every element, so the number of full diffs grows linearly."""
+    num_pairs = len(o1) * len(o2)
+    if num_pairs <= max(FULL_DIFF_PAIRS, max_candidates * (len(o1) + len(o2))):
+        return np.indices((len(o1), len(o2))).reshape(2, -1)
+
+    similarities = cdist(
+        [_fingerprint(element) for element in o1],
+        [_fingerprint(element) for element in o2],
+        scorer=Indel.normalized_similarity,
+        dtype=np.float32,
+        workers=workers,
+    )
+    candidates = np.zeros(similarities.shape, dtype=bool)
+    k = min(max_candidates, len(o2))
+    columns = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    candidates[np.arange(len(o1))[:, None], columns] = True
+    k = min(max_candidates, len(o1))
+    rows = np.argpartition(-similarities, k - 1, axis=0)[:k, :]
+    candidates[rows, np.arange(len(o2))[None, :]] = True
+
+    return np.nonzero(candidates)
+
+
+def _match_lists(
+    o1: list, o2: list, weights, list_matching: ListMatching, workers: int
+) -> tuple[float, int]:
+    """Scores two lists regardless of the order of their elements. Elements are
+    paired to maximize the total score, and unmatched elements score 0. Also
+    returns the number of nested lists compared by position."""
+    scores, fallbacks = _element_scores(o1, o2, weights, list_matching, workers)
+    if max(scores.shape) <= list_matching.hungarian_max_size:
+        rows, columns = hungarian(scores)
+    else:
+        rows, columns = greedy(scores)
+
+    return float(scores[rows, columns].sum()) / max(len(o1), len(o2)), fallbacks
+
+
+def _diff_scores(
+    traces: list[tuple],
+    workers: int,
+    paths: dict[str, int] | None = None,
+    list_matching: ListMatching | None = None,
+) -> list[tuple[float, np.ndarray | None, np.ndarray | None, int]]:
+    """Scores `(reference, output, weights)` traces. Differing strings of all
+    traces are scored at once. Per-path scores are returned if `paths` is given,
+    and the number of lists compared by position instead of being matched is
+    returned last."""
+    string_pairs = ([], [])
+    diffs = [
+        _compile_diff(o1, o2, weights, string_pairs, paths, list_matching, workers)
+        for o1, o2, weights in traces
+    ]
+    string_scores = levenshtein_scores(*string_pairs, workers)
+
+    return [
+        (*_fold_diff(diff, string_scores, paths is not None), fallbacks)
+        for diff, fallbacks in diffs
+    ]
+
+
+def _init_worker(weights: list):
+    global _worker_weights
+    _worker_weights = weights
+
+
+def _diff_chunk(
+    chunk: list[tuple], with_paths: bool, list_matching: ListMatching | None
+) -> tuple[list[tuple], list[str] | None]:
+    # Runs in a worker process. Traces refer to their weights by index, and the
+    # process is already busy, so strings are scored on a single thread. Path ids
+    # refer to a table of the chunk, which is returned along with the results.
+    paths = {} if with_paths else None
+    results = _diff_scores(
+        [(o1, o2, _worker_weights[index]) for o1, o2, index in chunk],
+        workers=1,
+        paths=paths,
+        list_matching=list_matching,
+    )
+    return results, (list(paths) if with_paths else None)
 
 
 class JsonDiffEval:
@@ -9,20 +532,104 @@ class JsonDiffEval:
     Levenshtein distance for strings.
     """
 
-    def __init__(self) -> None:
-        pass
+    def __init__(
+        self,
+        workers: int = -1,
+        num_processes: int | None = None,
+        chunksize: int = DEFAULT_CHUNKSIZE,
+        return_paths: bool = False,
+        list_matching: str = "positional",
+        max_matching_pairs: int = DEFAULT_MAX_MATCHING_PAIRS,
+        hungarian_max_size: int = DEFAULT_HUNGARIAN_MAX_SIZE,
+        max_matching_object_pairs: int = DEFAULT_MAX_MATCHING_OBJECT_PAIRS,
+        max_matching_candidates: int = DEFAULT_MAX_MATCHING_CANDIDATES,
+    ) -> None:
+        """
+        Args:
+            workers (int): The number of threads scoring strings. All cores are used
+                if -1.
+
+            num_processes (int | None): If set to more than 1, traces are scored in
+                a pool of that many processes.
+
+            chunksize (int): The number of traces sent to a worker process at a
+                time.
+
+            return_paths (bool): If set, every result also has the scores of all
+                scored nodes as two flat arrays: `path_ids`, which index
+                `self.paths`, and `path_scores`.
+
+            list_matching (str): "positional" compares lists element by element
+                and ignores extra elements. "optimal" pairs the elements of two
+                lists regardless of their order, so that the total score is
+                maximal, and unmatched elements score 0. The lists are scored as
+                a whole, so their elements aren't listed in the per-path scores.
+
+            max_matching_pairs (int): Lists of strings or numbers with more
+                element pairs are compared by position in "optimal" mode, with
+                unmatched elements scoring 0. In that mode every result has the
+                number of such lists as `matching_fallbacks`.
+
+            hungarian_max_size (int): Longer lists are matched greedily in
+                "optimal" mode, which is faster but not guaranteed to be optimal.
+
+            max_matching_object_pairs (int): The same as `max_matching_pairs` for
+                lists of other elements, which are diffed pair by pair.
+
+            max_matching_candidates (int): In "optimal" mode, elements of long
+                lists of dicts or lists are only diffed against this many of the
+                most similar elements of the other list, by their serialized text.
+        """
+        if chunksize < 1:
+            raise ValueError("chunksize must be a positive integer")
+        if list_matching not in LIST_MATCHING_MODES:
+            raise ValueError(
+                f"list_matching must be one of the following: {LIST_MATCHING_MODES}"
+            )
+
+        self.workers = workers
+        self.num_processes = num_processes
+        self.chunksize = chunksize
+        self.return_paths = return_paths
+        self.list_matching = (
+            ListMatching(
+                max_matching_pairs,
+                max_matching_object_pairs,
+                hungarian_max_size,
+                max_matching_candidates,
+            )
+            if list_matching == "optimal"
+            else None
+        )
+        # JSON Pointers of all scored nodes, shared by all traces
+        self.paths: list[str] = []
+        self._path_ids: dict[str, int] = {}
 
     def evaluate(
         self,
         variable_values: list[Mapping[str, str]],
     ) -> list[dict]:
+        traces = [
+            (item["reference"], item["output"], item.get("weights", {}))
+            for item in variable_values
+        ]
+        if (
+            self.num_processes is not None
+            and self.num_processes > 1
+            and len(traces) > self.chunksize
+        ):
+            diffs = self._diff_scores_parallel(traces)
+        else:
+            diffs = self._diff_scores(traces)
+
         result = []
-        for item in variable_values:
+        for item, (score, path_ids, path_scores, fallbacks) in zip(
+            variable_values, diffs
+        ):
             o1 = item["reference"]
             o2 = item["output"]
             weights = item.get("weights", {})
             contexts = item["contexts"]
-            score = self.json_diff(o1, o2, weights)
 
             result.append(
                 {
@@ -33,86 +640,94 @@ class JsonDiffEval:
                     "score": score,
                 }
             )
+            if self.return_paths:
+                result[-1]["path_ids"] = path_ids
+                result[-1]["path_scores"] = path_scores
+            if self.list_matching is not None:
+                result[-1]["matching_fallbacks"] = fallbacks
 
         return result
 
     def json_diff(self, o1, o2, weights={}):
-        def get_next_weights(prev_weights, key):
-            if isinstance(prev_weights, (int, float)):
-                return 1.0
-            else:
-                return weights.get(key, 1.0)
+        """
+        Scores the similarity of two JSON objects in [0, 1].
 
-        def get_levenshtein_distance(o1: str, o2: str):
-            max_len = max(len(x) for x in [o1, o2])
+        Dicts score the weighted mean of the scores of all their keys and lists the
+        mean of the scores of their elements compared by position. Equal dicts and
+        lists score 1.0, which is determined bottom-up in the same pass. The
+        documents are traversed with an explicit stack, so arbitrarily deep objects
+        don't hit the recursion limit, and differing strings are scored in bulk.
+        """
+        return _diff_scores(
+            [(o1, o2, weights)], self.workers, list_matching=self.list_matching
+        )[0][0]
 
-            # Normalized Levenshtein distance in [0,1]
-            score = 1
-            if max_len > 0:
-                score = 1 - (distance(o1, o2) / max_len)
+    def json_diff_paths(
+        self, o1, o2, weights={}
+    ) -> tuple[float, np.ndarray, np.ndarray]:
+        """
+        Scores two JSON objects like `json_diff`, and additionally returns the ids
+        of the JSON Pointers of all scored nodes in `self.paths` and their scores.
+        """
+        diff = _diff_scores(
+            [(o1, o2, weights)], self.workers, self._path_ids, self.list_matching
+        )[0]
+        self.paths = list(self._path_ids)
+        return diff[:3]
 
-            return score
+    def _diff_scores(self, traces: list[tuple]) -> list[tuple]:
+        diffs = _diff_scores(
+            traces,
+            self.workers,
+            self._path_ids if self.return_paths else None,
+            self.list_matching,
+        )
+        self.paths = list(self._path_ids)
+        return diffs
 
-        if isinstance(o1, dict) and isinstance(o2, dict):
-            if len(o1) == 0 and len(o2) == 0:
-                return 1
-
-            # We only look at the intersection of the keys
-            # Mismatch is not penalized in any way
-            all_keys = set(o1.keys()).union(set(o2.keys()))
-
-            base_scores = []
-            base_weights = []
-            for key in all_keys:
-                next_weights = get_next_weights(weights, key)
-                base_score = self.json_diff(o1.get(key), o2.get(key), next_weights)
-                if base_score is None:
-                    continue
-
-                loopback_key = "__" + key
-                if isinstance(next_weights, (int, float)):
-                    weight = next_weights
-                elif isinstance(next_weights, dict) and loopback_key in next_weights:
-                    weight = next_weights[loopback_key]
-                else:
-                    weight = 1.0
-
-                base_weights.append(weight)
-                base_scores.append(base_score)
-
-            assert len(base_scores) == len(base_weights)
-
-            # Adjust the weights such that they sum to len(base_weights)
-            if sum(base_weights) == 0:
-                # Weights can't sum up to 0. Assume weights for all keys are 1.
-                base_weights = [1 for _ in base_weights]
-                factor = 1.0
-            else:
-                factor = len(base_weights) / sum(base_weights)
+    def _diff_scores_parallel(self, traces: list[tuple]) -> list[tuple]:
+        # Traces usually share a few weights objects. They are sent to every
+        # worker once, instead of being pickled again with every chunk.
+        weights_indices = {}
+        distinct_weights = []
+        indexed_traces = []
+        for o1, o2, weights in traces:
+            index = weights_indices.get(id(weights))
+            if index is None:
+                index = weights_indices[id(weights)] = len(distinct_weights)
+                distinct_weights.append(weights)
+            indexed_traces.append((o1, o2, index))
 
-            return sum(
-                s * w * factor for (s, w) in zip(base_scores, base_weights)
-            ) / len(base_scores)
-        elif isinstance(o1, list) and isinstance(o2, list):
-            if len(o1) == 0 and len(o2) == 0:
-                return 1
+        chunks = [
+            indexed_traces[start : start + self.chunksize]
+            for start in range(0, len(indexed_traces), self.chunksize)
+        ]
+        diffs = []
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.num_processes,
+            initializer=_init_worker,
+            initargs=(distinct_weights,),
+        ) as executor:
+            diff_chunk = functools.partial(
+                _diff_chunk,
+                with_paths=self.return_paths,
+                list_matching=self.list_matching,
+            )
+            for results, chunk_paths in executor.map(diff_chunk, chunks):
+                if chunk_paths is not None:
+                    # Map path ids of the chunk to the shared path table
+                    path_ids = np.array(
+                        [
+                            self._path_ids.setdefault(path, len(self._path_ids))
+                            for path in chunk_paths
+                        ],
+                        dtype=np.int32,
+                    )
+                    results = [
+                        (score, path_ids[ids], scores, fallbacks)
+                        for score, ids, scores, fallbacks in results
+                    ]
+                diffs.extend(results)
 
-            base_scores = [self.json_diff(e1, e2, weights) for (e1, e2) in zip(o1, o2)]
-            base_scores = [s for s in base_scores if s is not None]
-            return sum(base_scores) / len(base_scores)
-        elif isinstance(o1, str) and isinstance(o2, str):
-            return get_levenshtein_distance(o1, o2)
-        elif (isinstance(o1, int) or isinstance(o1, float)) and (
-            isinstance(o2, int) or isinstance(o2, float)
-        ):
-            if o2 == 0 and o1 == 0:
-                return 1
-            else:
-                # Normalized difference
-                return 1 - abs(o2 - o1) / (abs(o2) + abs(o1))
-        elif o1 is None and o2 is None:
-            return 1
-        elif o1 is None or o2 is None:
-            return 0
-        else:
-            return 0
+        self.paths = list(self._path_ids)
+        return diffs
@@ -1,39 +1,55 @@
+import asyncio
 import concurrent.futures
 import logging
+import random
+import time
 from collections.abc import Mapping
 from typing import Any
 
-import tiktoken
-from lynxius_evals.models.eval_model import EvalModel
-from lynxius_evals.models.openai import (
-    DEFAULT_MAX_TOKENS_GPT_4,
-    DEFAULT_OPENAI_MODEL,
+from lynxius_evals.models.cache import ResponseCache, response_cache_key
+from lynxius_evals.models.eval_model import (
+    BATCH_COMPLETED,
+    BATCH_FINAL_STATUSES,
+    AsyncEvalModel,
+    BatchEvalModel,
+    BatchRequestError,
+    EvalModel,
+    disable_query_retries,
 )
+from lynxius_evals.models.rate_limit import is_rate_limit_error, is_transient_error
+from lynxius_evals.models.tokens import TokenCounter, TokenLimitExceededError
 from lynxius_evals.prompts.eval_prompt import EvalPromptTemplate
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_MAX_CONCURRENCY = 64
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 1.0
+DEFAULT_RETRY_BACKOFF_MAX = 30.0
+DEFAULT_BATCH_POLL_INTERVAL = 60.0
 
-class TokenLimitExceededError(Exception):
-    """Exception raised when the token count exceeds the maximum allowed limit."""
-
-    def __init__(self, message="Token count exceeds the maximum allowed limit"):
-        self.message = message
-        super().__init__(self.message)
+__all__ = ["LLMBasedEval", "TokenLimitExceededError"]
 
 
 class LLMBasedEval:
     def __init__(
         self,
-        model: EvalModel,
+        model: EvalModel | AsyncEvalModel,
         template: EvalPromptTemplate,
         output_map: Mapping[str, Any] | None = None,
         output_default: Any | None = None,
         max_workers: int | None = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        retry_backoff: float = DEFAULT_RETRY_BACKOFF,
+        retry_backoff_max: float = DEFAULT_RETRY_BACKOFF_MAX,
+        token_counter: TokenCounter | None = None,
+        response_cache: ResponseCache | None = None,
     ):
         """
         Args:
-            model: LLM model `EvalModel`.
+            model: LLM model `EvalModel`. Pass an `AsyncEvalModel` to use
+                `evaluate_async`.
 
             template: LLM template `EvalPromptTemplate`.
 
@@ -48,6 +64,28 @@ class LLMBasedEval:
 
             max_workers: How many threads to use. Gets passed down to
                 `ThreadPoolExecutor`.
+
+            max_concurrency: How many LLM calls `evaluate_async` keeps in flight at
+                the same time.
+
+            max_retries: How many times a failed LLM call is retried for a trace.
+                Only transient errors (rate limits, timeouts, connection and server
+                errors) are retried.
+
+            retry_backoff: The base delay in seconds between retries. The n-th retry
+                waits a random time between 0 and `retry_backoff * 2**n` seconds.
+
+            retry_backoff_max: The upper bound of a single retry delay in seconds.
+
+            token_counter: Counts prompt tokens and enforces the context limit
+                before any request is sent. Defaults to the model's `token_counter`
+                if it has one.
+
+            response_cache: Answers prompts the same model was already asked with
+                the same parameters, so only new or changed traces are sent.
+
+        Traces that still fail after all retries don't get a `score`. Instead, their
+        result contains an `error` record and they are counted in `num_failed`.
         """
         if not model:
             raise ValueError("Model has to be provided")
@@ -65,56 +103,387 @@ class LLMBasedEval:
         self.output_map = output_map
         self.output_default = output_default
         self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.token_counter = (
+            token_counter
+            if token_counter is not None
+            else getattr(model, "token_counter", None)
+        )
+        self.response_cache = response_cache
+        # Failed queries are retried here, models that retry them as well would
+        # multiply the attempts
+        if max_retries > 0:
+            disable_query_retries(model)
+
+        # Success, failure and cache hit counts and prompt tokens of the last
+        # evaluation
+        self.num_succeeded = 0
+        self.num_failed = 0
+        self.num_cached = 0
+        self.num_input_tokens = 0
+        # Batch jobs that were still running when `evaluate_batch` timed out
+        self.pending_batch_ids: list[str] = []
 
     def evaluate(
         self,
         variable_values_list: list[Mapping[str, str | list[str]]],
     ) -> list[Mapping]:
-        result = []
+        result = self._prepare_results(variable_values_list)
+        indices = self._apply_cached(result, variable_values_list)
+        responses = {}
         with concurrent.futures.ThreadPoolExecutor(
             max_workers=self.max_workers
         ) as executor:
             # Submit background tasks
             future_to_index = {}
-            for i, variable_values in enumerate(variable_values_list):
-                formatted_template = self.format_template(**variable_values)
-
-                # Tokenize and count
-                if self.model == DEFAULT_OPENAI_MODEL:
-                    enc = tiktoken.encoding_for_model(DEFAULT_OPENAI_MODEL)
-                    tokens = enc.encode(formatted_template)
-                    token_count = len(tokens)
-                    if token_count > DEFAULT_MAX_TOKENS_GPT_4:
-                        # TODO: this will crash an eval that we've already charged our
-                        # customer for. We should somehow fix this. Also, our customer
-                        # will not know what's the problem - the eval will simply not
-                        # show up in the EvalRuns page.
-                        raise TokenLimitExceededError(
-                            f"Token count ({token_count}) exceeds the maximum allowed \
-                                for {self.model}."
-                        )
-
-                future = executor.submit(self.model.query, formatted_template)
+            for i in indices:
+                future = executor.submit(
+                    self._query_with_retries, result[i]["llm_input"]
+                )
                 future_to_index[future] = i
 
-                # Append the input values to the result.
-                # Outputs will be appended as they come.
-                result.append({**variable_values, "llm_input": formatted_template})
-
             # Wait for tasks to complete
             for future in concurrent.futures.as_completed(future_to_index):
                 index = future_to_index[future]
                 try:
-                    llm_output = future.result()[0]
-                    score = self.parse_output(llm_output, variable_values_list[index])
-                    result[index].update(
-                        {
-                            "llm_output": llm_output,
-                            "score": score,
-                        }
+                    llm_outputs = future.result()
+                except Exception as e:
+                    self._record_failure(result[index], "query", e)
+                    continue
+
+                self._record_output(
+                    result[index], llm_outputs[0], variable_values_list[index]
+                )
+                responses[index] = llm_outputs
+
+        self._score_results(result)
+        self._cache_outputs(result, responses)
+        self._count_results(result)
+        return result
+
+    async def evaluate_async(
+        self,
+        variable_values_list: list[Mapping[str, str | list[str]]],
+    ) -> list[Mapping]:
+        """
+        An asyncio-native counterpart of `evaluate`. Requires an `AsyncEvalModel`.
+        At most `max_concurrency` LLM calls are in flight at any time and no threads
+        are spawned for them, so it can be awaited from within an existing event
+        loop. Prompts are formatted and counted in the loop's default executor, so
+        they don't block the loop.
+        """
+        if not isinstance(self.model, AsyncEvalModel):
+            raise TypeError("evaluate_async requires an AsyncEvalModel")
+
+        result = await asyncio.to_thread(self._prepare_results, variable_values_list)
+        indices = self._apply_cached(result, variable_values_list)
+        responses = {}
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def query(index: int, formatted_template: str):
+            async with semaphore:
+                try:
+                    llm_outputs = await self._query_with_retries_async(
+                        formatted_template
                     )
                 except Exception as e:
-                    logger.exception(e)
+                    self._record_failure(result[index], "query", e)
+                    return
+
+            self._record_output(
+                result[index], llm_outputs[0], variable_values_list[index]
+            )
+            responses[index] = llm_outputs
+
+        await asyncio.gather(*[query(i, result[i]["llm_input"]) for i in indices])
+
+        self._score_results(result)
+        self._cache_outputs(result, responses)
+        self._count_results(result)
+        return result
+
+    def evaluate_batch(
+        self,
+        variable_values_list: list[Mapping[str, str | list[str]]],
+        poll_interval: float = DEFAULT_BATCH_POLL_INTERVAL,
+        timeout: float | None = None,
+        cancel_on_timeout: bool = True,
+    ) -> list[Mapping]:
+        """
+        A counterpart of `evaluate` for offline runs that aren't latency sensitive.
+        Requires a `BatchEvalModel`. All prompts are submitted as provider batch
+        jobs, which are polled every `poll_interval` seconds until they finish.
+        Prompts are split into jobs by the `max_batch_size` and `max_batch_bytes`
+        of the model.
+
+        Traces the batch jobs didn't answer, e.g. because a job failed, expired or
+        didn't finish within `timeout` seconds, get an `error` record. The ids of
+        the jobs still running at the timeout are kept in `pending_batch_ids`, and
+        the jobs are cancelled unless `cancel_on_timeout` is unset.
+        """
+        if not isinstance(self.model, BatchEvalModel):
+            raise TypeError("evaluate_batch requires a BatchEvalModel")
+
+        self.pending_batch_ids = []
+        result = self._prepare_results(variable_values_list)
+        indices = self._apply_cached(result, variable_values_list)
+        if not indices:
+            self._score_results(result)
+            self._count_results(result)
+            return result
+
+        batch_ids = [
+            self.model.submit_batch({str(i): result[i]["llm_input"] for i in batch})
+            for batch in self._split_batches(result, indices)
+        ]
+
+        statuses = self._wait_for_batches(batch_ids, poll_interval, timeout)
+        self.pending_batch_ids = [
+            batch_id
+            for batch_id, status in zip(batch_ids, statuses)
+            if status not in BATCH_FINAL_STATUSES
+        ]
+        if cancel_on_timeout:
+            self._cancel_batches(self.pending_batch_ids)
+
+        answered = set()
+        responses = {}
+        for batch_id, status in zip(batch_ids, statuses):
+            if status not in BATCH_FINAL_STATUSES:
+                continue
+
+            batch_result = self.model.get_batch_results(batch_id)
+            for custom_id, llm_outputs in batch_result.outputs.items():
+                index = int(custom_id)
+                answered.add(index)
+                self._record_output(
+                    result[index], llm_outputs[0], variable_values_list[index]
+                )
+                responses[index] = llm_outputs
+            for custom_id, message in batch_result.errors.items():
+                index = int(custom_id)
+                answered.add(index)
+                self._record_failure(result[index], "query", BatchRequestError(message))
+
+        for batch_id, status in zip(batch_ids, statuses):
+            if status == BATCH_COMPLETED:
+                continue
+            logger.warning(f"Batch job {batch_id} is {status}")
+
+        for i in indices:
+            if i not in answered:
+                self._record_failure(
+                    result[i],
+                    "query",
+                    BatchRequestError("The batch job didn't answer this request"),
+                )
+
+        self._score_results(result)
+        self._cache_outputs(result, responses)
+        self._count_results(result)
+        return result
+
+    def _split_batches(self, result: list[dict], indices: list[int]) -> list[list[int]]:
+        """Splits the traces to send into batch jobs, bounded both by the number of
+        requests and by the input size a job of the model accepts."""
+        max_size = self.model.max_batch_size or len(indices)
+        max_bytes = self.model.max_batch_bytes
+
+        batches = []
+        batch_bytes = 0
+        for i in indices:
+            request_bytes = 0
+            if max_bytes is not None:
+                request_bytes = self.model.batch_request_size(
+                    str(i), result[i]["llm_input"]
+                )
+
+            # A single request larger than `max_bytes` gets a job of its own
+            if (
+                batches
+                and len(batches[-1]) < max_size
+                and (max_bytes is None or batch_bytes + request_bytes <= max_bytes)
+            ):
+                batches[-1].append(i)
+                batch_bytes += request_bytes
+            else:
+                batches.append([i])
+                batch_bytes = request_bytes
+
+        return batches
+
+    def _cancel_batches(self, batch_ids: list[str]):
+        for batch_id in batch_ids:
+            try:
+                self.model.cancel_batch(batch_id)
+            except Exception as e:
+                logger.warning(f"Couldn't cancel batch job {batch_id} ({e})")
+            else:
+                logger.warning(f"Cancelled batch job {batch_id} after the timeout")
+
+    def _wait_for_batches(
+        self, batch_ids: list[str], poll_interval: float, timeout: float | None
+    ) -> list[str]:
+        """Polls the batch jobs until all of them are finished or the timeout is
+        reached. Returns the last seen status of every job."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        statuses = [None] * len(batch_ids)
+        while True:
+            for i, batch_id in enumerate(batch_ids):
+                if statuses[i] not in BATCH_FINAL_STATUSES:
+                    statuses[i] = self.model.get_batch_status(batch_id)
+
+            if all(status in BATCH_FINAL_STATUSES for status in statuses):
+                return statuses
+            if deadline is not None and time.monotonic() + poll_interval > deadline:
+                return statuses
+            time.sleep(poll_interval)
+
+    def _query_with_retries(self, formatted_template: str) -> list[str]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.model.query(formatted_template)
+            except Exception as e:
+                if attempt == self.max_retries or not self._is_retryable(e):
+                    raise
+                delay = self._retry_delay(attempt)
+                logger.warning(f"LLM call failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    async def _query_with_retries_async(self, formatted_template: str) -> list[str]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self.model.query(formatted_template)
+            except Exception as e:
+                if attempt == self.max_retries or not self._is_retryable(e):
+                    raise
+                delay = self._retry_delay(attempt)
+                logger.warning(f"LLM call failed ({e}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    def _is_retryable(self, error: Exception) -> bool:
+        # A model with a rate limiter has already retried its rate-limited calls
+        if is_rate_limit_error(error) and getattr(self.model, "rate_limiter", None):
+            return False
+        return is_transient_error(error)
+
+    def _retry_delay(self, attempt: int) -> float:
+        # Full jitter keeps concurrent retries from hitting the provider in lockstep
+        return random.uniform(
+            0, min(self.retry_backoff_max, self.retry_backoff * 2**attempt)
+        )
+
+    def _record_output(
+        self,
+        entry: dict,
+        llm_output: str,
+        variable_values: Mapping[str, str | list[str]],
+    ):
+        entry["llm_output"] = llm_output
+        try:
+            entry["score"] = self.parse_output(llm_output, variable_values)
+        except Exception as e:
+            self._record_failure(entry, "parse", e)
+
+    def _score_results(self, result: list[dict]):
+        """Called once all outputs of a run are recorded. Evaluators that score all
+        traces at once override it, the scores are set by `parse_output` otherwise.
+        """
+
+    def _apply_cached(
+        self,
+        result: list[dict],
+        variable_values_list: list[Mapping[str, str | list[str]]],
+    ) -> list[int]:
+        """Records the outputs of all prompts found in the response cache. Returns
+        the indices of the traces that still have to be sent."""
+        self.num_cached = 0
+        # Traces that already failed, e.g. because of their token count, aren't sent
+        indices = [i for i, entry in enumerate(result) if "error" not in entry]
+        if self.response_cache is None:
+            return indices
+
+        keys = {
+            i: response_cache_key(self.model, result[i]["llm_input"]) for i in indices
+        }
+        cached = self.response_cache.get_many(list(keys.values()))
+
+        indices = []
+        for i, key in keys.items():
+            if key in cached:
+                self._record_output(result[i], cached[key][0], variable_values_list[i])
+                self.num_cached += 1
+            else:
+                indices.append(i)
+
+        return indices
+
+    def _cache_outputs(self, result: list[dict], responses: dict[int, list[str]]):
+        """Stores the outputs of a run in the response cache at once. Outputs that
+        couldn't be parsed aren't cached, so they are requested again next time."""
+        if self.response_cache is None:
+            return
+
+        self.response_cache.put_many(
+            {
+                response_cache_key(self.model, result[i]["llm_input"]): llm_outputs
+                for i, llm_outputs in responses.items()
+                if "error" not in result[i]
+            }
+        )
+
+    def _record_failure(self, entry: dict, stage: str, error: Exception):
+        logger.error(f"{type(error).__name__}: {error}")
+        entry["error"] = {
+            "stage": stage,
+            "type": type(error).__name__,
+            "message": str(error),
+        }
+
+    def _count_results(self, result: list[Mapping]):
+        self.num_failed = sum(1 for entry in result if "error" in entry)
+        self.num_succeeded = len(result) - self.num_failed
+        if self.num_failed:
+            logger.warning(f"{self.num_failed} of {len(result)} traces failed")
+
+    def _prepare_results(
+        self, variable_values_list: list[Mapping[str, str | list[str]]]
+    ) -> list[dict]:
+        """Formats all prompts and checks their token counts before any request is
+        sent. Returns the input values and prompts, outputs are added as they come.
+        Traces whose prompt exceeds the context limit get an `error` record. If the
+        tokenizer can't be loaded, e.g. offline, tokens aren't counted.
+        """
+        formatted_templates = [
+            self.format_template(**variable_values)
+            for variable_values in variable_values_list
+        ]
+        result = [
+            {**variable_values, "llm_input": formatted_template}
+            for variable_values, formatted_template in zip(
+                variable_values_list, formatted_templates
+            )
+        ]
+
+        self.num_input_tokens = 0
+        token_counts = None
+        if self.token_counter is not None:
+            try:
+                token_counts = self.token_counter.count(formatted_templates)
+            except Exception as e:
+                logger.warning(f"Prompt tokens aren't counted: {e}")
+
+        if token_counts is not None:
+            for entry, token_count in zip(result, token_counts):
+                entry["llm_input_tokens"] = token_count
+                # Only the prompts that are too long fail, the rest is still sent
+                error = self.token_counter.limit_error(token_count)
+                if error is not None:
+                    self._record_failure(entry, "tokens", error)
+            self.num_input_tokens = sum(token_counts)
 
         return result
 
@@ -0,0 +1,125 @@
+import json
+import logging
+from collections.abc import Mapping
+from json.decoder import JSONDecodeError
+
+from lynxius_evals.evaluators.answer_correctness_eval import AnswerCorrectnessEval
+from lynxius_evals.evaluators.context_precision_eval import (
+    DEFAULT_NEAR_DUPLICATE_THRESHOLD,
+    ContextPrecisionEval,
+)
+from lynxius_evals.evaluators.llm_based_eval import LLMBasedEval
+from lynxius_evals.models.eval_model import AsyncEvalModel, EvalModel
+from lynxius_evals.prompts.answer_correctness_prompt import ANSWER_CORRECTNESS_TEMPLATE
+from lynxius_evals.prompts.context_precision_prompt import CONTEXT_PRECISION_TEMPLATE
+from lynxius_evals.prompts.eval_prompt import EvalPromptTemplate
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CORRECTNESS = "answer_correctness"
+CONTEXT_PRECISION = "context_precision"
+
+
+class RagEval(LLMBasedEval):
+    """A `RagEval` evaluator class that judges `AnswerCorrectnessEval` and
+    `ContextPrecisionEval` of a trace with a single LLM call. The query, reference and
+    contexts are sent once instead of once per metric, which roughly halves the
+    number of requests and input tokens of a RAG evaluation.
+
+    The judge answers with a JSON object that holds the verdicts of every metric
+    under the metric name. Each verdict is scored by the `parse_output` of the
+    corresponding evaluator, so the scores match the ones of separate runs. The
+    `score` of a trace is a dict of metric names to scores, use `split_results` to
+    get the results of every metric in the format of its own evaluator.
+    """
+
+    def __init__(
+        self,
+        model: EvalModel | AsyncEvalModel,
+        template: EvalPromptTemplate,
+        near_duplicate_threshold: float | None = DEFAULT_NEAR_DUPLICATE_THRESHOLD,
+        max_context_tokens: int | None = None,
+        **kwargs,
+    ):
+        """
+        Args:
+            near_duplicate_threshold: See `ContextPrecisionEval`.
+
+            max_context_tokens: See `ContextPrecisionEval`.
+
+        The remaining arguments are passed down to `LLMBasedEval`.
+        """
+        super().__init__(model, template, **kwargs)
+
+        self.evaluators = {
+            ANSWER_CORRECTNESS: AnswerCorrectnessEval(
+                model, ANSWER_CORRECTNESS_TEMPLATE
+            ),
+            CONTEXT_PRECISION: ContextPrecisionEval(
+                model,
+                CONTEXT_PRECISION_TEMPLATE,
+                near_duplicate_threshold=near_duplicate_threshold,
+                max_context_tokens=max_context_tokens,
+                token_counter=self.token_counter,
+            ),
+        }
+
+    def format_template(self, **variable_values: Mapping[str, str | list[str]]):
+        variable_values_copy = {
+            k: v for k, v in variable_values.items() if k != "contexts"
+        }
+        variable_values_copy["context"] = self.evaluators[
+            CONTEXT_PRECISION
+        ].format_context(variable_values["contexts"])
+
+        return self.template.format(**variable_values_copy)
+
+    def _prepare_results(
+        self, variable_values_list: list[Mapping[str, str | list[str]]]
+    ) -> list[dict]:
+        result = super()._prepare_results(variable_values_list)
+        for entry in result:
+            error = self.evaluators[CONTEXT_PRECISION].context_error(entry["contexts"])
+            if error is not None and "error" not in entry:
+                self._record_failure(entry, "tokens", error)
+
+        return result
+
+    def parse_output(
+        self, output: str, variable_values: Mapping[str, str | list[str]]
+    ) -> dict[str, float]:
+        verdicts = json.loads(output)
+        return {
+            metric: evaluator.parse_output(
+                json.dumps(verdicts[metric]), variable_values
+            )
+            for metric, evaluator in self.evaluators.items()
+        }
+
+    def split_results(self, result: list[Mapping]) -> dict[str, list[dict]]:
+        """
+        Splits the results of `evaluate` into the results of every metric. The
+        `llm_output` of a metric result holds only the verdicts of that metric and
+        its `score` is the metric score. Failed traces keep their `error` record in
+        the results of every metric.
+        """
+        split = {metric: [] for metric in self.evaluators}
+        for entry in result:
+            try:
+                verdicts = json.loads(entry["llm_output"])
+            except (KeyError, JSONDecodeError):
+                verdicts = None
+
+            for metric, metric_result in split.items():
+                metric_entry = {
+                    k: v for k, v in entry.items() if k not in ["llm_output", "score"]
+                }
+                if isinstance(verdicts, dict) and metric in verdicts:
+                    metric_entry["llm_output"] = json.dumps(verdicts[metric])
+                elif "llm_output" in entry:
+                    metric_entry["llm_output"] = entry["llm_output"]
+                if "score" in entry:
+                    metric_entry["score"] = entry["score"][metric]
+                metric_result.append(metric_entry)
+
+        return split
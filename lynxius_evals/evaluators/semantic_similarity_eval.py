@@ -1,8 +1,8 @@
-from collections.abc import Mapping
+from collections.abc import Mapping, Sequence
 
 import numpy as np
 
-from lynxius_evals.models.eval_model import EvalModel
+from lynxius_evals.models.eval_model import EvalModel, embeddings_to_array
 
 
 class SemanticSimilarityEval:
@@ -11,55 +11,151 @@ class SemanticSimilarityEval:
     is in the range of [0.0, 1.0].
     """
 
-    def __init__(self, model: EvalModel) -> None:
+    def __init__(
+        self,
+        model: EvalModel,
+        reference_embeddings: Mapping[str, Sequence[float]] | None = None,
+    ) -> None:
+        """
+        Args:
+            model (EvalModel): The model used to embed texts.
+
+            reference_embeddings (Mapping[str, Sequence[float]] | None): Precomputed
+                embeddings keyed by reference text, e.g. of all references of a
+                dataset. Pinned references are never embedded again.
+        """
         self.model = model
+        self.reference_embeddings = {
+            reference: np.array(embedding, dtype=np.float32)
+            for reference, embedding in (reference_embeddings or {}).items()
+        }
+
+    def pin_references(self, references: list[str]) -> np.ndarray:
+        """Embeds the references which aren't pinned yet and keeps their embeddings
+        for all following calls.
+
+        Returns:
+            np.ndarray: A `(len(references), dim)` matrix of reference embeddings.
+        """
+        unpinned = [
+            reference
+            for reference in dict.fromkeys(references)
+            if reference not in self.reference_embeddings
+        ]
+        if unpinned:
+            for reference, embedding in zip(unpinned, self.model.embed_array(unpinned)):
+                self.reference_embeddings[reference] = np.array(embedding)
+
+        return self._reference_matrix(references, {})
+
+    def similarity_matrix(
+        self, outputs: list[str], references: list[str] | None = None
+    ) -> np.ndarray:
+        """Scores every output against every reference in one pass. Only outputs
+        and references which aren't pinned yet are embedded.
+
+        Args:
+            outputs (list[str]): The outputs to score.
+
+            references (list[str] | None): The references to score against. All
+                pinned references, in the order they were pinned, if not provided.
+
+        Returns:
+            np.ndarray: A `(len(outputs), len(references))` matrix of similarities
+            in the range of [0.0, 1.0].
+        """
+        if references is None:
+            references = list(self.reference_embeddings)
+        if not outputs or not references:
+            return np.zeros((len(outputs), len(references)), dtype=np.float32)
+
+        reference_matrix = self.pin_references(references)
+        output_matrix = self.model.embed_array(outputs)
+
+        # See `_cosine_similarity`, normalizing first turns it into a single matmul
+        reference_matrix = reference_matrix / np.linalg.norm(
+            reference_matrix, axis=1, keepdims=True
+        )
+        output_matrix = output_matrix / np.linalg.norm(
+            output_matrix, axis=1, keepdims=True
+        )
+
+        return np.clip(output_matrix @ reference_matrix.T, 0.0, 1.0)
 
     def evaluate(
         self,
         variable_values_list: list[Mapping[str, str]],
     ) -> list[float]:
+        references = [values["reference"] for values in variable_values_list]
+        outputs = [values["output"] for values in variable_values_list]
 
-        texts_to_embed = []
-        for variable_values in variable_values_list:
-            texts_to_embed.append(variable_values["reference"])
-            texts_to_embed.append(variable_values["output"])
+        # Distinct references that aren't pinned are embedded along with outputs
+        unpinned = [
+            reference
+            for reference in dict.fromkeys(references)
+            if reference not in self.reference_embeddings
+        ]
+        embeddings = self.model.embed_array(unpinned + outputs)
 
-        embeddings = self.model.embed(texts_to_embed)
+        assert len(embeddings) == len(unpinned) + len(outputs)
 
-        assert len(embeddings) == len(variable_values_list) * 2
+        reference_matrix = self._reference_matrix(
+            references, dict(zip(unpinned, embeddings[: len(unpinned)]))
+        )
+        similarities = self._cosine_similarity(
+            reference_matrix, embeddings[len(unpinned) :]
+        )
 
         result = []
-        for i in range(0, len(embeddings), 2):
-            reference = variable_values_list[i // 2]["reference"]
-            output = variable_values_list[i // 2]["output"]
-            contexts = variable_values_list[i // 2]["contexts"]
-            vec1 = np.array(embeddings[i])
-            vec2 = np.array(embeddings[i + 1])
-
-            # According to OpenAI docs, their embeddings are already normalized to have
-            # a norm of 1, so cosine similarity (as well as Euclidian distance) is
-            # effectively a dot product:
-            # https://platform.openai.com/docs/guides/embeddings/which-distance-function-should-i-use
-            # We divide by the product of the two norms anyway to make a potential
-            # future transition to a non-normalized embeddings provider easier.
-            cosine_similarity = np.dot(vec1, vec2) / (
-                np.linalg.norm(vec1) * np.linalg.norm(vec2)
-            )
-
-            # In theory, cosine similarity is in the range of [-1, 1]. In practice
-            # however, embeddings produced by LLMs tend to never have a negative cosine
-            # similarity. This bias is most probably an artefact of various training
-            # techniques like Max Pooling used while training. In case we get a
-            # negative value, we simply clamp it to 0.
-            cosine_similarity = np.clip(cosine_similarity, 0.0, 1.0)
-
+        for variable_values, similarity in zip(variable_values_list, similarities):
             result.append(
                 {
-                    "reference": reference,
-                    "output": output,
-                    "contexts": contexts,
-                    "similarity": float(cosine_similarity),
+                    "reference": variable_values["reference"],
+                    "output": variable_values["output"],
+                    "contexts": variable_values["contexts"],
+                    "similarity": float(similarity),
                 }
             )
 
         return result
+
+    def _reference_matrix(
+        self, references: list[str], embedded: Mapping[str, np.ndarray]
+    ) -> np.ndarray:
+        if not references:
+            return embeddings_to_array([])
+
+        return np.stack(
+            [
+                (
+                    self.reference_embeddings[reference]
+                    if reference in self.reference_embeddings
+                    else embedded[reference]
+                )
+                for reference in references
+            ]
+        ).astype(np.float32, copy=False)
+
+    @staticmethod
+    def _cosine_similarity(references: np.ndarray, outputs: np.ndarray) -> np.ndarray:
+        """Computes the cosine similarity of every row of `references` to the same
+        row of `outputs` at once."""
+        references = np.asarray(references, dtype=np.float32)  # (N, 1536)
+        outputs = np.asarray(outputs, dtype=np.float32)  # (N, 1536)
+
+        # According to OpenAI docs, their embeddings are already normalized to have
+        # a norm of 1, so cosine similarity (as well as Euclidian distance) is
+        # effectively a dot product:
+        # https://platform.openai.com/docs/guides/embeddings/which-distance-function-should-i-use
+        # We divide by the product of the two norms anyway to make a potential
+        # future transition to a non-normalized embeddings provider easier.
+        cosine_similarity = np.einsum("ij,ij->i", references, outputs) / (
+            np.linalg.norm(references, axis=1) * np.linalg.norm(outputs, axis=1)
+        )
+
+        # In theory, cosine similarity is in the range of [-1, 1]. In practice
+        # however, embeddings produced by LLMs tend to never have a negative cosine
+        # similarity. This bias is most probably an artefact of various training
+        # techniques like Max Pooling used while training. In case we get a
+        # negative value, we simply clamp it to 0.
+        return np.clip(cosine_similarity, 0.0, 1.0)
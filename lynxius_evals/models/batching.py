@@ -0,0 +1,57 @@
+from collections.abc import Callable, Iterator
+import concurrent.futures
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+def chunk_inputs(
+    input: list[str], max_size: int, max_tokens: int
+) -> Iterator[tuple[int, int]]:
+    """Splits `input` into consecutive chunks bounded both by the number of items
+    and by the number of tokens.
+
+    Every token is at least one byte long, so the UTF-8 length of a text is used as a
+    cheap upper bound of its token count. A single text longer than `max_tokens` gets
+    a chunk of its own.
+
+    Args:
+        input (list[str]): The texts to split.
+        max_size (int): The maximum number of texts per chunk.
+        max_tokens (int): The maximum number of tokens per chunk.
+
+    Returns:
+        Iterator[tuple[int, int]]: `(start, end)` slice bounds of every chunk.
+    """
+    start = 0
+    tokens = 0
+    for i, text in enumerate(input):
+        text_tokens = len(text.encode("utf-8"))
+        if i > start and (i - start >= max_size or tokens + text_tokens > max_tokens):
+            yield start, i
+            start = i
+            tokens = 0
+        tokens += text_tokens
+
+    if start < len(input):
+        yield start, len(input)
+
+
+def dispatch_chunks(
+    fn: Callable[[int, int], list[T]],
+    chunks: list[tuple[int, int]],
+    max_workers: int | None,
+) -> list[T]:
+    """Calls `fn(start, end)` for every chunk, using up to `max_workers` threads,
+    and concatenates the results in the original chunk order."""
+    if len(chunks) == 1:
+        return fn(*chunks[0])
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(fn, start, end) for start, end in chunks]
+
+        result = []
+        for future in futures:
+            result.extend(future.result())
+
+    return result
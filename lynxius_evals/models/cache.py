@@ -0,0 +1,366 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .eval_model import EvalModel, embeddings_to_array
+
+DEFAULT_EMBEDDING_CACHE_SIZE = 100_000
+DEFAULT_RESPONSE_CACHE_SIZE = 1_000_000
+DEFAULT_RESPONSE_CACHE_TTL = 30 * 24 * 3600.0
+# SQLite limits the number of bound parameters, so `IN (...)` lists are split
+SQLITE_CHUNK_SIZE = 500
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _execute_in_chunks(
+    db: sqlite3.Connection, sql: str, values: list, params: tuple = ()
+):
+    """Runs `sql` for every chunk of at most `SQLITE_CHUNK_SIZE` values and yields
+    the cursors. `{placeholders}` in `sql` is replaced by a placeholder per value
+    of the chunk, which are bound after `params`."""
+    for start in range(0, len(values), SQLITE_CHUNK_SIZE):
+        chunk = values[start : start + SQLITE_CHUNK_SIZE]
+        placeholders = ", ".join("?" for _ in chunk)
+        yield db.execute(sql.format(placeholders=placeholders), [*params, *chunk])
+
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        max_size: int = DEFAULT_EMBEDDING_CACHE_SIZE,
+        path: str | None = None,
+    ):
+        """
+        A content-addressed embedding cache. Embeddings are keyed by the name of the
+        embedding model and the SHA-256 hash of the embedded text.
+
+        Args:
+            max_size (int): How many embeddings to keep in the in-process LRU cache.
+
+            path (str | None): Optional path to an SQLite database used as a
+                persistent second-level store. Embeddings are stored as float32 blobs,
+                so they survive between runs and can be shared between processes.
+        """
+        if max_size < 0:
+            raise ValueError("max_size can't be negative")
+
+        self.max_size = max_size
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+        self._lru: OrderedDict[tuple[str, str], np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, "
+                "text_hash TEXT NOT NULL, "
+                "vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text_hash))"
+            )
+            self._db.commit()
+
+    def get_many(self, model: str, texts: list[str]) -> list[np.ndarray | None]:
+        """Looks up embeddings for `texts`. Returns `None` for every cache miss."""
+        keys = [(model, hash_text(text)) for text in texts]
+
+        result = [None] * len(keys)
+        with self._lock:
+            missing = {}
+            for i, key in enumerate(keys):
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    result[i] = vector
+                else:
+                    missing.setdefault(key, []).append(i)
+
+            if missing and self._db is not None:
+                for key, vector in self._load(model, [k[1] for k in missing]):
+                    self._remember(key, vector)
+                    for i in missing.pop(key):
+                        result[i] = vector
+
+            num_misses = sum(len(indices) for indices in missing.values())
+            self.misses += num_misses
+            self.hits += len(keys) - num_misses
+
+        return result
+
+    def put_many(self, model: str, texts: list[str], vectors: list[list[float]]):
+        # Copy the vectors, so rows of a batch matrix don't keep all of it alive
+        entries = {
+            (model, hash_text(text)): np.array(vector, dtype=np.float32)
+            for text, vector in zip(texts, vectors)
+        }
+
+        with self._lock:
+            for key, vector in entries.items():
+                self._remember(key, vector)
+
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                    [(k[0], k[1], v.tobytes()) for k, v in entries.items()],
+                )
+                self._db.commit()
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._lru)}
+
+    def clear(self):
+        """Clears the in-process cache and resets the counters. The persistent
+        store is left untouched."""
+        with self._lock:
+            self._lru.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _remember(self, key: tuple[str, str], vector: np.ndarray):
+        if self.max_size == 0:
+            return
+
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    def _load(self, model: str, text_hashes: list[str]):
+        chunks = _execute_in_chunks(
+            self._db,
+            "SELECT text_hash, vector FROM embeddings "
+            "WHERE model = ? AND text_hash IN ({placeholders})",
+            text_hashes,
+            (model,),
+        )
+        for rows in chunks:
+            for text_hash, blob in rows:
+                yield (model, text_hash), np.frombuffer(blob, dtype=np.float32)
+
+
+class CachedEvalModel(EvalModel):
+    def __init__(self, model: EvalModel, cache: EmbeddingCache | None = None):
+        """
+        Wraps any `EvalModel` and memoizes its `embed` calls. Chat completions are
+        passed through to the wrapped model untouched.
+
+        Args:
+            model (EvalModel): The model to wrap.
+
+            cache (EmbeddingCache | None): The cache to use. Pass the same instance to
+                several models or evaluators to share it between them.
+        """
+        self.model = model
+        self.cache = cache if cache is not None else EmbeddingCache()
+
+    @property
+    def embedding_model(self) -> str:
+        return getattr(self.model, "embedding_model", type(self.model).__name__)
+
+    def query(self, prompt: str) -> list[str]:
+        return self.model.query(prompt)
+
+    def embed(self, input: list[str]) -> list[list[float]]:
+        return [vector.tolist() for vector in self._embed_vectors(input)]
+
+    def embed_array(self, input: list[str]) -> np.ndarray:
+        vectors = self._embed_vectors(input)
+        if not vectors:
+            return embeddings_to_array([])
+        return np.stack(vectors)
+
+    def _embed_vectors(self, input: list[str]) -> list[np.ndarray]:
+        vectors = self.cache.get_many(self.embedding_model, input)
+
+        # Every distinct missing text is embedded exactly once
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(input[i], []).append(i)
+
+        if missing:
+            texts = list(missing)
+            embeddings = self.model.embed_array(texts)
+            self.cache.put_many(self.embedding_model, texts, embeddings)
+
+            for text, vector in zip(texts, embeddings):
+                for i in missing[text]:
+                    vectors[i] = vector
+
+        return vectors
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        path: str | None = None,
+        ttl: float | None = DEFAULT_RESPONSE_CACHE_TTL,
+        max_size: int = DEFAULT_RESPONSE_CACHE_SIZE,
+    ):
+        """
+        A persistent cache of LLM judge responses, stored in SQLite. Responses are
+        keyed by `response_cache_key`, so a prompt is answered from the cache only
+        if it was sent to the same model with the same parameters.
+
+        Args:
+            path (str | None): Path to the SQLite database. The cache lives in
+                memory only if not provided.
+
+            ttl (float | None): How many seconds a response is kept. Responses are
+                kept until evicted by size if `None`.
+
+            max_size (int): How many responses to keep. The least recently used
+                responses are evicted first.
+        """
+        if max_size < 0:
+            raise ValueError("max_size can't be negative")
+
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, "
+            "responses TEXT NOT NULL, "
+            "created REAL NOT NULL, "
+            "accessed REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self._db.commit()
+
+        with self._lock:
+            self._evict_expired()
+            (self._size,) = self._db.execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()
+
+    def get_many(self, keys: list[str]) -> dict[str, list[str]]:
+        """Looks up responses for `keys`. Expired responses count as misses."""
+        result = {}
+        with self._lock:
+            now = time.time()
+            chunks = _execute_in_chunks(
+                self._db,
+                "SELECT key, responses, created FROM responses "
+                "WHERE key IN ({placeholders})",
+                list(dict.fromkeys(keys)),
+            )
+            for rows in chunks:
+                for key, responses, created in rows:
+                    if self.ttl is None or now - created <= self.ttl:
+                        result[key] = json.loads(responses)
+
+            if result:
+                self._db.executemany(
+                    "UPDATE responses SET accessed = ? WHERE key = ?",
+                    [(now, key) for key in result],
+                )
+                self._db.commit()
+
+            num_hits = sum(1 for key in keys if key in result)
+            self.hits += num_hits
+            self.misses += len(keys) - num_hits
+
+        return result
+
+    def put(self, key: str, responses: list[str]):
+        self.put_many({key: responses})
+
+    def put_many(self, items: dict[str, list[str]]):
+        """Stores the responses of several keys in a single transaction."""
+        if self.max_size == 0 or not items:
+            return
+
+        with self._lock:
+            now = time.time()
+            chunks = _execute_in_chunks(
+                self._db,
+                "SELECT COUNT(*) FROM responses WHERE key IN ({placeholders})",
+                list(items),
+            )
+            num_existing = sum(rows.fetchone()[0] for rows in chunks)
+
+            self._db.executemany(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                [
+                    (key, json.dumps(responses), now, now)
+                    for key, responses in items.items()
+                ],
+            )
+            self._size += len(items) - num_existing
+
+            if self._size > self.max_size:
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                    (self._size - self.max_size,),
+                )
+                self._size = self.max_size
+            self._db.commit()
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": self._size}
+
+    def clear(self):
+        """Deletes all responses and resets the counters."""
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _evict_expired(self):
+        if self.ttl is None:
+            return
+
+        self._db.execute(
+            "DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,)
+        )
+        self._db.commit()
+
+
+def response_cache_key(model, prompt) -> str:
+    """Keys a judge response by the model name, its sampling parameters and the
+    hash of the rendered prompt."""
+    # Wrappers such as `CachedEvalModel` keep the wrapped model in `model`
+    while getattr(model, "model", None) is not None and not isinstance(
+        model.model, str
+    ):
+        model = model.model
+
+    parameters = [
+        getattr(model, "model", type(model).__name__),
+        getattr(model, "temperature", None),
+        getattr(model, "response_format", None),
+        hash_text(prompt if isinstance(prompt, str) else json.dumps(prompt)),
+    ]
+    return hash_text(json.dumps(parameters))
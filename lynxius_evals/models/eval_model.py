@@ -1,4 +1,31 @@
 from abc import ABC, abstractmethod
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+
+import numpy as np
+
+# Normalized statuses of a batch job
+BATCH_IN_PROGRESS = "in_progress"
+BATCH_COMPLETED = "completed"
+BATCH_FAILED = "failed"
+BATCH_EXPIRED = "expired"
+BATCH_CANCELLED = "cancelled"
+BATCH_FINAL_STATUSES = [BATCH_COMPLETED, BATCH_FAILED, BATCH_EXPIRED, BATCH_CANCELLED]
+
+
+def embeddings_to_array(embeddings: list[list[float]]) -> np.ndarray:
+    """Converts embeddings to a `(len(embeddings), dim)` float32 matrix."""
+    if len(embeddings) == 0:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def disable_query_retries(model):
+    """Stops a model from retrying failed queries on its own, if it can. Used by
+    callers that retry them themselves."""
+    disable = getattr(model, "disable_query_retries", None)
+    if disable is not None:
+        disable()
 
 
 class EvalModel(ABC):
@@ -40,3 +67,166 @@ class EvalModel(ABC):
             point numbers representing the embedding for that sequence.
         """
         raise NotImplementedError
+
+    def embed_array(self, input: list[str]) -> np.ndarray:
+        """Create an embedding call and return the embeddings as one contiguous
+        float32 matrix.
+
+        The default implementation converts the result of `embed`. Subclasses
+        should override it if they can produce the matrix without building Python
+        lists of floats first.
+
+        Args:
+            input (list[str]): A list of sequences to embed.
+
+        Returns:
+            np.ndarray: A `(len(input), dim)` float32 matrix with the embedding of
+            every input sequence in its rows.
+        """
+        return embeddings_to_array(self.embed(input))
+
+
+class AsyncEvalModel(ABC):
+    """An asyncio-native abstraction for a language model."""
+
+    @abstractmethod
+    async def query(self, prompt: str) -> list[str]:
+        """Create a chat completion without blocking the event loop.
+
+        Args:
+            prompt (str): The prompt to pass to the language model.
+
+        Raises:
+            NotImplementedError: When the method is not overridden in subclasses.
+
+        Returns:
+            list[str]: The model chat responses.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def embed(self, input: list[str]) -> list[list[float]]:
+        """Create an embedding call without blocking the event loop.
+
+        Args:
+            input (list[str]): A list of sequences to embed.
+
+        Raises:
+            NotImplementedError: When the method is not overridden in subclasses.
+
+        Returns:
+            list[list[float]]: For every input sequence returns a list floating
+            point numbers representing the embedding for that sequence.
+        """
+        raise NotImplementedError
+
+    async def embed_array(self, input: list[str]) -> np.ndarray:
+        """Create an embedding call without blocking the event loop and return the
+        embeddings as one contiguous float32 matrix.
+
+        Args:
+            input (list[str]): A list of sequences to embed.
+
+        Returns:
+            np.ndarray: A `(len(input), dim)` float32 matrix with the embedding of
+            every input sequence in its rows.
+        """
+        return embeddings_to_array(await self.embed(input))
+
+
+class BatchRequestError(Exception):
+    """Exception raised when a single request of a batch job failed."""
+
+
+@dataclass
+class BatchResult:
+    """The outcome of a batch job.
+
+    Attributes:
+        outputs: The model chat responses keyed by request id.
+        errors: The error messages of failed requests keyed by request id.
+    """
+
+    outputs: dict[str, list[str]] = field(default_factory=dict)
+    errors: dict[str, str] = field(default_factory=dict)
+
+
+class BatchEvalModel(ABC):
+    """An abstraction for a language model that answers many prompts in a single
+    offline batch job, trading latency for throughput and cost."""
+
+    # The maximum number of requests in a single batch job, unlimited if `None`
+    max_batch_size: int | None = None
+    # The maximum size of the input of a single batch job in bytes, as measured by
+    # `batch_request_size`, unlimited if `None`
+    max_batch_bytes: int | None = None
+
+    @abstractmethod
+    def submit_batch(self, prompts: Mapping[str, str]) -> str:
+        """Submit a batch job of chat completions.
+
+        Args:
+            prompts (Mapping[str, str]): The prompts keyed by request id.
+
+        Raises:
+            NotImplementedError: When the method is not overridden in subclasses.
+
+        Returns:
+            str: The id of the batch job.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_batch_status(self, batch_id: str) -> str:
+        """Get the status of a batch job.
+
+        Args:
+            batch_id (str): The id of the batch job.
+
+        Raises:
+            NotImplementedError: When the method is not overridden in subclasses.
+
+        Returns:
+            str: `BATCH_IN_PROGRESS` or one of `BATCH_FINAL_STATUSES`.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_batch_results(self, batch_id: str) -> BatchResult:
+        """Get the responses of a finished batch job. Expired and cancelled jobs
+        may have responses for some of their requests.
+
+        Args:
+            batch_id (str): The id of the batch job.
+
+        Raises:
+            NotImplementedError: When the method is not overridden in subclasses.
+
+        Returns:
+            BatchResult: The responses and errors keyed by request id.
+        """
+        raise NotImplementedError
+
+    def batch_request_size(self, custom_id: str, prompt: str) -> int:
+        """Get the size a request takes in the input of a batch job. Only used if
+        `max_batch_bytes` is set.
+
+        Args:
+            custom_id (str): The request id.
+            prompt (str): The prompt of the request.
+
+        Returns:
+            int: The size of the request in bytes.
+        """
+        return len(prompt.encode("utf-8"))
+
+    def cancel_batch(self, batch_id: str):
+        """Cancel a batch job that is still running.
+
+        Args:
+            batch_id (str): The id of the batch job.
+
+        Raises:
+            NotImplementedError: When the provider can't cancel batch jobs.
+        """
+        raise NotImplementedError
@@ -1,25 +1,81 @@
-from openai import OpenAI
+import asyncio
+import base64
+import json
+import tempfile
+from collections.abc import Mapping
 
-from .eval_model import EvalModel
+import numpy as np
+from openai import AsyncOpenAI, OpenAI
+
+from .batching import chunk_inputs, dispatch_chunks
+from .eval_model import (
+    BATCH_CANCELLED,
+    BATCH_COMPLETED,
+    BATCH_EXPIRED,
+    BATCH_FAILED,
+    BATCH_IN_PROGRESS,
+    AsyncEvalModel,
+    BatchEvalModel,
+    BatchResult,
+    EvalModel,
+    embeddings_to_array,
+)
+from .rate_limit import RateLimiter
+from .tokens import TokenCounter
 
 DEFAULT_OPENAI_MODEL = "gpt-4o"
 DEFAULT_TEMPERATURE = 0.0
 DEFAULT_OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
 DEFAULT_MAX_TOKENS_GPT_4 = 4096
 DEFAULT_RESPONSE_FORMAT = "text"
+# OpenAI accepts at most 2048 inputs and 300k tokens summed across all inputs in a
+# single embeddings request.
+DEFAULT_EMBEDDING_BATCH_SIZE = 2048
+DEFAULT_EMBEDDING_BATCH_TOKENS = 300_000
+DEFAULT_MAX_EMBEDDING_WORKERS = 4
+# OpenAI accepts at most 50k requests and input files of at most 200 MB in a single
+# batch job
+DEFAULT_MAX_BATCH_SIZE = 50_000
+DEFAULT_MAX_BATCH_BYTES = 200_000_000
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_STATUSES = {
+    "validating": BATCH_IN_PROGRESS,
+    "in_progress": BATCH_IN_PROGRESS,
+    "finalizing": BATCH_IN_PROGRESS,
+    "cancelling": BATCH_IN_PROGRESS,
+    "completed": BATCH_COMPLETED,
+    "failed": BATCH_FAILED,
+    "expired": BATCH_EXPIRED,
+    "cancelled": BATCH_CANCELLED,
+}
 
 
-class OpenAIModel(EvalModel):
+class _OpenAIModelBase:
     def __init__(
         self,
         model: str = DEFAULT_OPENAI_MODEL,
         temperature: float = DEFAULT_TEMPERATURE,
         embedding_model: str = DEFAULT_OPENAI_EMBEDDING_MODEL,
         response_format: str = DEFAULT_RESPONSE_FORMAT,
+        embedding_batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE,
+        embedding_batch_tokens: int = DEFAULT_EMBEDDING_BATCH_TOKENS,
+        max_embedding_workers: int | None = DEFAULT_MAX_EMBEDDING_WORKERS,
+        rate_limiter: RateLimiter | None = None,
     ):
         """
         response_format can either be `default` or `json`. This value will be passed
         down to the OpenAI client.
+
+        Inputs of a single `embed` call are split into requests of at most
+        `embedding_batch_size` texts and `embedding_batch_tokens` tokens. Those
+        requests are sent concurrently, at most `max_embedding_workers` at a time.
+
+        Pass a `RateLimiter` to budget requests and tokens per minute. The same
+        limiter can be shared by several models using the same OpenAI account. The
+        limiter then retries rate-limited calls, so the OpenAI client doesn't retry
+        on its own. Evaluators that retry failed queries themselves disable the
+        client's retries of chat completions with `disable_query_retries`.
         """
 
         if response_format not in ["text", "json_object"]:
@@ -32,10 +88,33 @@ class OpenAIModel(EvalModel):
         self.temperature = temperature
         self.embedding_model = embedding_model
         self.response_format = response_format
-        self.client = OpenAI()
+        self.embedding_batch_size = embedding_batch_size
+        self.embedding_batch_tokens = embedding_batch_tokens
+        self.max_embedding_workers = max_embedding_workers
+        self.rate_limiter = rate_limiter
+        self.token_counter = TokenCounter(model)
+        self.embedding_token_counter = TokenCounter(embedding_model)
+        self.query_retries = True
+        self.client = self._create_client()
 
-    def query(self, prompt: str) -> list[str]:
+    def _create_client(self):
+        raise NotImplementedError
+
+    def _client_options(self) -> dict:
+        # Only one layer may retry HTTP 429 responses
+        return {"max_retries": 0} if self.rate_limiter is not None else {}
+
+    def disable_query_retries(self):
+        """Stops the OpenAI client from retrying chat completions. Embeddings are
+        still retried."""
+        self.query_retries = False
 
+    def _chat_completions(self):
+        if self.query_retries:
+            return self.client.chat.completions
+        return self.client.with_options(max_retries=0).chat.completions
+
+    def _build_messages(self, prompt: str) -> list[dict]:
         # Preprocess messages
         messages_processed = []
 
@@ -49,24 +128,293 @@ class OpenAIModel(EvalModel):
         else:
             messages_processed.append(prompt)
 
-        completion = self.client.chat.completions.create(
-            messages=messages_processed,
-            model=self.model,
-            temperature=self.temperature,
-            response_format={"type": self.response_format},
+        return messages_processed
+
+    def _chunk_inputs(self, input: list[str]) -> list[tuple[int, int]]:
+        return list(
+            chunk_inputs(input, self.embedding_batch_size, self.embedding_batch_tokens)
         )
 
+    def _count_prompt_tokens(self, messages: list[dict]) -> int:
+        texts = [str(message.get("content", "")) for message in messages]
+        return sum(self.token_counter.count(texts))
+
+    def _count_embedding_tokens(self, input: list[str]) -> int:
+        return sum(self.embedding_token_counter.count(input))
+
+    def _on_response(self, raw_response):
+        self.rate_limiter.update_from_headers(raw_response.headers)
+        response = raw_response.parse()
+
+        # Completion tokens count against the budget too, but are known only now
+        usage = getattr(response, "usage", None)
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        if completion_tokens:
+            self.rate_limiter.record_tokens(completion_tokens)
+
+        return response
+
+    @staticmethod
+    def _parse_completion(completion) -> list[str]:
         result = []
         for choice in completion.choices:
             result.append(choice.message.content)
 
         return result
 
+    @staticmethod
+    def _parse_embeddings(response) -> list[list[float]]:
+        # Make sure embeddings are in the same order as the inputs
+        response = sorted(response.data, key=lambda data: data.index)
+        return [data.embedding for data in response]
+
+    @staticmethod
+    def _decode_embeddings(response) -> np.ndarray:
+        """Decodes base64 embeddings straight into a float32 matrix, without
+        building Python lists of floats."""
+        if not response.data:
+            return np.empty((0, 0), dtype=np.float32)
+
+        buffers = [base64.b64decode(data.embedding) for data in response.data]
+        result = np.empty(
+            (len(buffers), len(buffers[0]) // np.dtype(np.float32).itemsize),
+            dtype=np.float32,
+        )
+        for data, buffer in zip(response.data, buffers):
+            # Make sure embeddings are in the same order as the inputs
+            result[data.index] = np.frombuffer(buffer, dtype=np.float32)
+
+        return result
+
+    @staticmethod
+    def _concatenate(arrays: list[np.ndarray]) -> np.ndarray:
+        return arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+
+
+class OpenAIModel(_OpenAIModelBase, EvalModel):
+    def _create_client(self):
+        return OpenAI(**self._client_options())
+
+    def query(self, prompt: str) -> list[str]:
+        messages = self._build_messages(prompt)
+        completion = self._create(
+            self._chat_completions(),
+            (lambda: self._count_prompt_tokens(messages)),
+            messages=messages,
+            model=self.model,
+            temperature=self.temperature,
+            response_format={"type": self.response_format},
+        )
+
+        return self._parse_completion(completion)
+
     def embed(self, input: list[str]) -> list[list[float]]:
-        response = self.client.embeddings.create(
+        if not input:
+            return []
+
+        return dispatch_chunks(
+            lambda start, end: self._embed_chunk(input[start:end]),
+            self._chunk_inputs(input),
+            self.max_embedding_workers,
+        )
+
+    def _embed_chunk(self, input: list[str]) -> list[list[float]]:
+        response = self._create(
+            self.client.embeddings,
+            (lambda: self._count_embedding_tokens(input)),
             input=input,
             model=self.embedding_model,
         )
 
-        response = [data.embedding for data in response.data]
-        return response
+        return self._parse_embeddings(response)
+
+    def embed_array(self, input: list[str]) -> np.ndarray:
+        if not input:
+            return embeddings_to_array([])
+
+        # `dispatch_chunks` concatenates lists, so every chunk is wrapped in one
+        arrays = dispatch_chunks(
+            lambda start, end: [self._embed_chunk_array(input[start:end])],
+            self._chunk_inputs(input),
+            self.max_embedding_workers,
+        )
+
+        return self._concatenate(arrays)
+
+    def _embed_chunk_array(self, input: list[str]) -> np.ndarray:
+        response = self._create(
+            self.client.embeddings,
+            (lambda: self._count_embedding_tokens(input)),
+            input=input,
+            model=self.embedding_model,
+            encoding_format="base64",
+        )
+
+        return self._decode_embeddings(response)
+
+    def _create(self, resource, count_tokens, **kwargs):
+        if self.rate_limiter is None:
+            return resource.create(**kwargs)
+
+        return self.rate_limiter.run(
+            lambda: self._on_response(resource.with_raw_response.create(**kwargs)),
+            count_tokens(),
+        )
+
+
+class OpenAIBatchModel(OpenAIModel, BatchEvalModel):
+    """An `OpenAIModel` that can also answer prompts with the OpenAI Batch API.
+    Prompts are written to a JSONL file, uploaded and submitted as a single batch
+    job, which costs less and isn't subject to per-request rate limits.
+    """
+
+    max_batch_size = DEFAULT_MAX_BATCH_SIZE
+    max_batch_bytes = DEFAULT_MAX_BATCH_BYTES
+
+    def submit_batch(self, prompts: Mapping[str, str]) -> str:
+        # The batch file is written to disk, so large batches don't pile up in memory
+        with tempfile.TemporaryFile() as batch_file:
+            for custom_id, prompt in prompts.items():
+                batch_file.write(self._batch_request(custom_id, prompt))
+
+            batch_file.seek(0)
+            input_file = self.client.files.create(
+                file=("batch.jsonl", batch_file), purpose="batch"
+            )
+
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=BATCH_COMPLETION_WINDOW,
+        )
+        return batch.id
+
+    def batch_request_size(self, custom_id: str, prompt: str) -> int:
+        return len(self._batch_request(custom_id, prompt))
+
+    def cancel_batch(self, batch_id: str):
+        self.client.batches.cancel(batch_id)
+
+    def get_batch_status(self, batch_id: str) -> str:
+        status = self.client.batches.retrieve(batch_id).status
+        return BATCH_STATUSES.get(status, BATCH_IN_PROGRESS)
+
+    def get_batch_results(self, batch_id: str) -> BatchResult:
+        batch = self.client.batches.retrieve(batch_id)
+
+        result = BatchResult()
+        for file_id in [batch.output_file_id, batch.error_file_id]:
+            if not file_id:
+                continue
+
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+
+                item = json.loads(line)
+                response = item.get("response") or {}
+                if item.get("error") or response.get("status_code") != 200:
+                    error = item.get("error") or response.get("body", {}).get("error")
+                    result.errors[item["custom_id"]] = json.dumps(error)
+                    continue
+
+                result.outputs[item["custom_id"]] = [
+                    choice["message"]["content"]
+                    for choice in response["body"]["choices"]
+                ]
+
+        return result
+
+    def _batch_request(self, custom_id: str, prompt: str) -> bytes:
+        # A line of the JSONL input file
+        request = {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": {
+                "messages": self._build_messages(prompt),
+                "model": self.model,
+                "temperature": self.temperature,
+                "response_format": {"type": self.response_format},
+            },
+        }
+        return json.dumps(request).encode("utf-8") + b"\n"
+
+
+class AsyncOpenAIModel(_OpenAIModelBase, AsyncEvalModel):
+    """An `OpenAIModel` counterpart built on `AsyncOpenAI`. It accepts the same
+    arguments, but `query` and `embed` are coroutines, so many calls can be kept in
+    flight from a single event loop without spawning threads.
+    """
+
+    def _create_client(self):
+        return AsyncOpenAI(**self._client_options())
+
+    async def query(self, prompt: str) -> list[str]:
+        messages = self._build_messages(prompt)
+        completion = await self._create(
+            self._chat_completions(),
+            (lambda: self._count_prompt_tokens(messages)),
+            messages=messages,
+            model=self.model,
+            temperature=self.temperature,
+            response_format={"type": self.response_format},
+        )
+
+        return self._parse_completion(completion)
+
+    async def embed(self, input: list[str]) -> list[list[float]]:
+        if not input:
+            return []
+
+        semaphore = asyncio.Semaphore(self.max_embedding_workers or 1)
+
+        async def embed_chunk(start: int, end: int) -> list[list[float]]:
+            async with semaphore:
+                response = await self._create(
+                    self.client.embeddings,
+                    (lambda: self._count_embedding_tokens(input[start:end])),
+                    input=input[start:end],
+                    model=self.embedding_model,
+                )
+            return self._parse_embeddings(response)
+
+        chunks = await asyncio.gather(
+            *[embed_chunk(start, end) for start, end in self._chunk_inputs(input)]
+        )
+
+        return [embedding for chunk in chunks for embedding in chunk]
+
+    async def embed_array(self, input: list[str]) -> np.ndarray:
+        if not input:
+            return embeddings_to_array([])
+
+        semaphore = asyncio.Semaphore(self.max_embedding_workers or 1)
+
+        async def embed_chunk(start: int, end: int) -> np.ndarray:
+            async with semaphore:
+                response = await self._create(
+                    self.client.embeddings,
+                    (lambda: self._count_embedding_tokens(input[start:end])),
+                    input=input[start:end],
+                    model=self.embedding_model,
+                    encoding_format="base64",
+                )
+            return self._decode_embeddings(response)
+
+        arrays = await asyncio.gather(
+            *[embed_chunk(start, end) for start, end in self._chunk_inputs(input)]
+        )
+
+        return self._concatenate(arrays)
+
+    async def _create(self, resource, count_tokens, **kwargs):
+        if self.rate_limiter is None:
+            return await resource.create(**kwargs)
+
+        async def create():
+            return self._on_response(await resource.with_raw_response.create(**kwargs))
+
+        # Batches of embedding inputs take a while to count
+        tokens = await asyncio.to_thread(count_tokens)
+        return await self.rate_limiter.run_async(create, tokens)
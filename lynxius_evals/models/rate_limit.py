@@ -0,0 +1,305 @@
+import asyncio
+import re
+import threading
+import time
+from collections.abc import Awaitable, Callable, Mapping
+from typing import TypeVar
+
+import httpx
+import numpy as np
+from openai import APIConnectionError
+
+from .eval_model import AsyncEvalModel, EvalModel, disable_query_retries
+
+T = TypeVar("T")
+
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+DEFAULT_MAX_RATE_LIMIT_RETRIES = 6
+
+
+def parse_duration(value: str) -> float | None:
+    """Parses durations like `20ms`, `1.5s` or `6m0s` into seconds. Plain numbers
+    are interpreted as seconds."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    matches = DURATION_PATTERN.findall(value)
+    if not matches:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in matches)
+
+
+def _status_code(error: Exception) -> int | None:
+    response = getattr(error, "response", None)
+    return getattr(error, "status_code", getattr(response, "status_code", None))
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Whether `error` is an HTTP 429 response of any client library."""
+    return _status_code(error) == 429
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Whether a failed call may succeed if it is retried: rate limits, timeouts,
+    connection errors and server errors. Bad requests, authentication errors and
+    the like fail the same way every time."""
+    if isinstance(
+        error, (ConnectionError, TimeoutError, APIConnectionError, httpx.TransportError)
+    ):
+        return True
+
+    status_code = _status_code(error)
+    return isinstance(status_code, int) and (status_code == 429 or status_code >= 500)
+
+
+def _error_headers(error: Exception) -> Mapping[str, str]:
+    return getattr(getattr(error, "response", None), "headers", None) or {}
+
+
+class _TokenBucket:
+    def __init__(self, per_minute: float, now: float):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = now
+
+    def refill(self, now: float):
+        rate = self.capacity / 60.0
+        self.level = min(self.capacity, self.level + (now - self.updated) * rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Takes `amount` from the bucket and returns how long the caller has to wait
+        until the bucket is out of debt."""
+        self.level -= amount
+        if self.level >= 0:
+            return 0.0
+        return -self.level / (self.capacity / 60.0)
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        max_retries: int = DEFAULT_MAX_RATE_LIMIT_RETRIES,
+    ):
+        """
+        A thread-safe token-bucket governor for LLM and embedding calls. Share one
+        instance between all models that use the same provider account.
+
+        Every call reserves one request and its token count before it is sent. If
+        either budget is exhausted the caller sleeps until it refills. The budgets
+        are adjusted from the provider rate-limit response headers, and a
+        `retry-after` header pauses all callers.
+
+        Args:
+            requests_per_minute (float | None): The request budget. If `None`, it is
+                learned from the `x-ratelimit-limit-requests` response header.
+                Otherwise the header can only lower it.
+
+            tokens_per_minute (float | None): The token budget. If `None`, it is
+                learned from the `x-ratelimit-limit-tokens` response header.
+                Otherwise the header can only lower it.
+
+            max_retries (int): How many times a rate-limited (HTTP 429) call is
+                retried before the error is raised.
+        """
+        now = time.monotonic()
+        self.max_retries = max_retries
+        self.limits = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self.requests = (
+            _TokenBucket(requests_per_minute, now) if requests_per_minute else None
+        )
+        self.tokens = (
+            _TokenBucket(tokens_per_minute, now) if tokens_per_minute else None
+        )
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 0):
+        """Blocks until the call fits into the budget."""
+        delay = self._reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens: int = 0):
+        """Waits until the call fits into the budget without blocking the event
+        loop."""
+        delay = self._reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def run(self, fn: Callable[[], T], tokens: int = 0) -> T:
+        """Calls `fn` within the budget. Calls rejected with HTTP 429 are retried up
+        to `max_retries` times, this is the only layer that retries them."""
+        for attempt in range(self.max_retries + 1):
+            self.acquire(tokens)
+            try:
+                return fn()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                self.on_rate_limited(_error_headers(e))
+
+    async def run_async(self, fn: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+        """An asyncio counterpart of `run`."""
+        for attempt in range(self.max_retries + 1):
+            await self.acquire_async(tokens)
+            try:
+                return await fn()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                self.on_rate_limited(_error_headers(e))
+
+    def record_tokens(self, tokens: int):
+        """Charges tokens that weren't known before the call, e.g. the completion
+        tokens reported by the provider."""
+        if tokens <= 0:
+            return
+        with self._lock:
+            if self.tokens is not None:
+                self.tokens.refill(time.monotonic())
+                self.tokens.level -= tokens
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        """Adapts the budgets to the rate-limit headers of a provider response."""
+        with self._lock:
+            now = time.monotonic()
+            self._update_bucket(headers, "requests", now)
+            self._update_bucket(headers, "tokens", now)
+
+            retry_after = None
+            if "retry-after-ms" in headers:
+                retry_after = parse_duration(headers["retry-after-ms"] + "ms")
+            elif "retry-after" in headers:
+                retry_after = parse_duration(headers["retry-after"])
+            if retry_after is not None:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def on_rate_limited(self, headers: Mapping[str, str] | None = None):
+        """Called when the provider rejected a call with HTTP 429."""
+        self.update_from_headers(headers or {})
+        with self._lock:
+            now = time.monotonic()
+            # Without a retry-after hint, back off until one request is refilled
+            if self.blocked_until <= now:
+                rpm = self.requests.capacity if self.requests is not None else 60.0
+                self.blocked_until = now + 60.0 / rpm
+            for bucket in (self.requests, self.tokens):
+                if bucket is not None:
+                    bucket.refill(now)
+                    bucket.level = min(bucket.level, 0.0)
+
+    def _update_bucket(self, headers: Mapping[str, str], kind: str, now: float):
+        limit = headers.get(f"x-ratelimit-limit-{kind}")
+        remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+        if limit is None:
+            return
+
+        try:
+            limit = float(limit)
+            remaining = float(remaining) if remaining is not None else None
+        except ValueError:
+            return
+
+        # Never go above a budget configured by the user
+        if self.limits[kind] is not None:
+            limit = min(limit, self.limits[kind])
+
+        bucket = getattr(self, kind)
+        if bucket is None:
+            bucket = _TokenBucket(limit, now)
+            setattr(self, kind, bucket)
+        else:
+            bucket.refill(now)
+            bucket.capacity = limit
+
+        # The provider knows better how much budget is left
+        if remaining is not None:
+            bucket.level = min(bucket.level, remaining)
+
+    def _reserve(self, tokens: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self.blocked_until - now)
+            if self.requests is not None:
+                self.requests.refill(now)
+                delay = max(delay, self.requests.reserve(1))
+            if self.tokens is not None:
+                self.tokens.refill(now)
+                delay = max(delay, self.tokens.reserve(tokens))
+            return delay
+
+
+def _count_tokens(model, texts: list) -> int:
+    token_counter = getattr(model, "token_counter", None)
+    if token_counter is None:
+        return 0
+    return sum(token_counter.count([str(text) for text in texts]))
+
+
+class RateLimitedEvalModel(EvalModel):
+    def __init__(self, model: EvalModel, rate_limiter: RateLimiter):
+        """
+        Wraps any `EvalModel` and runs its calls within the budget of a
+        `RateLimiter`. Calls are charged with the tokens counted by the model's
+        `token_counter`, if it has one. The wrapped model shouldn't retry HTTP 429
+        responses itself, the limiter does that.
+
+        Args:
+            model (EvalModel): The model to wrap.
+
+            rate_limiter (RateLimiter): The limiter to use. Pass the same instance
+                to all models that use the same provider account.
+        """
+        self.model = model
+        self.rate_limiter = rate_limiter
+        self.token_counter = getattr(model, "token_counter", None)
+
+    def disable_query_retries(self):
+        disable_query_retries(self.model)
+
+    def query(self, prompt: str) -> list[str]:
+        return self.rate_limiter.run(
+            lambda: self.model.query(prompt), _count_tokens(self.model, [prompt])
+        )
+
+    def embed(self, input: list[str]) -> list[list[float]]:
+        return self.rate_limiter.run(
+            lambda: self.model.embed(input), _count_tokens(self.model, input)
+        )
+
+    def embed_array(self, input: list[str]) -> np.ndarray:
+        return self.rate_limiter.run(
+            lambda: self.model.embed_array(input), _count_tokens(self.model, input)
+        )
+
+
+class AsyncRateLimitedEvalModel(AsyncEvalModel):
+    def __init__(self, model: AsyncEvalModel, rate_limiter: RateLimiter):
+        """An `AsyncEvalModel` counterpart of `RateLimitedEvalModel`."""
+        self.model = model
+        self.rate_limiter = rate_limiter
+        self.token_counter = getattr(model, "token_counter", None)
+
+    def disable_query_retries(self):
+        disable_query_retries(self.model)
+
+    async def query(self, prompt: str) -> list[str]:
+        return await self.rate_limiter.run_async(
+            lambda: self.model.query(prompt), _count_tokens(self.model, [prompt])
+        )
+
+    async def embed(self, input: list[str]) -> list[list[float]]:
+        return await self.rate_limiter.run_async(
+            lambda: self.model.embed(input), _count_tokens(self.model, input)
+        )
+
+    async def embed_array(self, input: list[str]) -> np.ndarray:
+        return await self.rate_limiter.run_async(
+            lambda: self.model.embed_array(input), _count_tokens(self.model, input)
+        )
@@ -0,0 +1,101 @@
+import functools
+import re
+
+import tiktoken
+
+# Context window sizes in tokens. Dated model snapshots (e.g. `gpt-4o-2024-08-06` or
+# `gpt-4-0613`) share the limit of their model family. Models that aren't listed
+# have no limit.
+MODEL_CONTEXT_LIMITS = {
+    "gpt-4.1": 1_047_576,
+    "gpt-4.1-mini": 1_047_576,
+    "gpt-4.1-nano": 1_047_576,
+    "gpt-4.5-preview": 128_000,
+    "gpt-4o": 128_000,
+    "gpt-4o-mini": 128_000,
+    "chatgpt-4o-latest": 128_000,
+    "gpt-4-turbo": 128_000,
+    "gpt-4-turbo-preview": 128_000,
+    "gpt-4-1106-preview": 128_000,
+    "gpt-4-0125-preview": 128_000,
+    "gpt-4": 8_192,
+    "gpt-4-32k": 32_768,
+    "gpt-3.5-turbo": 16_385,
+    "o1": 200_000,
+    "o1-mini": 128_000,
+    "o3": 200_000,
+    "o3-mini": 200_000,
+    "o4-mini": 200_000,
+}
+SNAPSHOT_SUFFIX = re.compile(r"-(\d{4}-\d{2}-\d{2}|\d{4})$")
+# Fewer texts are encoded on the calling thread, since tiktoken starts a new
+# thread pool for every batch
+MIN_BATCH_SIZE = 8
+
+
+class TokenLimitExceededError(Exception):
+    """Exception raised when the token count exceeds the maximum allowed limit."""
+
+    def __init__(self, message="Token count exceeds the maximum allowed limit"):
+        self.message = message
+        super().__init__(self.message)
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """Resolves the tiktoken encoding of a model once per process."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def get_context_limit(model: str) -> int | None:
+    if model in MODEL_CONTEXT_LIMITS:
+        return MODEL_CONTEXT_LIMITS[model]
+    return MODEL_CONTEXT_LIMITS.get(SNAPSHOT_SUFFIX.sub("", model))
+
+
+class TokenCounter:
+    def __init__(self, model: str, context_limit: int | None = None):
+        """
+        Counts tokens of prompts for a given model and enforces its context limit.
+
+        Args:
+            model (str): The model name used to resolve the tiktoken encoding.
+            context_limit (int | None): The maximum number of prompt tokens. Looked
+                up in `MODEL_CONTEXT_LIMITS` if not provided. If the model is
+                unknown, tokens are still counted but no limit is enforced.
+        """
+        self.model = model
+        self.context_limit = (
+            context_limit if context_limit is not None else get_context_limit(model)
+        )
+
+    @property
+    def encoding(self) -> tiktoken.Encoding:
+        return get_encoding(self.model)
+
+    def count(self, texts: list[str]) -> list[int]:
+        """Counts tokens of all texts at once. tiktoken encodes batches of at least
+        `MIN_BATCH_SIZE` texts on multiple threads."""
+        if len(texts) < MIN_BATCH_SIZE:
+            return [len(self.encoding.encode_ordinary(text)) for text in texts]
+        return [len(tokens) for tokens in self.encoding.encode_ordinary_batch(texts)]
+
+    def limit_error(self, token_count: int) -> TokenLimitExceededError | None:
+        """Returns the error of a prompt that exceeds the context limit."""
+        if self.context_limit is None or token_count <= self.context_limit:
+            return None
+
+        return TokenLimitExceededError(
+            f"Token count ({token_count}) exceeds the maximum allowed "
+            f"({self.context_limit}) for {self.model}."
+        )
+
+    def check(self, token_counts: list[int]):
+        """Raises `TokenLimitExceededError` if any count exceeds the context limit."""
+        for token_count in token_counts:
+            error = self.limit_error(token_count)
+            if error is not None:
+                raise error
@@ -0,0 +1,47 @@
+from .eval_prompt import EvalPromptTemplate
+
+RAG_BASE_TEMPLATE = """
+You are given a question, a reference answer, a candidate answer and a list of contexts that were used to answer the given question. You have to complete two tasks.
+
+Task "answer_correctness": analyze each statement of the candidate answer and the reference and classify them in one of the following categories:
+
+- TP (true positive): statements that are present in answer that are also directly supported by the one or more statements in reference,
+- FP (false positive): statements present in the answer but not directly supported by any statement in reference,
+- FN (false negative): statements found in the reference but not present in answer.
+
+Each statement can only belong to one of the categories.
+
+Task "context_precision": determine if each of the given contexts was relevant when answering the question with the reference answer. Return a list of integers that are either 0 or 1. The length of this list must match exactly the length of the contexts. For every context print `0` if it is not relevant when answering the question and `1` if it is relevant.
+
+Your answer must strictly contain ONLY a valid JSON object representing the requested data. Your response must follow exactly the following JSON schema, shown for a query that contains 3 contexts:
+```
+{{
+  "answer_correctness": {{
+    "TP": ["statement_1", "statement_2"],
+    "FP": ["statement_3", "statement_4"],
+    "FN": ["statement_5", "statement_6"]
+  }},
+  "context_precision": {{
+    "result": [0, 1, 1]
+  }}
+}}
+```
+
+Here is the data:
+[BEGIN DATA]
+************
+[Question]: {query}
+************
+[Reference]: {reference}
+************
+[Answer]: {output}
+{context}
+[END DATA]
+
+Provide a valid JSON object based on previous instructions WITHOUT any additional characters!
+"""
+
+RAG_TEMPLATE = EvalPromptTemplate(
+    name="Rag",
+    template=RAG_BASE_TEMPLATE,
+)
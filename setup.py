@@ -11,7 +11,7 @@ requirements = [
     "httpx>=0.27.0",
     "nltk>=3.8.1",
     "numpy>=2.0.0",
-    "python_Levenshtein>=0.25.1",
+    "rapidfuzz>=3.6.0",
     "tiktoken>=0.7.0",
     "openai>=1.35.1",
 ]
@@ -51,6 +51,7 @@ setup(
     tests_require=test_requirements,
     extras_require={
         "test": test_requirements,
+        "http2": ["httpx[http2]>=0.27.0"],
     },
     url="https://github.com/lynxius/lynxius-python",
     version="1.2.0",
@@ -0,0 +1,264 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from lynxius_evals.evaluators.llm_based_eval import LLMBasedEval
+from lynxius_evals.models.cache import ResponseCache
+from lynxius_evals.models.eval_model import (
+    BATCH_COMPLETED,
+    BATCH_EXPIRED,
+    BATCH_IN_PROGRESS,
+    BatchEvalModel,
+    BatchResult,
+    EvalModel,
+)
+from lynxius_evals.models.openai import OpenAIBatchModel
+from lynxius_evals.prompts.eval_prompt import EvalPromptTemplate
+
+TEMPLATE = EvalPromptTemplate("Test", "Is {output} correct?")
+
+
+class FakeBatchModel(EvalModel, BatchEvalModel):
+    def __init__(
+        self, max_batch_size=None, polls=1, status=BATCH_COMPLETED, max_batch_bytes=None
+    ):
+        self.max_batch_size = max_batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.polls = polls
+        self.status = status
+        self.batches = []
+        self.cancelled = []
+        self.num_polls = 0
+
+    def query(self, prompt: str) -> list[str]:
+        raise NotImplementedError
+
+    def embed(self, input: list[str]) -> list[list[float]]:
+        raise NotImplementedError
+
+    def submit_batch(self, prompts):
+        self.batches.append(dict(prompts))
+        return f"batch_{len(self.batches) - 1}"
+
+    def get_batch_status(self, batch_id):
+        self.num_polls += 1
+        if self.num_polls < self.polls:
+            return BATCH_IN_PROGRESS
+        return self.status
+
+    def cancel_batch(self, batch_id):
+        self.cancelled.append(batch_id)
+
+    def get_batch_results(self, batch_id):
+        prompts = self.batches[int(batch_id.split("_")[1])]
+        result = BatchResult()
+        for custom_id, prompt in prompts.items():
+            if "error" in prompt:
+                result.errors[custom_id] = "Invalid request"
+            elif self.status == BATCH_COMPLETED:
+                result.outputs[custom_id] = [
+                    "correct" if "yes" in prompt else "incorrect"
+                ]
+        return result
+
+
+class TestEvaluateBatch:
+    """Test `LLMBasedEval.evaluate_batch`."""
+
+    def test_evaluate_batch(self):
+        model = FakeBatchModel(max_batch_size=2, polls=3)
+        eval = LLMBasedEval(model, TEMPLATE, {"correct": 1.0}, 0.0)
+        data = [{"output": "yes"}, {"output": "no"}, {"output": "yes!"}]
+
+        result = eval.evaluate_batch(data, poll_interval=0)
+
+        assert [r["score"] for r in result] == [1.0, 0.0, 1.0]
+        assert model.batches == [
+            {"0": "Is yes correct?", "1": "Is no correct?"},
+            {"2": "Is yes! correct?"},
+        ]
+        assert (eval.num_succeeded, eval.num_failed) == (3, 0)
+
+    def test_records_failed_requests(self):
+        model = FakeBatchModel()
+        eval = LLMBasedEval(model, TEMPLATE, {"correct": 1.0}, 0.0)
+
+        result = eval.evaluate_batch([{"output": "yes"}, {"output": "error"}])
+
+        assert result[0]["score"] == 1.0
+        assert result[1]["error"] == {
+            "stage": "query",
+            "type": "BatchRequestError",
+            "message": "Invalid request",
+        }
+        assert (eval.num_succeeded, eval.num_failed) == (1, 1)
+
+    def test_unanswered_requests_fail(self):
+        model = FakeBatchModel(status=BATCH_EXPIRED)
+        eval = LLMBasedEval(model, TEMPLATE, {"correct": 1.0}, 0.0)
+
+        result = eval.evaluate_batch([{"output": "yes"}])
+
+        assert result[0]["error"]["type"] == "BatchRequestError"
+        assert eval.num_failed == 1
+
+    def test_timeout(self):
+        model = FakeBatchModel(polls=100)
+        eval = LLMBasedEval(model, TEMPLATE, {"correct": 1.0}, 0.0)
+
+        result = eval.evaluate_batch([{"output": "yes"}], poll_interval=0, timeout=0)
+
+        assert model.num_polls == 1
+        assert result[0]["error"]["stage"] == "query"
+        assert eval.pending_batch_ids == model.cancelled == ["batch_0"]
+
+    def test_timeout_without_cancelling(self):
+        model = FakeBatchModel(polls=100)
+        eval = LLMBasedEval(model, TEMPLATE, {"correct": 1.0}, 0.0)
+
+        eval.evaluate_batch(
+            [{"output": "yes"}], poll_interval=0, timeout=0, cancel_on_timeout=False
+        )
+
+        assert eval.pending_batch_ids == ["batch_0"]
+        assert model.cancelled == []
+
+    def test_splits_batches_by_size(self):
+        model = FakeBatchModel(max_batch_size=3, max_batch_bytes=30)
+        eval = LLMBasedEval(model, TEMPLATE, {"correct": 1.0}, 0.0)
+        data = [{"output": output} for output in ["yes", "no", "a" * 30, "yes", "no"]]
+
+        result = eval.evaluate_batch(data, poll_interval=0)
+
+        # Prompts are 14 to 15 bytes long and the long one gets a job of its own
+        assert [list(batch) for batch in model.batches] == [
+            ["0", "1"],
+            ["2"],
+            ["3", "4"],
+        ]
+        assert eval.num_succeeded == 5
+        assert [r["score"] for r in result] == [1.0, 0.0, 0.0, 1.0, 0.0]
+
+    def test_nothing_to_submit(self):
+        model = FakeBatchModel()
+        eval = LLMBasedEval(model, TEMPLATE, {"correct": 1.0}, 0.0)
+
+        assert eval.evaluate_batch([]) == []
+        assert model.batches == [] and model.num_polls == 0
+
+    def test_submits_only_cache_misses(self):
+        cache = ResponseCache()
+        model = FakeBatchModel()
+        eval = LLMBasedEval(
+            model, TEMPLATE, {"correct": 1.0}, 0.0, response_cache=cache
+        )
+        eval.evaluate_batch([{"output": "yes"}])
+
+        result = eval.evaluate_batch([{"output": "yes"}, {"output": "no"}])
+
+        assert [r["score"] for r in result] == [1.0, 0.0]
+        assert model.batches[1] == {"1": "Is no correct?"}
+        assert eval.num_cached == 1
+
+    def test_requires_batch_model(self):
+        model = FakeBatchModel()
+        eval = LLMBasedEval(model, TEMPLATE, {"correct": 1.0}, 0.0)
+        eval.model = SimpleNamespace()
+
+        with pytest.raises(TypeError):
+            eval.evaluate_batch([{"output": "yes"}])
+
+
+class FakeFiles:
+    def __init__(self):
+        self.uploaded = {}
+        self.contents = {}
+
+    def create(self, file, purpose):
+        name, f = file
+        self.uploaded[f"file_{len(self.uploaded)}"] = f.read().decode()
+        return SimpleNamespace(id=f"file_{len(self.uploaded) - 1}")
+
+    def content(self, file_id):
+        return SimpleNamespace(text=self.contents[file_id])
+
+
+class FakeBatches:
+    def __init__(self):
+        self.batch = None
+
+    def create(self, input_file_id, endpoint, completion_window):
+        self.batch = SimpleNamespace(
+            id="batch_0",
+            input_file_id=input_file_id,
+            status="finalizing",
+            output_file_id=None,
+            error_file_id=None,
+        )
+        return self.batch
+
+    def retrieve(self, batch_id):
+        return self.batch
+
+    def cancel(self, batch_id):
+        self.batch.status = "cancelling"
+
+
+class TestOpenAIBatchModel:
+    """Test `OpenAIBatchModel` against a fake OpenAI client."""
+
+    def test_submit_and_collect(self, monkeypatch):
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+        model = OpenAIBatchModel(model="gpt-4o")
+        files, batches = FakeFiles(), FakeBatches()
+        model.client = SimpleNamespace(files=files, batches=batches)
+
+        batch_id = model.submit_batch({"0": "Is yes correct?", "1": "Is no correct?"})
+
+        requests = [json.loads(line) for line in files.uploaded["file_0"].splitlines()]
+        assert [r["custom_id"] for r in requests] == ["0", "1"]
+        assert requests[0]["url"] == "/v1/chat/completions"
+        assert requests[0]["body"]["model"] == "gpt-4o"
+        assert requests[0]["body"]["messages"][-1]["content"] == "Is yes correct?"
+        assert model.get_batch_status(batch_id) == BATCH_IN_PROGRESS
+
+        output = {
+            "custom_id": "0",
+            "response": {
+                "status_code": 200,
+                "body": {"choices": [{"message": {"content": "correct"}}]},
+            },
+            "error": None,
+        }
+        error = {
+            "custom_id": "1",
+            "response": {
+                "status_code": 400,
+                "body": {"error": {"message": "Invalid request"}},
+            },
+            "error": None,
+        }
+        files.contents = {"out": json.dumps(output), "err": json.dumps(error)}
+        batches.batch.status = "completed"
+        batches.batch.output_file_id = "out"
+        batches.batch.error_file_id = "err"
+
+        assert model.get_batch_status(batch_id) == BATCH_COMPLETED
+        result = model.get_batch_results(batch_id)
+        assert result.outputs == {"0": ["correct"]}
+        assert "Invalid request" in result.errors["1"]
+
+    def test_batch_request_size(self, monkeypatch):
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+        model = OpenAIBatchModel(model="gpt-4o")
+        files, batches = FakeFiles(), FakeBatches()
+        model.client = SimpleNamespace(files=files, batches=batches)
+
+        sizes = [model.batch_request_size("0", "Is yes correct?")]
+        sizes.append(model.batch_request_size("1", "Is no correct?"))
+        model.cancel_batch(model.submit_batch({"0": "Is yes correct?"}))
+
+        assert len(files.uploaded["file_0"].encode("utf-8")) == sizes[0]
+        assert sizes[1] == sizes[0] - 1
+        assert model.get_batch_status("batch_0") == BATCH_IN_PROGRESS
@@ -0,0 +1,66 @@
+import base64
+from types import SimpleNamespace
+
+import numpy as np
+
+from lynxius_evals.models.batching import chunk_inputs
+from lynxius_evals.models.openai import OpenAIModel
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.requests = []
+
+    def create(self, input, model, encoding_format=None, **kwargs):
+        self.requests.append(list(input))
+        # Return the embeddings shuffled, the API identifies them by index
+        data = [
+            SimpleNamespace(index=i, embedding=[float(len(text)), 1.0])
+            for i, text in enumerate(input)
+        ]
+        if encoding_format == "base64":
+            for item in data:
+                vector = np.array(item.embedding, dtype=np.float32)
+                item.embedding = base64.b64encode(vector.tobytes()).decode()
+        return SimpleNamespace(data=data[::-1])
+
+
+class TestBatching:
+    """Test chunking of oversized `embed` batches."""
+
+    def test_chunk_inputs_by_size(self):
+        chunks = list(chunk_inputs(["a"] * 5, max_size=2, max_tokens=100))
+
+        assert chunks == [(0, 2), (2, 4), (4, 5)]
+
+    def test_chunk_inputs_by_tokens(self):
+        chunks = list(chunk_inputs(["aaa", "bb", "c", "dddd"], 10, max_tokens=4))
+
+        assert chunks == [(0, 1), (1, 3), (3, 4)]
+
+    def test_embed_keeps_order(self, monkeypatch):
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+        model = OpenAIModel(embedding_batch_size=3, max_embedding_workers=2)
+        fake = FakeEmbeddings()
+        model.client = SimpleNamespace(embeddings=fake)
+
+        texts = ["a" * n for n in range(1, 9)]
+        embeddings = model.embed(texts)
+
+        assert embeddings == [[float(n), 1.0] for n in range(1, 9)]
+        assert sorted(len(r) for r in fake.requests) == [2, 3, 3]
+
+    def test_embed_array_decodes_base64(self, monkeypatch):
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+        model = OpenAIModel(embedding_batch_size=3, max_embedding_workers=2)
+        model.client = SimpleNamespace(embeddings=FakeEmbeddings())
+
+        texts = ["a" * n for n in range(1, 9)]
+        embeddings = model.embed_array(texts)
+
+        assert embeddings.dtype == np.float32
+        assert embeddings.flags["C_CONTIGUOUS"]
+        np.testing.assert_array_equal(
+            embeddings, [[float(n), 1.0] for n in range(1, 9)]
+        )
+        assert model.embed_array([]).shape == (0, 0)
@@ -0,0 +1,126 @@
+import nltk
+import numpy as np
+import pytest
+from nltk.tokenize import NLTKWordTokenizer, PunktSentenceTokenizer
+
+from lynxius_evals.evaluators.bert_score_eval import BertScoreEval, tokenize_with_spans
+from lynxius_evals.models.eval_model import EvalModel
+
+TEXTS = [
+    "She said \"it's fine\", but he didn't buy it. Prices rose 3.5% in N.Y.!",
+    "Good muffins cost $3.88\nin New (York).  Please (buy) me\ntwo of them.",
+    "''Quoted'' text with ``backticks'' and a \"plain\" quote.",
+    "",
+]
+
+
+class FakeEmbeddingModel(EvalModel):
+    def __init__(self):
+        self.embedded = []
+
+    def query(self, prompt: str) -> list[str]:
+        return [prompt]
+
+    def embed(self, input: list[str]) -> list[list[float]]:
+        self.embedded.append(input)
+        # Every distinct token gets its own direction
+        return [
+            np.random.default_rng(sum(map(ord, text))).normal(size=8).tolist()
+            for text in input
+        ]
+
+
+def score_trace(ref_vecs, cnd_vecs):
+    ref_vecs = ref_vecs / np.linalg.norm(ref_vecs, axis=1)[:, None]
+    cnd_vecs = cnd_vecs / np.linalg.norm(cnd_vecs, axis=1)[:, None]
+    similarity = np.clip(np.matmul(ref_vecs, cnd_vecs.T), 0.0, 1.0)
+    recall = np.sum(np.max(similarity, axis=1)) / len(ref_vecs)
+    precision = np.sum(np.max(similarity, axis=0)) / len(cnd_vecs)
+    return recall, precision, np.max(similarity, axis=1)
+
+
+class TestBertScoreEvalScoring:
+    """Test the vectorized scoring of `BertScoreEval`."""
+
+    def test_matches_per_trace_scoring(self):
+        rng = np.random.default_rng(0)
+        token_map = [(3, 4), (1, 1), (5, 2), (2, 6)]
+        embeddings = rng.normal(size=(sum(map(sum, token_map)), 16)).tolist()
+
+        token_ids = list(range(len(embeddings)))
+
+        recalls, precisions, best_ref_matches = BertScoreEval._score(
+            embeddings, token_ids, token_map
+        )
+
+        consumed = 0
+        for batch, (ref_len, cnd_len) in enumerate(token_map):
+            ref_vecs = np.array(embeddings[consumed : consumed + ref_len])
+            consumed += ref_len
+            cnd_vecs = np.array(embeddings[consumed : consumed + cnd_len])
+            consumed += cnd_len
+
+            recall, precision, best_ref = score_trace(ref_vecs, cnd_vecs)
+            np.testing.assert_allclose(recalls[batch], recall, rtol=1e-6)
+            np.testing.assert_allclose(precisions[batch], precision, rtol=1e-6)
+            np.testing.assert_allclose(best_ref_matches[batch], best_ref, atol=1e-6)
+
+    def test_accepts_embedding_matrix(self):
+        embeddings = np.array([[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]])
+
+        recalls, precisions, _ = BertScoreEval._score(embeddings, [0, 1, 2], [(1, 2)])
+
+        np.testing.assert_allclose(recalls, [np.sqrt(0.5)], rtol=1e-6)
+        np.testing.assert_allclose(precisions, [np.sqrt(0.5) / 2], rtol=1e-6)
+
+
+class TestBertScoreEvalTokenization:
+    """Test the single-pass tokenization of `BertScoreEval`."""
+
+    @pytest.fixture(autouse=True)
+    def skip_punkt_download(self, monkeypatch):
+        # The evaluator only checks for the punkt resource, which needs the network
+        monkeypatch.setattr(nltk.data, "find", lambda resource: resource)
+
+    @pytest.mark.parametrize(
+        "tokenizer", [NLTKWordTokenizer(), PunktSentenceTokenizer()]
+    )
+    def test_matches_separate_tokenize_and_span_tokenize(self, tokenizer):
+        for text in TEXTS:
+            tokens, spans = tokenize_with_spans(tokenizer, text)
+
+            assert tokens == tokenizer.tokenize(text)
+            assert spans == list(tokenizer.span_tokenize(text))
+
+    def test_process_pool_gives_same_results(self):
+        data = [
+            {"reference": TEXTS[i], "output": TEXTS[(i + 1) % 3], "contexts": []}
+            for i in range(3)
+        ] * 4
+
+        serial = BertScoreEval(FakeEmbeddingModel(), "word").evaluate(data)
+        pooled = BertScoreEval(FakeEmbeddingModel(), "word", num_processes=2).evaluate(
+            data
+        )
+
+        assert pooled == serial
+        assert serial[0]["missing_tokens"]
+
+    def test_embeds_every_distinct_token_once(self):
+        data = [
+            {"reference": "the cat and the dog", "output": "the dog", "contexts": []},
+            {"reference": "a cat", "output": "the cat", "contexts": []},
+        ]
+        model = FakeEmbeddingModel()
+
+        result = BertScoreEval(model, "word").evaluate(data)
+
+        assert model.embedded == [["the", "cat", "and", "dog", "a"]]
+        tokens = ["the", "cat", "and", "the", "dog", "the", "dog", "a", "cat"]
+        tokens += ["the", "cat"]
+        recalls, precisions, _ = BertScoreEval._score(
+            model.embed(tokens), list(range(len(tokens))), [(5, 2), (2, 2)]
+        )
+        assert [r["recall"] for r in result] == pytest.approx(recalls, rel=1e-6)
+        assert [r["precision"] for r in result] == pytest.approx(precisions, rel=1e-6)
+        assert result[0]["missing_tokens"] == [(4, 7), (8, 11)]
@@ -0,0 +1,321 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+import lynxius.client
+from lynxius.client import AsyncLynxiusClient, LynxiusClient
+from lynxius.evals.json_diff import JsonDiff
+from lynxius.evals.semantic_similarity import SemanticSimilarity
+
+DATASET = {
+    "dataset": {
+        "uuid": "d1",
+        "date_created": "2024-07-01",
+        "organization_uuid": "o1",
+        "organization_name": "Lynxius",
+    },
+    "entries": [
+        {
+            "uuid": "e1",
+            "dataset_uuid": "d1",
+            "query": "q",
+            "output": "o",
+            "reference": "r",
+            "score": "1.0",
+            "comments": "",
+            "date_created": "2024-07-01",
+            "date_modified": "2024-07-01",
+        }
+    ],
+}
+
+
+def handler(request: httpx.Request) -> httpx.Response:
+    assert request.headers["Authorization"] == "Bearer test"
+
+    if request.method == "POST" and request.url.path.endswith(
+        "/evals/run/semantic_similarity/"
+    ):
+        body = json.loads(request.content)
+        assert body["data"][0]["reference"] == "reference"
+        return httpx.Response(201, json={"uuid": "run-1"})
+    if request.method == "POST" and request.url.path.endswith(
+        "/evals/store/json_diff_eval/"
+    ):
+        body = json.loads(request.content)
+        return httpx.Response(201, json={"uuid": f"run-{len(body['data'])}"})
+    if request.url.path.endswith("/projects/evals/run-1/"):
+        return httpx.Response(200, json={"uuid": "run-1", "status": "SUCCESS"})
+    if request.url.path.endswith("/datasets/d1/entries/"):
+        return httpx.Response(200, json=DATASET)
+    return httpx.Response(404)
+
+
+class TestAsyncLynxiusClient:
+    """Test `AsyncLynxiusClient` against a mock transport."""
+
+    def test_base_url(self):
+        client = AsyncLynxiusClient(api_key="test", base_url="http://localhost:8000")
+
+        assert str(client._client.base_url) == "http://localhost:8000/api/v1/"
+
+    def test_requires_api_key(self, monkeypatch):
+        monkeypatch.delenv("LYNXIUS_API_KEY", raising=False)
+
+        with pytest.raises(ValueError):
+            AsyncLynxiusClient()
+
+    def test_evaluate_and_get_eval_run(self):
+        async def run():
+            transport = httpx.MockTransport(handler)
+            async with AsyncLynxiusClient(
+                api_key="test", transport=transport
+            ) as client:
+                eval = SemanticSimilarity(label="unit_test")
+                eval.add_trace(reference="reference", output="output")
+
+                eval_run_uuid = await client.evaluate(eval)
+                eval_run = await client.get_eval_run(eval_run_uuid)
+            return eval_run_uuid, eval_run, client
+
+        eval_run_uuid, eval_run, client = asyncio.run(run())
+
+        assert eval_run_uuid == "run-1"
+        assert eval_run["status"] == "SUCCESS"
+        assert client._client.is_closed
+
+    def test_get_dataset_details(self):
+        async def run():
+            transport = httpx.MockTransport(handler)
+            async with AsyncLynxiusClient(
+                api_key="test", transport=transport
+            ) as client:
+                return await client.get_dataset_details("d1")
+
+        details = asyncio.run(run())
+
+        assert details.dataset.organization_name == "Lynxius"
+        assert details.entries[0].reference == "r"
+
+    def test_evaluate_stream(self, monkeypatch):
+        monkeypatch.setattr(lynxius.client, "UPLOAD_BACKOFF_FACTOR", 0)
+        server = UploadServer(fail_once={1})
+
+        async def run():
+            async with AsyncLynxiusClient(
+                api_key="test",
+                run_local=True,
+                transport=httpx.MockTransport(server.handler),
+                page_size=2,
+            ) as client:
+                eval = JsonDiff(label="unit_test")
+                traces = ({"reference": {"a": i}, "output": {"a": i}} for i in range(5))
+                eval_run_uuid = await client.evaluate_stream(
+                    eval, traces, window_size=3
+                )
+                return eval_run_uuid, eval
+
+        eval_run_uuid, eval = asyncio.run(run())
+
+        assert eval_run_uuid == "run-5"
+        # Windows of 3 results are split into pages of at most 2 results
+        assert [len(server.pages[i]) for i in range(3)] == [2, 1, 2]
+        assert eval.samples == []
+
+
+class UploadServer:
+    """A stub of the chunked upload API."""
+
+    def __init__(self, fail_once: set[int] = set(), page_delay: float = 0):
+        self.header = None
+        self.pages = {}
+        self.fail_once = set(fail_once)
+        self.page_delay = page_delay
+        self.aborted = False
+        self.methods = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if request.method == "PUT" and path.rstrip("/").split("/")[-1] != "0":
+            time.sleep(self.page_delay)
+        self.methods.append(request.method)
+        if request.method == "POST" and path.endswith("/json_diff_eval/"):
+            return httpx.Response(201, json={"uuid": "run-single"})
+        if request.method == "POST" and path.endswith("/uploads/"):
+            self.header = json.loads(request.content)
+            return httpx.Response(201, json={"upload_id": "u1"})
+        if request.method == "PUT" and "/evals/uploads/u1/pages/" in path:
+            index = int(path.rstrip("/").split("/")[-1])
+            if index in self.fail_once:
+                self.fail_once.remove(index)
+                return httpx.Response(503)
+            self.pages[index] = json.loads(request.content)["data"]
+            return httpx.Response(200)
+        if request.method == "POST" and path.endswith("/evals/uploads/u1/finalize/"):
+            num_pages = json.loads(request.content)["num_pages"]
+            data = [row for i in range(num_pages) for row in self.pages.get(i, [])]
+            return httpx.Response(201, json={"uuid": f"run-{len(data)}"})
+        if request.method == "DELETE" and path.endswith("/evals/uploads/u1/"):
+            self.aborted = True
+            return httpx.Response(204)
+        return httpx.Response(404)
+
+
+class TestChunkedUpload:
+    """Test chunked upload of eval results against a stub server."""
+
+    def make_eval(self, num_traces: int) -> JsonDiff:
+        eval = JsonDiff(label="unit_test")
+        for i in range(num_traces):
+            eval.add_trace(reference={"a": i}, output={"a": i + 1})
+        return eval
+
+    def test_small_runs_use_a_single_request(self):
+        server = UploadServer()
+        client = LynxiusClient(
+            api_key="test",
+            run_local=True,
+            transport=httpx.MockTransport(server.handler),
+            page_size=10,
+        )
+        eval = self.make_eval(10)
+
+        assert client.evaluate(eval) == "run-single"
+        assert server.header is None
+
+    def test_paging_is_opt_in(self):
+        server = UploadServer()
+        client = LynxiusClient(
+            api_key="test",
+            run_local=True,
+            transport=httpx.MockTransport(server.handler),
+        )
+
+        assert client.evaluate(self.make_eval(2000)) == "run-single"
+        assert server.header is None
+
+    def test_evaluate_uploads_pages(self, monkeypatch):
+        monkeypatch.setattr(lynxius.client, "UPLOAD_BACKOFF_FACTOR", 0)
+        server = UploadServer(fail_once={0, 3})
+        client = LynxiusClient(
+            api_key="test",
+            run_local=True,
+            transport=httpx.MockTransport(server.handler),
+            page_size=3,
+        )
+
+        eval_run_uuid = client.evaluate(self.make_eval(10))
+
+        assert eval_run_uuid == "run-10"
+        assert server.header["label"] == "unit_test"
+        assert "data" not in server.header
+        assert [len(server.pages[i]) for i in range(4)] == [3, 3, 3, 1]
+        assert server.pages[3][0]["reference"] == {"a": 9}
+
+    def test_evaluate_fails_after_retries(self, monkeypatch):
+        monkeypatch.setattr(lynxius.client, "UPLOAD_BACKOFF_FACTOR", 0)
+        monkeypatch.setattr(lynxius.client, "UPLOAD_RETRIES", 1)
+        server = UploadServer(fail_once={1})
+        client = LynxiusClient(
+            api_key="test",
+            run_local=True,
+            transport=httpx.MockTransport(server.handler),
+            page_size=3,
+        )
+
+        assert client.evaluate(self.make_eval(10)) is None
+        assert server.aborted
+
+    def test_no_page_follows_abort(self, monkeypatch):
+        monkeypatch.setattr(lynxius.client, "UPLOAD_RETRIES", 1)
+        server = UploadServer(fail_once={0}, page_delay=0.05)
+        client = LynxiusClient(
+            api_key="test",
+            run_local=True,
+            transport=httpx.MockTransport(server.handler),
+            page_size=1,
+            max_upload_workers=4,
+        )
+
+        assert client.evaluate(self.make_eval(20)) is None
+        assert server.methods[-1] == "DELETE"
+        assert server.methods.count("PUT") < 20
+
+    def test_evaluate_stream(self, monkeypatch):
+        monkeypatch.setattr(lynxius.client, "UPLOAD_BACKOFF_FACTOR", 0)
+        server = UploadServer(fail_once={2})
+        client = LynxiusClient(
+            api_key="test",
+            run_local=True,
+            transport=httpx.MockTransport(server.handler),
+            page_size=2,
+        )
+        eval = self.make_eval(1)
+        traces = ({"reference": {"a": i}, "output": {"a": i}} for i in range(5))
+
+        eval_run_uuid = client.evaluate_stream(eval, traces, window_size=3)
+
+        assert eval_run_uuid == "run-5"
+        assert [len(server.pages[i]) for i in range(3)] == [2, 1, 2]
+        assert server.pages[0][0]["reference"] == {"a": 0}
+        # Traces added before are neither uploaded nor dropped
+        assert [sample[:2] for sample in eval.samples] == [({"a": 0}, {"a": 1})]
+
+    def test_async_evaluate_uploads_pages(self, monkeypatch):
+        monkeypatch.setattr(lynxius.client, "UPLOAD_BACKOFF_FACTOR", 0)
+        server = UploadServer(fail_once={2})
+
+        async def run():
+            async with AsyncLynxiusClient(
+                api_key="test",
+                run_local=True,
+                transport=httpx.MockTransport(server.handler),
+                page_size=3,
+                max_upload_workers=2,
+            ) as client:
+                return await client.evaluate(self.make_eval(10))
+
+        assert asyncio.run(run()) == "run-10"
+        assert [len(server.pages[i]) for i in range(4)] == [3, 3, 3, 1]
+
+    def test_async_evaluate_aborts_failed_upload(self, monkeypatch):
+        monkeypatch.setattr(lynxius.client, "UPLOAD_BACKOFF_FACTOR", 0)
+        monkeypatch.setattr(lynxius.client, "UPLOAD_RETRIES", 1)
+        server = UploadServer(fail_once={1})
+
+        async def run():
+            async with AsyncLynxiusClient(
+                api_key="test",
+                run_local=True,
+                transport=httpx.MockTransport(server.handler),
+                page_size=3,
+            ) as client:
+                return await client.evaluate(self.make_eval(10))
+
+        assert asyncio.run(run()) is None
+        assert server.aborted
+
+    def test_async_no_page_follows_abort(self, monkeypatch):
+        monkeypatch.setattr(lynxius.client, "UPLOAD_RETRIES", 1)
+        server = UploadServer(fail_once={0})
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            if request.method == "PUT" and not request.url.path.endswith("/0/"):
+                await asyncio.sleep(0.05)
+            return server.handler(request)
+
+        async def run():
+            async with AsyncLynxiusClient(
+                api_key="test",
+                run_local=True,
+                transport=httpx.MockTransport(handler),
+                page_size=1,
+                max_upload_workers=4,
+            ) as client:
+                return await client.evaluate(self.make_eval(20))
+
+        assert asyncio.run(run()) is None
+        assert server.methods[-1] == "DELETE"
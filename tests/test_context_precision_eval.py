@@ -0,0 +1,182 @@
+import json
+
+import numpy as np
+import pytest
+
+from lynxius_evals.evaluators import context_precision_eval
+from lynxius_evals.evaluators.context_precision_eval import (
+    ContextPrecisionEval,
+    average_precisions,
+)
+from lynxius_evals.models.eval_model import EvalModel
+from lynxius_evals.models.tokens import TokenCounter
+from lynxius_evals.prompts.context_precision_prompt import CONTEXT_PRECISION_TEMPLATE
+
+
+class FakeJudge(EvalModel):
+    def __init__(self, verdicts: list[int]):
+        self.verdicts = verdicts
+        self.prompts = []
+
+    def query(self, prompt: str) -> list[str]:
+        self.prompts.append(prompt)
+        return [json.dumps({"result": self.verdicts})]
+
+    def embed(self, input: list[str]) -> list[list[float]]:
+        raise NotImplementedError
+
+
+class WordCounter(TokenCounter):
+    def count(self, texts: list[str]) -> list[int]:
+        return [len(text.split()) for text in texts]
+
+
+def trace(documents: list[str]) -> dict:
+    return {
+        "query": "q",
+        "reference": "r",
+        "contexts": [{"document": document} for document in documents],
+    }
+
+
+class TestContextPrecisionPacking:
+    """Test context packing of `ContextPrecisionEval`."""
+
+    def test_collapses_duplicates(self):
+        eval = ContextPrecisionEval(FakeJudge([]), CONTEXT_PRECISION_TEMPLATE)
+        documents = [
+            "Paris is the capital of France.",
+            "Berlin is the capital of Germany.",
+            "paris is the  capital of France.",
+            "Paris is the capital of France!",
+        ]
+
+        packed = eval.pack_contexts(trace(documents)["contexts"])
+
+        assert packed.documents == documents[:2]
+        assert packed.positions == [0, 1, 0, 0]
+
+    def test_exact_duplicates_only(self):
+        eval = ContextPrecisionEval(
+            FakeJudge([]), CONTEXT_PRECISION_TEMPLATE, near_duplicate_threshold=None
+        )
+        documents = ["Paris.", "Paris!", "Paris."]
+
+        packed = eval.pack_contexts(trace(documents)["contexts"])
+
+        assert packed.documents == ["Paris.", "Paris!"]
+        assert packed.positions == [0, 1, 0]
+
+    def test_truncates_to_token_budget(self):
+        eval = ContextPrecisionEval(
+            FakeJudge([]),
+            CONTEXT_PRECISION_TEMPLATE,
+            max_context_tokens=12,
+            token_counter=WordCounter("fake-judge"),
+        )
+        # Every block is 3 separator words and the document
+        documents = ["a b c", "d e f", "g", "a b c"]
+
+        packed = eval.pack_contexts(trace(documents)["contexts"])
+
+        assert packed.documents == ["a b c", "d e f"]
+        assert packed.positions == [0, 1, -1, 0]
+
+    def test_options_are_part_of_the_memo_key(self):
+        eval = ContextPrecisionEval(FakeJudge([]), CONTEXT_PRECISION_TEMPLATE)
+        documents = ["Paris is in France.", "Paris is in France!", "Rome."]
+        contexts = trace(documents)["contexts"]
+        assert len(eval.pack_contexts(contexts).documents) == 2
+
+        eval.near_duplicate_threshold = None
+        assert len(eval.pack_contexts(contexts).documents) == 3
+        eval.max_context_tokens = 1
+        assert eval.pack_contexts(contexts).documents == []
+
+    def test_oversized_first_chunk_fails(self):
+        model = FakeJudge([1])
+        eval = ContextPrecisionEval(
+            model,
+            CONTEXT_PRECISION_TEMPLATE,
+            max_context_tokens=5,
+            token_counter=WordCounter("fake-judge"),
+        )
+
+        result = eval.evaluate([trace(["a b c"]), trace(["a b c d e f", "a"])])
+
+        assert result[0]["score"] == pytest.approx(1.0)
+        assert result[1]["error"]["type"] == "TokenLimitExceededError"
+        assert len(model.prompts) == 1
+        assert (eval.num_succeeded, eval.num_failed) == (1, 1)
+
+    def test_verdicts_are_mapped_to_original_ranks(self):
+        model = FakeJudge([0, 1])
+        eval = ContextPrecisionEval(model, CONTEXT_PRECISION_TEMPLATE)
+        documents = ["Rome is in Italy.", "Paris is in France.", "Paris is in France"]
+
+        result = eval.evaluate([trace(documents)])
+
+        assert model.prompts[0].count("[Context]:") == 2
+        # Ranks 2 and 3 are relevant: (1/2 + 2/3) / 2
+        assert result[0]["score"] == pytest.approx(7 / 12)
+
+    def test_traces_are_scored_at_once(self, monkeypatch):
+        calls = []
+
+        def record(verdicts, lengths):
+            calls.append(list(lengths))
+            return average_precisions(verdicts, lengths)
+
+        monkeypatch.setattr(context_precision_eval, "average_precisions", record)
+        eval = ContextPrecisionEval(FakeJudge([0, 1]), CONTEXT_PRECISION_TEMPLATE)
+        data = [trace(["Rome.", "Paris."]), trace(["Oslo."]), trace(["Bern.", "Rome."])]
+
+        result = eval.evaluate(data)
+
+        # The trace with a single chunk got two verdicts, which is a parse failure
+        assert calls == [[2, 2]]
+        assert [r.get("score") for r in result] == pytest.approx([0.5, None, 0.5])
+        assert result[1]["error"]["stage"] == "parse"
+        assert all("ranked_verdicts" not in r for r in result)
+
+    def test_verdict_count_must_match_packed_chunks(self):
+        eval = ContextPrecisionEval(FakeJudge([1, 1, 1]), CONTEXT_PRECISION_TEMPLATE)
+
+        result = eval.evaluate([trace(["Paris.", "Paris.", "Rome."])])
+
+        assert result[0]["error"]["type"] == "ValueError"
+        assert eval.num_failed == 1
+
+
+def quadratic_average_precision(verdicts: list[int]) -> float:
+    numerator = sum(
+        (sum(verdicts[: i + 1]) / (i + 1)) * verdicts[i] for i in range(len(verdicts))
+    )
+    return numerator / (sum(verdicts) + 1e-10)
+
+
+class TestAveragePrecisions:
+    """Test the vectorized average precision of `ContextPrecisionEval`."""
+
+    def test_matches_quadratic_formula(self):
+        rng = np.random.default_rng(0)
+        lengths = rng.integers(0, 120, size=50)
+        verdicts = rng.random(lengths.sum()) < 0.3
+
+        scores = average_precisions(verdicts, lengths)
+
+        starts = np.cumsum(lengths) - lengths
+        expected = [
+            quadratic_average_precision(list(verdicts[start : start + length]))
+            for start, length in zip(starts, lengths)
+        ]
+        np.testing.assert_allclose(scores, expected)
+
+    def test_edge_cases(self):
+        scores = average_precisions([True, False, False, False, True], [0, 1, 2, 2])
+
+        np.testing.assert_allclose(scores, [0.0, 1.0, 0.0, 0.5])
+
+    def test_lengths_must_match(self):
+        with pytest.raises(ValueError):
+            average_precisions([True, False], [3])
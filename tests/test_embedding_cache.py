@@ -0,0 +1,79 @@
+import numpy as np
+
+from lynxius_evals.models.cache import CachedEvalModel, EmbeddingCache
+from lynxius_evals.models.eval_model import EvalModel
+
+
+class FakeEmbeddingModel(EvalModel):
+    embedding_model = "fake-embedding"
+
+    def __init__(self):
+        self.embedded = []
+
+    def query(self, prompt: str) -> list[str]:
+        return [prompt]
+
+    def embed(self, input: list[str]) -> list[list[float]]:
+        self.embedded.extend(input)
+        return [[float(len(text)), 1.0, 0.5] for text in input]
+
+
+class TestEmbeddingCache:
+    """Test `EmbeddingCache` and `CachedEvalModel`."""
+
+    def test_embeds_every_distinct_text_once(self):
+        fake = FakeEmbeddingModel()
+        model = CachedEvalModel(fake)
+
+        first = model.embed(["the", "Queen", "the", ","])
+        second = model.embed([",", "the"])
+
+        assert fake.embedded == ["the", "Queen", ","]
+        assert first == [
+            [3.0, 1.0, 0.5],
+            [5.0, 1.0, 0.5],
+            [3.0, 1.0, 0.5],
+            [1.0, 1.0, 0.5],
+        ]
+        assert second == [[1.0, 1.0, 0.5], [3.0, 1.0, 0.5]]
+        assert model.cache.stats() == {"hits": 2, "misses": 4, "size": 3}
+
+    def test_embed_array(self):
+        fake = FakeEmbeddingModel()
+        model = CachedEvalModel(fake)
+        model.embed(["the"])
+
+        embeddings = model.embed_array(["the", "Queen", "the"])
+
+        assert fake.embedded == ["the", "Queen"]
+        assert embeddings.dtype == np.float32
+        np.testing.assert_array_equal(
+            embeddings, [[3.0, 1.0, 0.5], [5.0, 1.0, 0.5], [3.0, 1.0, 0.5]]
+        )
+
+    def test_lru_eviction(self):
+        cache = EmbeddingCache(max_size=2)
+        cache.put_many("m", ["a", "b", "c"], [[1.0], [2.0], [3.0]])
+
+        vectors = cache.get_many("m", ["a", "b", "c"])
+
+        assert vectors[0] is None
+        np.testing.assert_array_equal(vectors[2], [3.0])
+
+    def test_keyed_by_embedding_model(self):
+        cache = EmbeddingCache()
+        cache.put_many("m1", ["a"], [[1.0]])
+
+        assert cache.get_many("m2", ["a"]) == [None]
+
+    def test_persistent_store(self, tmp_path):
+        path = str(tmp_path / "embeddings.sqlite")
+        cache = EmbeddingCache(path=path)
+        CachedEvalModel(FakeEmbeddingModel(), cache).embed(["the", "Queen"])
+        cache.close()
+
+        fake = FakeEmbeddingModel()
+        model = CachedEvalModel(fake, EmbeddingCache(path=path))
+
+        assert model.embed(["Queen"]) == [[5.0, 1.0, 0.5]]
+        assert fake.embedded == []
@@ -0,0 +1,450 @@
+import itertools
+import random
+import time
+
+import numpy as np
+import pytest
+from rapidfuzz.distance.Levenshtein import distance
+
+from lynxius.evals.json_diff import JsonDiff
+from lynxius_evals.evaluators import json_diff_evaluator
+from lynxius_evals.evaluators.assignment import greedy, hungarian
+from lynxius_evals.evaluators.json_diff_evaluator import JsonDiffEval
+
+
+def recursive_json_diff(o1, o2, weights={}):
+    """The original recursive implementation, used as the reference. Equal dicts
+    and lists score exactly 1.0."""
+
+    def get_next_weights(prev_weights, key):
+        if isinstance(prev_weights, (int, float)):
+            return 1.0
+        else:
+            return weights.get(key, 1.0)
+
+    if isinstance(o1, dict) and isinstance(o2, dict):
+        if len(o1) == 0 and len(o2) == 0:
+            return 1
+        elif o1 == o2:
+            return 1.0
+
+        all_keys = set(o1.keys()).union(set(o2.keys()))
+
+        base_scores = []
+        base_weights = []
+        for key in all_keys:
+            next_weights = get_next_weights(weights, key)
+            base_score = recursive_json_diff(o1.get(key), o2.get(key), next_weights)
+
+            loopback_key = "__" + key
+            if isinstance(next_weights, (int, float)):
+                weight = next_weights
+            elif isinstance(next_weights, dict) and loopback_key in next_weights:
+                weight = next_weights[loopback_key]
+            else:
+                weight = 1.0
+
+            base_weights.append(weight)
+            base_scores.append(base_score)
+
+        if sum(base_weights) == 0:
+            base_weights = [1 for _ in base_weights]
+            factor = 1.0
+        else:
+            factor = len(base_weights) / sum(base_weights)
+
+        return sum(s * w * factor for (s, w) in zip(base_scores, base_weights)) / len(
+            base_scores
+        )
+    elif isinstance(o1, list) and isinstance(o2, list):
+        if len(o1) == 0 and len(o2) == 0:
+            return 1
+        elif o1 == o2:
+            return 1.0
+
+        base_scores = [recursive_json_diff(e1, e2, weights) for (e1, e2) in zip(o1, o2)]
+        return sum(base_scores) / len(base_scores)
+    elif isinstance(o1, str) and isinstance(o2, str):
+        max_len = max(len(o1), len(o2))
+        return 1 - (distance(o1, o2) / max_len) if max_len > 0 else 1
+    elif isinstance(o1, (int, float)) and isinstance(o2, (int, float)):
+        if o2 == 0 and o1 == 0:
+            return 1
+        return 1 - abs(o2 - o1) / (abs(o2) + abs(o1))
+    elif o1 is None and o2 is None:
+        return 1
+    else:
+        return 0
+
+
+def random_document(rng: random.Random, depth: int = 0):
+    kind = rng.choice(["dict", "list", "str", "int", "float", "bool", "none"])
+    if depth > 3 or kind in ["str", "int", "float", "bool", "none"]:
+        return rng.choice(
+            [
+                "".join(rng.choices("abcde", k=rng.randint(0, 6))),
+                rng.randint(-5, 5),
+                rng.uniform(-3, 3),
+                rng.random() > 0.5,
+                None,
+            ]
+        )
+    elif kind == "dict":
+        keys = rng.sample(["a", "b", "c", "d", "e", "f"], rng.randint(1, 5))
+        return {key: random_document(rng, depth + 1) for key in keys}
+    else:
+        return [random_document(rng, depth + 1) for _ in range(rng.randint(1, 4))]
+
+
+def mutate(rng: random.Random, document):
+    if isinstance(document, dict):
+        result = {key: mutate(rng, value) for key, value in document.items()}
+        if rng.random() < 0.2:
+            result[rng.choice("abcdef")] = random_document(rng, 3)
+        return result
+    elif isinstance(document, list):
+        return [mutate(rng, element) for element in document]
+    return random_document(rng, 4) if rng.random() < 0.3 else document
+
+
+WEIGHTS = {
+    "a": 2.0,
+    "b": {"__b": 3.0, "c": 0.5, "d": {"e": 4}},
+    "c": 0,
+    "d": {"a": 0.25},
+}
+
+
+class TestJsonDiffEval:
+    """Test the `JsonDiffEval` engine."""
+
+    @pytest.mark.parametrize("weights", [{}, WEIGHTS, 2.0])
+    def test_matches_recursive_implementation(self, weights):
+        rng = random.Random(42)
+        eval = JsonDiffEval()
+        for _ in range(300):
+            reference = random_document(rng)
+            output = mutate(rng, reference)
+            # Lists of different lengths with one of them empty can't be scored
+            try:
+                expected = recursive_json_diff(reference, output, weights)
+            except ZeroDivisionError:
+                with pytest.raises(ZeroDivisionError):
+                    eval.json_diff(reference, output, weights)
+                continue
+
+            assert eval.json_diff(reference, output, weights) == expected
+
+    def test_deep_documents(self):
+        reference, output = "leaf", "loaf"
+        for _ in range(5000):
+            reference, output = {"a": [reference]}, {"a": [output]}
+
+        assert JsonDiffEval().json_diff(reference, output) == 0.75
+
+    def test_evaluate(self):
+        data = [
+            {
+                "reference": {"name": "Acme", "total": 10},
+                "output": {"name": "Acme", "total": 5},
+                "weights": {"total": 3},
+                "contexts": [],
+            }
+        ]
+
+        result = JsonDiffEval().evaluate(data)
+
+        assert result == [{**data[0], "score": pytest.approx((1 + 3 * 2 / 3) / 4)}]
+
+    def test_evaluate_scores_strings_of_all_traces_at_once(self, monkeypatch):
+        rng = random.Random(7)
+        data = []
+        while len(data) < 50:
+            reference = {"a": random_document(rng), "b": "x" * len(data)}
+            output = mutate(rng, reference)
+            try:
+                score = recursive_json_diff(reference, output, WEIGHTS)
+            except ZeroDivisionError:
+                continue
+            data.append(
+                {
+                    "reference": reference,
+                    "output": output,
+                    "weights": WEIGHTS,
+                    "contexts": [],
+                    "expected": score,
+                }
+            )
+
+        calls = []
+        levenshtein_scores = json_diff_evaluator.levenshtein_scores
+        monkeypatch.setattr(
+            json_diff_evaluator,
+            "levenshtein_scores",
+            lambda *args: calls.append(args) or levenshtein_scores(*args),
+        )
+        result = JsonDiffEval().evaluate(data)
+
+        assert len(calls) == 1
+        assert [r["score"] for r in result] == [item["expected"] for item in data]
+
+    def test_parallel_evaluate_keeps_order(self):
+        rng = random.Random(3)
+        shared_weights = {"a": 2.0, "b": {"__b": 0.5}}
+        data = []
+        while len(data) < 40:
+            reference = {"a": random_document(rng), "b": [len(data)]}
+            output = mutate(rng, reference)
+            try:
+                recursive_json_diff(reference, output, shared_weights)
+            except ZeroDivisionError:
+                continue
+            data.append(
+                {
+                    "reference": reference,
+                    "output": output,
+                    "weights": shared_weights,
+                    "contexts": [],
+                }
+            )
+
+        serial = JsonDiffEval().evaluate(data)
+        parallel = JsonDiffEval(num_processes=2, chunksize=7).evaluate(data)
+
+        assert parallel == serial
+
+    def test_equality_is_found_bottom_up(self, monkeypatch):
+        compared = []
+        equal = json_diff_evaluator._equal
+        monkeypatch.setattr(
+            json_diff_evaluator,
+            "_equal",
+            lambda o1, o2: compared.append((o1, o2)) or equal(o1, o2),
+        )
+        reference, output = {"a": [1, "x", None]}, {"a": [1, "x", None]}
+        for _ in range(100):
+            reference, output = {"b": reference, "c": 1}, {"b": output, "c": 1.0}
+
+        assert JsonDiffEval().json_diff(reference, output, WEIGHTS) == 1.0
+        assert JsonDiffEval().json_diff(
+            {"b": reference, "c": 1}, {"b": output, "c": 2}
+        ) == pytest.approx(5 / 6)
+        assert JsonDiffEval().json_diff(
+            {"a": [1, 2]}, {"a": [1, 2, 3]}
+        ) == recursive_json_diff({"a": [1, 2]}, {"a": [1, 2, 3]})
+        # Only whole documents are compared, not the subtrees at every level
+        assert len(compared) == 3
+
+    def test_per_path_scores(self):
+        reference = {"name": "Acme", "items": [{"sku": "a/1", "qty": 2}], "id": 7}
+        output = {"name": "Acne", "items": [{"sku": "a/1", "qty": 2}], "id": 7}
+        eval = JsonDiffEval(return_paths=True)
+
+        result = eval.evaluate(
+            [{"reference": reference, "output": output, "contexts": []}]
+        )[0]
+        scores = dict(
+            zip([eval.paths[i] for i in result["path_ids"]], result["path_scores"])
+        )
+
+        # Nodes below the equal list are listed as well
+        assert scores == {
+            "/name": 0.75,
+            "/items/0/sku": 1.0,
+            "/items/0/qty": 1.0,
+            "/items/0": 1.0,
+            "/items": 1.0,
+            "/id": 1.0,
+            "": pytest.approx(2.75 / 3),
+        }
+        assert result["score"] == scores[""]
+
+    def test_json_diff_paths_updates_paths(self):
+        eval = JsonDiffEval()
+
+        score, path_ids, path_scores = eval.json_diff_paths(
+            {"name": "Acme", "id": 7}, {"name": "Acne", "id": 7}
+        )
+
+        assert score == 0.875
+        assert dict(zip([eval.paths[i] for i in path_ids], path_scores)) == {
+            "/name": 0.75,
+            "/id": 1.0,
+            "": 0.875,
+        }
+
+    def test_identical_subtrees_are_not_traversed(self, monkeypatch):
+        shared = {"items": [{"sku": "a", "qty": 1}] * 3}
+        visited = []
+        monkeypatch.setattr(
+            json_diff_evaluator,
+            "leaf_score",
+            lambda o1, o2: visited.append((o1, o2)) or 0.0,
+        )
+
+        assert JsonDiffEval().json_diff(shared, dict(shared)) == 1.0
+        assert JsonDiffEval().json_diff({"a": shared, "b": 1}, {"a": shared}) == 0.5
+        assert visited == [(1, None)]
+
+    def test_front_end_stores_path_scores(self):
+        eval = JsonDiff(label="unit_test", return_paths=True)
+        eval.add_trace({"name": "Acme", "id": 7}, {"name": "Acne", "id": 7})
+
+        eval.evaluate_local()
+        body = eval.get_request_body(run_local=True)
+
+        assert body["data"][0]["path_scores"] == {
+            "/name": 0.75,
+            "/id": 1.0,
+            "": 0.875,
+        }
+
+    def test_per_path_scores_in_process_pool(self):
+        data = [
+            {
+                "reference": {"a": [i, "x"], f"k~{i % 3}": "y"},
+                "output": {"a": [i + 1, "z"], f"k~{i % 3}": "yy"},
+                "contexts": [],
+            }
+            for i in range(10)
+        ]
+
+        serial = JsonDiffEval(return_paths=True)
+        expected = serial.evaluate(data)
+        parallel = JsonDiffEval(num_processes=2, chunksize=3, return_paths=True)
+        result = parallel.evaluate(data)
+
+        for r, e in zip(result, expected):
+            assert r["score"] == e["score"]
+            assert [parallel.paths[i] for i in r["path_ids"]] == [
+                serial.paths[i] for i in e["path_ids"]
+            ]
+            np.testing.assert_array_equal(r["path_scores"], e["path_scores"])
+        assert "/k~00" in parallel.paths
+
+
+class TestJsonDiffListMatching:
+    """Test order-insensitive list matching of `JsonDiffEval`."""
+
+    ITEMS = [
+        {"sku": "A-100", "qty": 2, "price": 9.5},
+        {"sku": "B-200", "qty": 1, "price": 20.0},
+        {"sku": "C-300", "qty": 5, "price": 1.25},
+    ]
+
+    def test_hungarian_finds_optimal_assignment(self):
+        rng = np.random.default_rng(0)
+        for n, m in [(3, 3), (2, 5), (5, 2), (4, 4)]:
+            scores = np.round(rng.random((n, m)), 1)
+
+            rows, columns = hungarian(scores)
+
+            # Brute force over all assignments of the shorter side
+            wide = scores if n <= m else scores.T
+            best = max(
+                sum(wide[i, j] for i, j in enumerate(assignment))
+                for assignment in itertools.permutations(
+                    range(wide.shape[1]), len(wide)
+                )
+            )
+            assert scores[rows, columns].sum() == pytest.approx(best)
+            assert len(set(rows)) == len(set(columns)) == min(n, m)
+
+    def test_unordered_lists(self):
+        reference = {"items": self.ITEMS}
+        output = {"items": self.ITEMS[::-1]}
+
+        assert JsonDiffEval().json_diff(reference, output) < 1.0
+        assert JsonDiffEval(list_matching="optimal").json_diff(reference, output) == 1.0
+
+    def test_extra_elements_score_zero(self):
+        eval = JsonDiffEval(list_matching="optimal")
+
+        assert eval.json_diff(["b", "a", "c"], ["a", "b"]) == pytest.approx(2 / 3)
+        assert eval.json_diff([], ["a"]) == 0.0
+        assert eval.json_diff(["abcd", ""], ["", "abce"]) == pytest.approx(0.875)
+
+    def test_greedy_and_fallback(self):
+        reference = self.ITEMS
+        output = [{**self.ITEMS[2], "qty": 4}, self.ITEMS[0]]
+
+        optimal = JsonDiffEval(list_matching="optimal").json_diff(reference, output)
+        greedy_score = JsonDiffEval(
+            list_matching="optimal", hungarian_max_size=0
+        ).json_diff(reference, output)
+        positional = JsonDiffEval(
+            list_matching="optimal", max_matching_object_pairs=5
+        ).json_diff(reference, output)
+
+        assert greedy_score == optimal
+        assert optimal == pytest.approx((1 + (2 + 8 / 9) / 3) / 3)
+        assert positional < optimal
+
+    def test_reports_fallbacks(self):
+        data = [
+            {"reference": {"a": self.ITEMS}, "output": {"a": s}, "contexts": []}
+            for s in [self.ITEMS[::-1], self.ITEMS[:1]]
+        ]
+
+        result = JsonDiffEval(
+            list_matching="optimal", max_matching_object_pairs=5
+        ).evaluate(data)
+
+        assert [r["matching_fallbacks"] for r in result] == [1, 0]
+        assert "matching_fallbacks" not in JsonDiffEval().evaluate(data)[0]
+
+    def test_mixed_elements(self, monkeypatch):
+        diffed = []
+        diff_scores = json_diff_evaluator._diff_scores
+
+        def record(traces, *args, **kwargs):
+            diffed.extend((o1, o2) for o1, o2, _ in traces)
+            return diff_scores(traces, *args, **kwargs)
+
+        monkeypatch.setattr(json_diff_evaluator, "_diff_scores", record)
+        reference = [1, "ab", {"x": 1}, None, [1]]
+        output = [[2], {"x": 1}, None, "ac", 1.0]
+
+        score = JsonDiffEval(list_matching="optimal").json_diff(reference, output)
+
+        # Only the differing pairs of two strings or two lists are diffed
+        assert score == pytest.approx((1 + 0.5 + 1 + 1 + 2 / 3) / 5)
+        assert sorted(map(str, diffed[1:])) == ["('ab', 'ac')", "([1], [2])"]
+
+    def test_long_lists_of_dicts(self):
+        rng = random.Random(0)
+        reference = [
+            {"name": "".join(rng.choices("abcdefgh", k=8)), "qty": rng.randint(1, 9)}
+            for _ in range(1000)
+        ]
+        output = [{**item, "qty": item["qty"] + 1} for item in reference]
+        shuffled = rng.sample(output, len(output))
+
+        start = time.perf_counter()
+        score = JsonDiffEval(list_matching="optimal").json_diff(reference, shuffled)
+
+        # Only a few candidates per element are diffed, yet the pairs are found
+        assert time.perf_counter() - start < 5
+        assert score == pytest.approx(JsonDiffEval().json_diff(reference, output))
+
+    def test_numeric_lists(self):
+        eval = JsonDiffEval(list_matching="optimal")
+
+        assert eval.json_diff([0, 3, 1.5], [1.5, 0, 3]) == 1.0
+        assert eval.json_diff([1, 0], [2]) == pytest.approx((1 - 1 / 3) / 2)
+
+    def test_greedy_matches_sparse_scores(self):
+        scores = np.array([[0.0, 0.0, 0.0], [0.0, 0.5, 0.0], [0.0, 0.0, 0.0]])
+
+        rows, columns = greedy(scores)
+
+        assert (rows.tolist(), columns.tolist()) == ([0, 1, 2], [0, 1, 2])
+
+    def test_greedy_is_not_optimal(self):
+        scores = np.array([[0.9, 0.8], [0.85, 0.1], [0.2, 0.3]])
+
+        rows, columns = greedy(scores)
+        optimal_rows, optimal_columns = hungarian(scores)
+
+        assert (rows.tolist(), columns.tolist()) == ([0, 2], [0, 1])
+        assert (optimal_rows.tolist(), optimal_columns.tolist()) == ([0, 1], [1, 0])
@@ -0,0 +1,289 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from lynxius_evals.evaluators.answer_correctness_eval import AnswerCorrectnessEval
+from lynxius_evals.evaluators.llm_based_eval import LLMBasedEval
+from lynxius_evals.models.eval_model import AsyncEvalModel, EvalModel
+from lynxius_evals.models.tokens import TokenCounter, TokenLimitExceededError
+from lynxius_evals.prompts.answer_correctness_prompt import ANSWER_CORRECTNESS_TEMPLATE
+from lynxius_evals.prompts.eval_prompt import EvalPromptTemplate
+
+TEMPLATE = EvalPromptTemplate("Test", "Is {output} correct?")
+
+
+class FakeModel(EvalModel):
+    def query(self, prompt: str) -> list[str]:
+        return ["correct" if "yes" in prompt else "incorrect"]
+
+    def embed(self, input: list[str]) -> list[list[float]]:
+        raise NotImplementedError
+
+
+class FakeAsyncModel(AsyncEvalModel):
+    def __init__(self, output: str | None = None):
+        self.output = output
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def query(self, prompt: str) -> list[str]:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.001)
+        self.in_flight -= 1
+
+        if self.output is not None:
+            return [self.output]
+        return ["correct" if "yes" in prompt else "incorrect"]
+
+    async def embed(self, input: list[str]) -> list[list[float]]:
+        raise NotImplementedError
+
+
+class TestLLMBasedEval:
+    """Test `LLMBasedEval` execution engines."""
+
+    def test_evaluate(self):
+        eval = LLMBasedEval(FakeModel(), TEMPLATE, {"correct": 1.0}, 0.0)
+
+        result = eval.evaluate([{"output": "yes"}, {"output": "no"}])
+
+        assert [r["score"] for r in result] == [1.0, 0.0]
+        assert result[0]["llm_input"] == "Is yes correct?"
+
+    def test_evaluate_async_bounds_concurrency(self):
+        model = FakeAsyncModel()
+        eval = LLMBasedEval(model, TEMPLATE, {"correct": 1.0}, 0.0, max_concurrency=3)
+        data = [{"output": "yes" if i % 2 else "no"} for i in range(20)]
+
+        result = asyncio.run(eval.evaluate_async(data))
+
+        assert [r["score"] for r in result] == [float(i % 2) for i in range(20)]
+        assert model.max_in_flight == 3
+
+    def test_evaluate_async_subclass(self):
+        output = json.dumps({"TP": ["a"], "FP": [], "FN": ["b"]})
+        eval = AnswerCorrectnessEval(
+            FakeAsyncModel(output), ANSWER_CORRECTNESS_TEMPLATE
+        )
+        data = [{"query": "q", "reference": "r", "output": "o"}]
+
+        result = asyncio.run(eval.evaluate_async(data))
+
+        assert result[0]["score"] == pytest.approx(1 / 1.5)
+
+    def test_evaluate_async_requires_async_model(self):
+        eval = LLMBasedEval(FakeModel(), TEMPLATE, {"correct": 1.0}, 0.0)
+
+        with pytest.raises(TypeError):
+            asyncio.run(eval.evaluate_async([{"output": "yes"}]))
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FlakyModel(EvalModel):
+    def __init__(self, failures: int, error: Exception | None = None):
+        self.failures = failures
+        self.error = error or ConnectionError("Connection reset by peer")
+        self.calls = {}
+
+    def query(self, prompt: str) -> list[str]:
+        self.calls[prompt] = self.calls.get(prompt, 0) + 1
+        if self.calls[prompt] <= self.failures:
+            raise self.error
+        return ["correct"]
+
+    def embed(self, input: list[str]) -> list[list[float]]:
+        raise NotImplementedError
+
+
+class TestLLMBasedEvalRetries:
+    """Test retries and failure accounting of `LLMBasedEval`."""
+
+    def test_retries_transient_errors(self):
+        model = FlakyModel(failures=2)
+        eval = LLMBasedEval(
+            model, TEMPLATE, {"correct": 1.0}, 0.0, max_retries=2, retry_backoff=0
+        )
+
+        result = eval.evaluate([{"output": "a"}, {"output": "b"}])
+
+        assert [r["score"] for r in result] == [1.0, 1.0]
+        assert model.calls == {"Is a correct?": 3, "Is b correct?": 3}
+        assert (eval.num_succeeded, eval.num_failed) == (2, 0)
+
+    def test_records_failures(self):
+        eval = LLMBasedEval(
+            FlakyModel(failures=5),
+            TEMPLATE,
+            {"correct": 1.0},
+            0.0,
+            max_retries=1,
+            retry_backoff=0,
+        )
+
+        result = eval.evaluate([{"output": "a"}])
+
+        assert "score" not in result[0]
+        assert result[0]["error"] == {
+            "stage": "query",
+            "type": "ConnectionError",
+            "message": "Connection reset by peer",
+        }
+        assert (eval.num_succeeded, eval.num_failed) == (0, 1)
+
+    @pytest.mark.parametrize("status_code", [429, 503])
+    def test_retries_retryable_status_codes(self, status_code):
+        model = FlakyModel(failures=1, error=HTTPError(status_code))
+        eval = LLMBasedEval(
+            model, TEMPLATE, {"correct": 1.0}, 0.0, max_retries=2, retry_backoff=0
+        )
+
+        result = eval.evaluate([{"output": "a"}])
+
+        assert result[0]["score"] == 1.0
+        assert model.calls == {"Is a correct?": 2}
+
+    @pytest.mark.parametrize(
+        "error", [HTTPError(400), HTTPError(401), TokenLimitExceededError()]
+    )
+    def test_doesnt_retry_permanent_errors(self, error):
+        model = FlakyModel(failures=1, error=error)
+        eval = LLMBasedEval(
+            model, TEMPLATE, {"correct": 1.0}, 0.0, max_retries=2, retry_backoff=0
+        )
+
+        result = eval.evaluate([{"output": "a"}])
+
+        assert result[0]["error"]["type"] == type(error).__name__
+        assert model.calls == {"Is a correct?": 1}
+
+    def test_rate_limited_model_retries_429_itself(self):
+        model = FlakyModel(failures=1, error=HTTPError(429))
+        model.rate_limiter = object()
+        eval = LLMBasedEval(
+            model, TEMPLATE, {"correct": 1.0}, 0.0, max_retries=2, retry_backoff=0
+        )
+
+        eval.evaluate([{"output": "a"}])
+
+        assert model.calls == {"Is a correct?": 1}
+
+    def test_records_parse_failures(self):
+        model = FakeModel()
+        model.query = lambda prompt: ['{"TP": []}']
+        eval = AnswerCorrectnessEval(model, ANSWER_CORRECTNESS_TEMPLATE)
+
+        result = eval.evaluate([{"query": "q", "reference": "r", "output": "o"}])
+
+        assert result[0]["llm_output"] == '{"TP": []}'
+        assert result[0]["error"]["stage"] == "parse"
+        assert eval.num_failed == 1
+
+    def test_failures_are_logged_without_traceback(self, caplog):
+        counter = FakeTokenCounter("gpt-4o", context_limit=2)
+        eval = LLMBasedEval(
+            FakeModel(), TEMPLATE, {"correct": 1.0}, 0.0, token_counter=counter
+        )
+
+        eval.evaluate([{"output": "a long answer"}])
+
+        assert "TokenLimitExceededError" in caplog.text
+        assert "NoneType: None" not in caplog.text
+
+
+class FakeTokenCounter(TokenCounter):
+    def count(self, texts: list[str]) -> list[int]:
+        self.calls = getattr(self, "calls", 0) + 1
+        return [len(text.split()) for text in texts]
+
+
+class TestLLMBasedEvalTokens:
+    """Test token accounting of `LLMBasedEval`."""
+
+    def test_context_limit_lookup(self):
+        assert TokenCounter("gpt-4o-2024-08-06").context_limit == 128_000
+        assert TokenCounter("gpt-4-0613").context_limit == 8_192
+        assert TokenCounter("gpt-4.1-mini").context_limit == 1_047_576
+        assert TokenCounter("gpt-4.5-preview").context_limit == 128_000
+        assert TokenCounter("gpt-4-unknown").context_limit is None
+        assert TokenCounter("my-model").context_limit is None
+
+    def test_single_prompts_skip_the_thread_pool(self):
+        class Encoding:
+            def encode_ordinary(self, text):
+                return text.split()
+
+            def encode_ordinary_batch(self, texts):
+                raise AssertionError("A single prompt must not start threads")
+
+        class Counter(TokenCounter):
+            encoding = Encoding()
+
+        assert Counter("gpt-4o").count(["a long prompt"]) == [3]
+
+    def test_unavailable_tokenizer_skips_counting(self):
+        class Counter(TokenCounter):
+            def count(self, texts: list[str]) -> list[int]:
+                raise ValueError("Could not download the encoding")
+
+        eval = LLMBasedEval(
+            FakeModel(), TEMPLATE, {"correct": 1.0}, 0.0, token_counter=Counter("x")
+        )
+
+        result = eval.evaluate([{"output": "yes"}, {"output": "no"}])
+
+        assert [r["score"] for r in result] == [1.0, 0.0]
+        assert "llm_input_tokens" not in result[0]
+        assert eval.num_input_tokens == 0
+
+    def test_evaluate_async_counts_off_the_event_loop(self):
+        threads = []
+
+        class Counter(FakeTokenCounter):
+            def count(self, texts: list[str]) -> list[int]:
+                threads.append(threading.get_ident())
+                return super().count(texts)
+
+        counter = Counter("gpt-4o")
+        eval = LLMBasedEval(
+            FakeAsyncModel(), TEMPLATE, {"correct": 1.0}, 0.0, token_counter=counter
+        )
+
+        result = asyncio.run(eval.evaluate_async([{"output": "yes"}]))
+
+        assert result[0]["llm_input_tokens"] == 3
+        assert len(threads) == 1 and threads[0] != threading.get_ident()
+
+    def test_counts_all_prompts_in_one_batch(self):
+        counter = FakeTokenCounter("gpt-4o")
+        eval = LLMBasedEval(
+            FakeModel(), TEMPLATE, {"correct": 1.0}, 0.0, token_counter=counter
+        )
+
+        result = eval.evaluate([{"output": "yes"}, {"output": "a long no"}])
+
+        assert counter.calls == 1
+        assert [r["llm_input_tokens"] for r in result] == [3, 5]
+        assert eval.num_input_tokens == 8
+
+    def test_enforces_context_limit_per_trace(self):
+        model = FlakyModel(failures=0)
+        counter = FakeTokenCounter("gpt-4o", context_limit=4)
+        eval = LLMBasedEval(
+            model, TEMPLATE, {"correct": 1.0}, 0.0, token_counter=counter
+        )
+
+        result = eval.evaluate([{"output": "yes"}, {"output": "a long no"}])
+
+        assert model.calls == {"Is yes correct?": 1}
+        assert result[0]["score"] == 1.0
+        assert result[1]["error"]["stage"] == "tokens"
+        assert result[1]["error"]["type"] == "TokenLimitExceededError"
+        assert (eval.num_succeeded, eval.num_failed) == (1, 1)
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+from lynxius_evals.evaluators.rag_eval import RagEval
+from lynxius_evals.models.eval_model import EvalModel
+from lynxius_evals.prompts.rag_prompt import RAG_TEMPLATE
+
+VERDICTS = {
+    "answer_correctness": {"TP": ["a"], "FP": [], "FN": ["b"]},
+    "context_precision": {"result": [0, 1]},
+}
+
+
+class FakeJudge(EvalModel):
+    def __init__(self, output: str):
+        self.output = output
+        self.prompts = []
+
+    def query(self, prompt: str) -> list[str]:
+        self.prompts.append(prompt)
+        return [self.output]
+
+    def embed(self, input: list[str]) -> list[list[float]]:
+        raise NotImplementedError
+
+
+def trace(output="o"):
+    return {
+        "query": "q",
+        "reference": "r",
+        "output": output,
+        "contexts": [{"document": "first"}, {"document": "second"}],
+    }
+
+
+class TestRagEval:
+    """Test `RagEval`."""
+
+    def test_scores_all_metrics_with_one_call(self):
+        model = FakeJudge(json.dumps(VERDICTS))
+        eval = RagEval(model, RAG_TEMPLATE)
+
+        result = eval.evaluate([trace()])
+
+        assert len(model.prompts) == 1
+        assert "[Context]: first" in model.prompts[0]
+        assert "[Answer]: o" in model.prompts[0]
+        assert result[0]["score"] == {
+            "answer_correctness": pytest.approx(1 / 1.5),
+            "context_precision": pytest.approx(0.5),
+        }
+
+    def test_oversized_first_chunk_fails(self):
+        model = FakeJudge(json.dumps(VERDICTS))
+        eval = RagEval(model, RAG_TEMPLATE, max_context_tokens=10)
+
+        result = eval.evaluate([trace()])
+
+        assert result[0]["error"]["stage"] == "tokens"
+        assert model.prompts == []
+
+    def test_split_results(self):
+        eval = RagEval(FakeJudge(json.dumps(VERDICTS)), RAG_TEMPLATE)
+        result = eval.evaluate([trace()])
+
+        split = eval.split_results(result)
+
+        answer_correctness = split["answer_correctness"][0]
+        assert answer_correctness["score"] == pytest.approx(1 / 1.5)
+        assert (
+            json.loads(answer_correctness["llm_output"])
+            == VERDICTS["answer_correctness"]
+        )
+        assert answer_correctness["llm_input"] == result[0]["llm_input"]
+        context_precision = split["context_precision"][0]
+        assert context_precision["score"] == pytest.approx(0.5)
+        assert json.loads(context_precision["llm_output"]) == {"result": [0, 1]}
+
+    def test_missing_metric_is_a_parse_failure(self):
+        output = json.dumps({"answer_correctness": VERDICTS["answer_correctness"]})
+        eval = RagEval(FakeJudge(output), RAG_TEMPLATE)
+
+        result = eval.evaluate([trace()])
+        split = eval.split_results(result)
+
+        assert result[0]["error"]["stage"] == "parse"
+        assert "score" not in split["context_precision"][0]
+        assert split["answer_correctness"][0]["error"] == result[0]["error"]
+
+    def test_invalid_json(self):
+        eval = RagEval(FakeJudge("not json"), RAG_TEMPLATE)
+
+        result = eval.evaluate([trace()])
+
+        assert result[0]["error"]["type"] == "JSONDecodeError"
+        assert "score" not in result[0]
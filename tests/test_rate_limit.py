@@ -0,0 +1,182 @@
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from openai import RateLimitError
+
+from lynxius_evals.evaluators.llm_based_eval import LLMBasedEval
+from lynxius_evals.models.eval_model import EvalModel
+from lynxius_evals.models.openai import OpenAIModel
+from lynxius_evals.models.rate_limit import (
+    RateLimitedEvalModel,
+    RateLimiter,
+    parse_duration,
+)
+from lynxius_evals.prompts.eval_prompt import EvalPromptTemplate
+
+
+class FakeRawResponse:
+    def __init__(self, headers):
+        self.headers = httpx.Headers(headers)
+
+    def parse(self):
+        message = SimpleNamespace(content="correct")
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=message)],
+            usage=SimpleNamespace(completion_tokens=10),
+        )
+
+
+class FakeCompletions:
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+        self.with_raw_response = self
+
+    def create(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            request = httpx.Request("POST", "https://api.openai.com/v1/chat")
+            response = httpx.Response(
+                429, headers={"retry-after-ms": "1"}, request=request
+            )
+            raise RateLimitError("Rate limit reached", response=response, body=None)
+        return FakeRawResponse(
+            {
+                "x-ratelimit-limit-requests": "500",
+                "x-ratelimit-remaining-requests": "499",
+                "x-ratelimit-limit-tokens": "30000",
+                "x-ratelimit-remaining-tokens": "29000",
+            }
+        )
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FlakyModel(EvalModel):
+    def __init__(self, failures: int, status_code: int = 429):
+        self.failures = failures
+        self.status_code = status_code
+        self.calls = 0
+
+    def query(self, prompt: str) -> list[str]:
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise HTTPError(self.status_code)
+        return ["correct"]
+
+    def embed(self, input: list[str]) -> list[list[float]]:
+        raise NotImplementedError
+
+
+class TestRateLimiter:
+    """Test `RateLimiter` budgeting and its use in `OpenAIModel`."""
+
+    @pytest.mark.parametrize(
+        "value,expected",
+        [("1", 1.0), ("20ms", 0.02), ("1.5s", 1.5), ("6m0s", 360.0), ("x", None)],
+    )
+    def test_parse_duration(self, value, expected):
+        assert parse_duration(value) == expected
+
+    def test_request_budget(self):
+        limiter = RateLimiter(requests_per_minute=60)
+        limiter.requests.level = 1
+
+        assert limiter._reserve(0) == 0.0
+        assert limiter._reserve(0) == pytest.approx(1.0, abs=0.01)
+
+    def test_token_budget(self):
+        limiter = RateLimiter(tokens_per_minute=600)
+
+        assert limiter._reserve(600) == 0.0
+        assert limiter._reserve(100) == pytest.approx(10.0, abs=0.01)
+
+    def test_headers_only_lower_configured_budget(self):
+        limiter = RateLimiter(requests_per_minute=100)
+        limiter.update_from_headers(
+            {"x-ratelimit-limit-requests": "500", "x-ratelimit-limit-tokens": "1000"}
+        )
+
+        assert limiter.requests.capacity == 100
+        assert limiter.tokens.capacity == 1000
+
+    def test_retry_after_blocks_callers(self):
+        limiter = RateLimiter()
+        limiter.update_from_headers({"retry-after": "2"})
+
+        assert limiter._reserve(0) == pytest.approx(2.0, abs=0.01)
+
+    def test_model_retries_rate_limited_calls(self, monkeypatch):
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+        limiter = RateLimiter()
+        model = OpenAIModel(rate_limiter=limiter)
+        monkeypatch.setattr(model, "_count_prompt_tokens", lambda messages: 5)
+        completions = FakeCompletions(failures=2)
+        model.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+        assert model.query("Is this correct?") == ["correct"]
+        assert completions.calls == 3
+        assert limiter.tokens.capacity == 30000
+
+    def test_model_gives_up_after_max_retries(self, monkeypatch):
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+        model = OpenAIModel(rate_limiter=RateLimiter(max_retries=1))
+        monkeypatch.setattr(model, "_count_prompt_tokens", lambda messages: 5)
+        completions = FakeCompletions(failures=5)
+        model.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+        with pytest.raises(RateLimitError):
+            model.query("Is this correct?")
+        assert completions.calls == 2
+
+    def test_sdk_retries_are_disabled_with_limiter(self, monkeypatch):
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+
+        assert OpenAIModel(rate_limiter=RateLimiter()).client.max_retries == 0
+        assert OpenAIModel().client.max_retries > 0
+
+    def test_sdk_query_retries_are_disabled_by_retrying_evals(self, monkeypatch):
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+        template = EvalPromptTemplate("Test", "Is {output} correct?")
+        model = OpenAIModel()
+        wrapped = OpenAIModel()
+
+        LLMBasedEval(model, template, {"correct": 1.0}, 0.0)
+        LLMBasedEval(RateLimitedEvalModel(wrapped, RateLimiter()), template, {}, 0.0)
+
+        assert model._chat_completions()._client.max_retries == 0
+        assert wrapped._chat_completions()._client.max_retries == 0
+        # Embeddings aren't retried by evaluators
+        assert model.client.max_retries > 0
+
+    def test_sdk_query_retries_are_kept_without_eval_retries(self, monkeypatch):
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+        template = EvalPromptTemplate("Test", "Is {output} correct?")
+        model = OpenAIModel()
+
+        LLMBasedEval(model, template, {"correct": 1.0}, 0.0, max_retries=0)
+
+        assert model._chat_completions()._client.max_retries > 0
+
+    def test_wraps_any_model(self):
+        limiter = RateLimiter(requests_per_minute=6000)
+        model = FlakyModel(failures=2)
+        limited = RateLimitedEvalModel(model, limiter)
+        # Don't wait for the back-off after a 429 without retry-after
+        limiter.on_rate_limited = lambda headers=None: None
+
+        assert limited.query("Is this correct?") == ["correct"]
+        assert model.calls == 3
+
+    def test_wrapper_doesnt_retry_other_errors(self):
+        model = FlakyModel(failures=1, status_code=400)
+        limited = RateLimitedEvalModel(model, RateLimiter())
+
+        with pytest.raises(HTTPError):
+            limited.query("Is this correct?")
+        assert model.calls == 1
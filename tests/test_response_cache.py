@@ -0,0 +1,196 @@
+import asyncio
+
+from lynxius_evals.evaluators.answer_correctness_eval import AnswerCorrectnessEval
+from lynxius_evals.evaluators.llm_based_eval import LLMBasedEval
+from lynxius_evals.models import cache
+from lynxius_evals.models.cache import (
+    CachedEvalModel,
+    ResponseCache,
+    response_cache_key,
+)
+from lynxius_evals.models.eval_model import AsyncEvalModel, EvalModel
+from lynxius_evals.prompts.answer_correctness_prompt import ANSWER_CORRECTNESS_TEMPLATE
+from lynxius_evals.prompts.eval_prompt import EvalPromptTemplate
+
+TEMPLATE = EvalPromptTemplate("Test", "Is {output} correct?")
+
+
+class CountingModel(EvalModel):
+    model = "fake-judge"
+    temperature = 0.0
+    response_format = "text"
+
+    def __init__(self):
+        self.prompts = []
+
+    def query(self, prompt: str) -> list[str]:
+        self.prompts.append(prompt)
+        return ["correct" if "yes" in prompt else "incorrect"]
+
+    def embed(self, input: list[str]) -> list[list[float]]:
+        raise NotImplementedError
+
+
+class CountingAsyncModel(AsyncEvalModel):
+    model = "fake-judge"
+
+    def __init__(self):
+        self.prompts = []
+
+    async def query(self, prompt: str) -> list[str]:
+        self.prompts.append(prompt)
+        return ["correct" if "yes" in prompt else "incorrect"]
+
+    async def embed(self, input: list[str]) -> list[list[float]]:
+        raise NotImplementedError
+
+
+class TestResponseCache:
+    """Test `ResponseCache` and its use in `LLMBasedEval`."""
+
+    def test_only_changed_traces_are_sent(self, tmp_path):
+        path = str(tmp_path / "responses.sqlite")
+        model = CountingModel()
+        eval = LLMBasedEval(
+            model, TEMPLATE, {"correct": 1.0}, 0.0, response_cache=ResponseCache(path)
+        )
+        eval.evaluate([{"output": "yes"}, {"output": "no"}])
+        eval.response_cache.close()
+
+        model.prompts = []
+        eval.response_cache = ResponseCache(path)
+        result = eval.evaluate([{"output": "yes"}, {"output": "yes!"}])
+
+        assert model.prompts == ["Is yes! correct?"]
+        assert [r["score"] for r in result] == [1.0, 1.0]
+        assert result[0]["llm_output"] == "correct"
+        assert (eval.num_cached, eval.num_succeeded) == (1, 2)
+
+    def test_evaluate_async(self):
+        model = CountingAsyncModel()
+        eval = LLMBasedEval(
+            model, TEMPLATE, {"correct": 1.0}, 0.0, response_cache=ResponseCache()
+        )
+        data = [{"output": "yes"}, {"output": "no"}]
+
+        asyncio.run(eval.evaluate_async(data))
+        result = asyncio.run(eval.evaluate_async(data))
+
+        assert len(model.prompts) == 2
+        assert [r["score"] for r in result] == [1.0, 0.0]
+        assert eval.num_cached == 2
+
+    def test_keyed_by_model_parameters(self):
+        model = CountingModel()
+        key = response_cache_key(model, "prompt")
+        model.temperature = 0.7
+
+        assert response_cache_key(model, "prompt") != key
+        assert response_cache_key(model, "prompt") == response_cache_key(
+            model, "prompt"
+        )
+
+    def test_wrapped_models_share_keys(self):
+        model = CountingModel()
+
+        assert response_cache_key(
+            CachedEvalModel(CachedEvalModel(model)), "prompt"
+        ) == response_cache_key(model, "prompt")
+
+    def test_malformed_outputs_are_not_cached(self):
+        def parse_output(output, variable_values):
+            if output == "incorrect":
+                raise ValueError("Unexpected verdict")
+            return 1.0
+
+        model = CountingModel()
+        eval = LLMBasedEval(
+            model, TEMPLATE, {"correct": 1.0}, 0.0, response_cache=ResponseCache()
+        )
+        eval.parse_output = parse_output
+        data = [{"output": "yes"}, {"output": "no"}]
+
+        eval.evaluate(data)
+        result = eval.evaluate(data)
+
+        # Only the malformed output is requested again
+        assert sorted(model.prompts) == [
+            "Is no correct?",
+            "Is no correct?",
+            "Is yes correct?",
+        ]
+        assert result[1]["error"]["stage"] == "parse"
+        assert eval.num_cached == 1
+
+    def test_garbled_judge_outputs_are_not_cached(self):
+        model = CountingModel()
+        model.query = lambda prompt: model.prompts.append(prompt) or ["not json"]
+        eval = AnswerCorrectnessEval(
+            model, ANSWER_CORRECTNESS_TEMPLATE, response_cache=ResponseCache()
+        )
+        data = [{"query": "q", "reference": "r", "output": "o"}]
+
+        eval.evaluate(data)
+        result = eval.evaluate(data)
+
+        assert len(model.prompts) == 2
+        assert result[0]["error"]["stage"] == "parse"
+        assert eval.num_cached == 0
+
+    def test_writes_once_per_run(self, monkeypatch):
+        model = CountingModel()
+        responses = ResponseCache()
+        writes = []
+        put_many = responses.put_many
+        monkeypatch.setattr(
+            responses, "put_many", lambda items: writes.append(items) or put_many(items)
+        )
+        eval = LLMBasedEval(
+            model, TEMPLATE, {"correct": 1.0}, 0.0, response_cache=responses
+        )
+
+        eval.evaluate([{"output": "yes"}, {"output": "no"}, {"output": "maybe"}])
+
+        assert [len(items) for items in writes] == [3]
+        assert responses.stats()["size"] == 3
+
+    def test_ttl(self, monkeypatch):
+        now = 1000.0
+        monkeypatch.setattr(cache.time, "time", lambda: now)
+        responses = ResponseCache(ttl=60)
+        responses.put("a", ["x"])
+
+        now += 30
+        assert responses.get_many(["a"]) == {"a": ["x"]}
+        now += 31
+        assert responses.get_many(["a"]) == {}
+        assert responses.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+    def test_size_eviction(self, monkeypatch):
+        now = 1000.0
+        monkeypatch.setattr(cache.time, "time", lambda: now)
+        responses = ResponseCache(max_size=2)
+        responses.put("a", ["1"])
+        now += 1
+        responses.put("b", ["2"])
+        now += 1
+        # Reading "a" makes "b" the least recently used response
+        responses.get_many(["a"])
+        now += 1
+        responses.put("c", ["3"])
+
+        assert responses.get_many(["a", "b", "c"]) == {"a": ["1"], "c": ["3"]}
+        assert responses.stats()["size"] == 2
+
+    def test_many_keys_are_queried_in_chunks(self, monkeypatch):
+        monkeypatch.setattr(cache, "SQLITE_CHUNK_SIZE", 2)
+        responses = ResponseCache()
+        responses.put_many({"a": ["1"], "b": ["2"], "c": ["3"]})
+        responses.put_many({"c": ["4"], "d": ["5"], "e": ["6"]})
+
+        assert responses.get_many(["a", "c", "e", "x", "a"]) == {
+            "a": ["1"],
+            "c": ["4"],
+            "e": ["6"],
+        }
+        assert responses.stats() == {"hits": 4, "misses": 1, "size": 5}
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from lynxius_evals.evaluators.semantic_similarity_eval import SemanticSimilarityEval
+from lynxius_evals.models.eval_model import EvalModel
+
+
+class FakeEmbeddingModel(EvalModel):
+    def __init__(self):
+        self.embedded = []
+
+    def query(self, prompt: str) -> list[str]:
+        return [prompt]
+
+    def embed(self, input: list[str]) -> list[list[float]]:
+        self.embedded.extend(input)
+        return [
+            np.random.default_rng(sum(map(ord, text))).normal(size=8).tolist()
+            for text in input
+        ]
+
+
+class TestSemanticSimilarityEval:
+    """Test the vectorized `SemanticSimilarityEval`."""
+
+    def test_matches_pairwise_cosine_similarity(self):
+        data = [
+            {"reference": f"reference {i}", "output": f"output {i}", "contexts": []}
+            for i in range(20)
+        ]
+        model = FakeEmbeddingModel()
+
+        result = SemanticSimilarityEval(model).evaluate(data)
+
+        for item, record in zip(data, result):
+            vec1, vec2 = map(np.array, model.embed([item["reference"], item["output"]]))
+            expected = np.dot(vec1, vec2) / (
+                np.linalg.norm(vec1) * np.linalg.norm(vec2)
+            )
+            assert record == {
+                **item,
+                "similarity": record["similarity"],
+            }
+            np.testing.assert_allclose(
+                record["similarity"], np.clip(expected, 0.0, 1.0), atol=1e-6
+            )
+
+    def test_empty_batch(self):
+        assert SemanticSimilarityEval(FakeEmbeddingModel()).evaluate([]) == []
+
+    def test_pinned_references_are_not_embedded(self):
+        model = FakeEmbeddingModel()
+        pinned = dict(zip(["ref a", "ref b"], model.embed(["ref a", "ref b"])))
+        model.embedded = []
+        data = [
+            {"reference": "ref a", "output": "out 1", "contexts": []},
+            {"reference": "ref c", "output": "out 2", "contexts": []},
+            {"reference": "ref c", "output": "out 3", "contexts": []},
+        ]
+
+        result = SemanticSimilarityEval(model, pinned).evaluate(data)
+        expected = SemanticSimilarityEval(FakeEmbeddingModel()).evaluate(data)
+
+        assert model.embedded == ["ref c", "out 1", "out 2", "out 3"]
+        for record, expected_record in zip(result, expected):
+            assert record["similarity"] == pytest.approx(expected_record["similarity"])
+
+    def test_similarity_matrix(self):
+        model = FakeEmbeddingModel()
+        eval = SemanticSimilarityEval(model)
+        eval.pin_references(["ref a", "ref b", "ref a"])
+        model.embedded = []
+
+        matrix = eval.similarity_matrix(["out 1", "out 2", "out 3"])
+
+        assert model.embedded == ["out 1", "out 2", "out 3"]
+        assert matrix.shape == (3, 2)
+        for i, output in enumerate(["out 1", "out 2", "out 3"]):
+            pairs = [
+                {"reference": r, "output": output, "contexts": []}
+                for r in ["ref a", "ref b"]
+            ]
+            scores = [r["similarity"] for r in eval.evaluate(pairs)]
+            np.testing.assert_allclose(matrix[i], scores, atol=1e-6)